@@ -1,15 +1,18 @@
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 import os
+from app.services.database import RoutingSession, configure_engine, init_engines
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
 
-def create_app(test_config=None):
-    # Create and configure the app
+def create_app(test_config=None, defer_workers=False):
+    # Create and configure the app. With defer_workers, background threads
+    # are left for app.services.workers.start_all, for servers that fork
+    # after loading the app.
     app = Flask(__name__, instance_relative_config=True)
     
     # Set default configuration
@@ -18,27 +21,86 @@ def create_app(test_config=None):
         SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(app.instance_path, 'safenest.sqlite'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         JWT_SECRET_KEY='jwt-secret-key',
-        JWT_ACCESS_TOKEN_EXPIRES=60*60*24  # 1 day
+        JWT_ACCESS_TOKEN_EXPIRES=60*60*24,  # 1 day
+        NOTIFICATION_SENDER='file',  # 'file', 'smtp' or a dotted import path
+        NOTIFICATION_LOG_PATH=os.path.join(app.instance_path, 'notifications.log'),
+        NOTIFICATION_WORKERS=2,
+        RESPONSE_CACHE_BACKEND='memory',  # 'sqlite' to share across workers
+        RESPONSE_CACHE_PATH=os.path.join(app.instance_path, 'response_cache.sqlite'),
+        ONBOARDING_API_KEY=None,  # enables POST /api/auth/register/batch
+        REGISTER_BATCH_MAX=5000,
+        REGISTER_BATCH_MAX_BYTES=16 * 1024 * 1024,
+        IMPORT_CHUNK_SIZE=500,
+        ADMISSION_STORE='memory',  # 'sqlite' to share rate limits across workers
+        ADMISSION_STORE_PATH=os.path.join(app.instance_path, 'admission.sqlite'),
+        DEFER_BACKGROUND_WORKERS=defer_workers
     )
 
     if test_config is None:
-        # Load the instance config, if it exists, when not testing
+        # Load the instance config, if it exists, when not testing, then
+        # SAFENEST_* environment variables (SAFENEST_SQLALCHEMY_DATABASE_URI=...)
         app.config.from_pyfile('config.py', silent=True)
+        app.config.from_prefixed_env('SAFENEST')
     else:
         # Load the test config if passed in
         app.config.from_mapping(test_config)
 
-    # Ensure the instance folder exists
-    try:
-        os.makedirs(app.instance_path)
-    except OSError:
-        pass
+    # Ensure the instance folder exists; a stat on every boot after the first
+    if not os.path.isdir(app.instance_path):
+        os.makedirs(app.instance_path, exist_ok=True)
 
     # Initialize extensions with app
+    configure_engine(app)
     db.init_app(app)
+    with app.app_context():
+        init_engines(app, db.engine)
     jwt.init_app(app)
     CORS(app)
 
+    # orjson for response bodies when it is installed
+    from app.services.serialization import serialization
+    serialization.init_app(app)
+
+    # Request timers and SQL counters; first, so every request is measured
+    from app.services.metrics import metrics
+    with app.app_context():
+        metrics.init_app(app, engines=[db.engine, app.extensions.get('db_reader')])
+
+    from app.services.revocation import revocation
+    revocation.init_app(app)
+
+    from app.services.passwords import passwords
+    passwords.init_app(app)
+
+    from app.services.notifications import notifications
+    notifications.init_app(app)
+
+    from app.services.locations import locations
+    locations.init_app(app)
+
+    from app.services.alert_stream import alert_stream
+    alert_stream.init_app(app)
+
+    from app.services.alert_archive import alert_archive
+    alert_archive.init_app(app)
+
+    from app.services.user_cache import user_cache
+    user_cache.init_app(app)
+
+    from app.services.response_cache import response_cache
+    response_cache.init_app(app)
+
+    # Runs before every route: rate limits and per-blueprint concurrency
+    # caps, with the alerts blueprint as an unthrottled priority lane
+    from app.services.admission import admission
+    admission.init_app(app)
+
+    from app.services.idempotency import idempotency
+    idempotency.init_app(app)
+
+    from app.services.user_export import user_export
+    user_export.init_app(app)
+
     # Import and register blueprints
     from app.routes import auth, users, alerts, community, classes
     
@@ -47,9 +109,19 @@ def create_app(test_config=None):
     app.register_blueprint(alerts.bp)
     app.register_blueprint(community.bp)
     app.register_blueprint(classes.bp)
+    app.cli.add_command(auth.import_users_command)
+
+    from app.services.migrations import db_command
+    app.cli.add_command(db_command)
 
     @app.route('/api/health')
     def health():
-        return {"status": "healthy"}
+        return {"status": "healthy", "user_cache": user_cache.stats()}
+
+    @app.route('/api/metrics')
+    def prometheus_metrics():
+        if not app.config['METRICS_ENABLED'] or not metrics.allowed():
+            return {"error": "Not found"}, 404
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
     return app
\ No newline at end of file
@@ -0,0 +1,171 @@
+import threading
+from app import db
+from datetime import datetime
+from sqlalchemy import DDL, event
+
+class Alert(db.Model):
+    # The hot table: active alerts and recent history. Older closed alerts are
+    # moved to monthly alert_archive_YYYYMM tables by the archiver, so ids
+    # must never be reused once the newest row has been moved out.
+    __table_args__ = (
+        db.Index('ix_alert_user_created', 'user_id', 'created_at'),
+        {'sqlite_autoincrement': True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    type = db.Column(db.String(30), nullable=False, default='emergency')
+    status = db.Column(db.String(20), nullable=False, default='active')
+    message = db.Column(db.Text, nullable=True)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def location(self):
+        if self.latitude is None or self.longitude is None:
+            return {}
+        return {'lat': self.latitude, 'lng': self.longitude}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'type': self.type,
+            'status': self.status,
+            'message': self.message,
+            'location': self.location(),
+            'created_at': self.created_at.isoformat()
+        }
+
+# R*Tree index over the positions of active alerts. It lives outside
+# db.metadata because create_all can't emit virtual tables; the DDL below
+# creates it alongside the alert table and triggers keep it in step with every
+# write path, including the bulk position updates from the location flusher.
+# An alert leaves it when it is cancelled or resolved, so its size follows
+# the live alerts rather than all of history.
+alert_rtree = db.Table(
+    'alert_rtree', db.MetaData(),
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('min_lat', db.Float),
+    db.Column('max_lat', db.Float),
+    db.Column('min_lng', db.Float),
+    db.Column('max_lng', db.Float)
+)
+
+ALERT_RTREE_DDL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS alert_rtree
+       USING rtree(id, min_lat, max_lat, min_lng, max_lng)""",
+    """CREATE TRIGGER IF NOT EXISTS alert_rtree_insert AFTER INSERT ON alert
+       WHEN new.status = 'active' AND new.latitude IS NOT NULL AND new.longitude IS NOT NULL
+       BEGIN
+           INSERT INTO alert_rtree VALUES
+               (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS alert_rtree_update
+       AFTER UPDATE OF latitude, longitude, status ON alert
+       BEGIN
+           DELETE FROM alert_rtree WHERE id = old.id;
+           INSERT INTO alert_rtree
+               SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+               WHERE new.status = 'active'
+                 AND new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS alert_rtree_delete AFTER DELETE ON alert
+       BEGIN
+           DELETE FROM alert_rtree WHERE id = old.id;
+       END"""
+)
+
+for _statement in ALERT_RTREE_DDL:
+    event.listen(Alert.__table__, 'after_create', DDL(_statement).execute_if(dialect='sqlite'))
+
+# Monthly archive partitions share the alert columns and the history index.
+# They are created on demand by the archiver, so they live in their own
+# MetaData and create_all never sees them.
+archive_metadata = db.MetaData()
+_archive_lock = threading.Lock()
+
+ARCHIVE_PREFIX = 'alert_archive_'
+
+def alert_archive_table(month):
+    # month is 'YYYYMM'
+    name = ARCHIVE_PREFIX + month
+    with _archive_lock:
+        table = archive_metadata.tables.get(name)
+        if table is None:
+            table = db.Table(
+                name, archive_metadata,
+                *(db.Column(column.name, column.type, primary_key=column.primary_key,
+                            nullable=column.nullable)
+                  for column in Alert.__table__.columns),
+                db.Index(f'ix_{name}_user_created', 'user_id', 'created_at')
+            )
+        return table
+
+class AlertArchiveMonth(db.Model):
+    # Which partitions hold each user's alerts, written by the archiver as it
+    # moves them, so history reads only those instead of probing every month
+    __tablename__ = 'alert_archive_month'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(6), primary_key=True)
+
+class NotificationOutbox(db.Model):
+    # One row per (alert, contact). Rows are written in the same transaction
+    # as the alert and drained by the background dispatcher.
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        db.Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id'), nullable=False, index=True)
+    contact_id = db.Column(db.Integer, db.ForeignKey('emergency_contact.id'), nullable=True)
+    channel = db.Column(db.String(10), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), nullable=True, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+class AlertEvent(db.Model):
+    # Append-only log behind GET /api/alerts/<id>/stream. Event ids double as
+    # SSE ids for Last-Event-ID resume, so they must never be reused.
+    __tablename__ = 'alert_event'
+    __table_args__ = (
+        db.Index('ix_alert_event_alert_id', 'alert_id', 'id'),
+        {'sqlite_autoincrement': True}
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id'), nullable=False)
+    type = db.Column(db.String(20), nullable=False)
+    data = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class AlertLocation(db.Model):
+    # Live pings recorded while an alert is active. Written in bulk by the
+    # location flusher, never one row per request.
+    __tablename__ = 'alert_location'
+    __table_args__ = (
+        db.Index('ix_alert_location_alert_recorded', 'alert_id', 'recorded_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    alert_id = db.Column(db.Integer, db.ForeignKey('alert.id'), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    accuracy = db.Column(db.Float, nullable=True)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'lat': self.latitude,
+            'lng': self.longitude,
+            'accuracy': self.accuracy,
+            'recorded_at': self.recorded_at.isoformat()
+        }
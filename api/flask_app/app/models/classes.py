@@ -0,0 +1,237 @@
+from app import db
+from datetime import datetime, time, timedelta
+from sqlalchemy import event
+
+class Instructor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    bio = db.Column(db.Text, nullable=True)
+    specialties = db.Column(db.JSON, nullable=False, default=list)
+    qualifications = db.Column(db.JSON, nullable=False, default=list)
+    image_url = db.Column(db.String(500), nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'specialties': self.specialties,
+            'bio': self.bio,
+            'image_url': self.image_url
+        }
+
+class ClassSeries(db.Model):
+    # A recurring class ("every Tuesday 18:00 for 90 minutes"). Occurrences
+    # are expanded on demand for the requested window and only become Class
+    # rows once someone registers for one.
+    __tablename__ = 'class_series'
+    __table_args__ = (
+        db.Index('ix_class_series_valid', 'valid_from', 'valid_until'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('instructor.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    type = db.Column(db.String(50), nullable=False)
+    level = db.Column(db.String(50), nullable=False)
+    location = db.Column(db.String(200), nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)  # Monday == 0
+    interval_weeks = db.Column(db.Integer, nullable=False, default=1)
+    start_time = db.Column(db.Time, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False)
+    valid_from = db.Column(db.DateTime, nullable=False)
+    valid_until = db.Column(db.DateTime, nullable=True)  # open-ended when null
+    requirements = db.Column(db.JSON, nullable=False, default=list)
+    topics_covered = db.Column(db.JSON, nullable=False, default=list)
+
+    instructor = db.relationship('Instructor')
+
+    def occurrences(self, start, end):
+        # Lazily yields the start of every occurrence overlapping [start, end)
+        # without walking the weeks before the window
+        period = timedelta(weeks=self.interval_weeks)
+        duration = timedelta(minutes=self.duration_minutes)
+        first = datetime.combine(self.valid_from.date(), self.start_time)
+        first += timedelta(days=(self.weekday - first.weekday()) % 7)
+        if first < self.valid_from:
+            first += timedelta(weeks=1)
+
+        skip = max(0, -(-(start - duration - first) // period))
+        current = first + skip * period
+        last = min(end, self.valid_until) if self.valid_until else end
+        while current < last:
+            if current + duration > start:
+                yield current
+            current += period
+
+# No class runs longer than this; listings rely on it to bound the
+# starts_at range they scan
+MAX_CLASS_DURATION = timedelta(hours=24)
+
+OCCURRENCE_FORMAT = '%Y%m%dT%H%M%S'
+
+class Class(db.Model):
+    __tablename__ = 'class'
+    __table_args__ = (
+        db.CheckConstraint('registered <= capacity', name='ck_class_capacity'),
+        db.Index('ix_class_starts_ends', 'starts_at', 'ends_at'),
+        db.UniqueConstraint('series_id', 'starts_at', name='uq_class_series_occurrence'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    series_id = db.Column(db.Integer, db.ForeignKey('class_series.id'), nullable=True)
+    instructor_id = db.Column(db.Integer, db.ForeignKey('instructor.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    type = db.Column(db.String(50), nullable=False)
+    level = db.Column(db.String(50), nullable=False)
+    location = db.Column(db.String(200), nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+    # Only ever changed by conditional UPDATEs (see routes/classes.py) so it
+    # can't exceed capacity under concurrent sign-ups
+    registered = db.Column(db.Integer, nullable=False, default=0)
+    starts_at = db.Column(db.DateTime, nullable=False)
+    ends_at = db.Column(db.DateTime, nullable=False)
+    requirements = db.Column(db.JSON, nullable=False, default=list)
+    topics_covered = db.Column(db.JSON, nullable=False, default=list)
+
+    instructor = db.relationship('Instructor')
+
+    @classmethod
+    def from_series(cls, series, starts_at):
+        return cls(
+            series_id=series.id,
+            instructor_id=series.instructor_id,
+            title=series.title,
+            description=series.description,
+            type=series.type,
+            level=series.level,
+            location=series.location,
+            capacity=series.capacity,
+            registered=0,
+            starts_at=starts_at,
+            ends_at=starts_at + timedelta(minutes=series.duration_minutes),
+            requirements=series.requirements,
+            topics_covered=series.topics_covered
+        )
+
+    @property
+    def occurrence_id(self):
+        # Stable before and after the occurrence is materialized, so listings
+        # can address occurrences that don't have an id yet
+        if self.series_id is None:
+            return None
+        return f"{self.series_id}-{self.starts_at.strftime(OCCURRENCE_FORMAT)}"
+
+    def to_dict(self, instructor_name=None):
+        return {
+            'id': self.id,
+            'series_id': self.series_id,
+            'occurrence_id': self.occurrence_id,
+            'starts_at': self.starts_at.isoformat(),
+            'title': self.title,
+            'description': self.description,
+            'instructor': instructor_name,
+            'type': self.type,
+            'level': self.level,
+            'capacity': self.capacity,
+            'registered': self.registered,
+            'date': self.starts_at.strftime('%Y-%m-%d'),
+            'time': f"{self.starts_at:%H:%M}-{self.ends_at:%H:%M}",
+            'location': self.location
+        }
+
+class Registration(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('class_id', 'user_id', name='uq_registration_class_user'),
+        db.Index('ix_registration_waitlist', 'class_id', 'status', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey('class.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)  # confirmed | waitlisted
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+DEFAULT_INSTRUCTORS = [
+    {
+        'id': 1,
+        'name': 'John Doe',
+        'specialties': ['Self-defense', 'Krav Maga'],
+        'qualifications': ['Black belt in Krav Maga', 'Certified Personal Trainer'],
+        'bio': 'Certified self-defense instructor with 10+ years of experience',
+        'image_url': 'https://example.com/images/john-doe.jpg'
+    },
+    {
+        'id': 2,
+        'name': 'Jane Smith',
+        'specialties': ["Women's self-defense", 'Safety awareness'],
+        'qualifications': [],
+        'bio': "Specializes in women's safety and self-defense techniques",
+        'image_url': 'https://example.com/images/jane-smith.jpg'
+    }
+]
+
+@event.listens_for(Instructor.__table__, 'after_create')
+def seed_default_instructors(target, connection, **kw):
+    connection.execute(target.insert(), DEFAULT_INSTRUCTORS)
+
+@event.listens_for(ClassSeries.__table__, 'after_create')
+def seed_default_series(target, connection, **kw):
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    connection.execute(target.insert(), [
+        {
+            'instructor_id': 1,
+            'title': 'Weekly Self-Defense Practice',
+            'description': 'Drill the fundamentals every week with a small group',
+            'type': 'self-defense',
+            'level': 'beginner',
+            'location': 'Main Studio, 123 Safety St',
+            'capacity': 20,
+            'weekday': 1,
+            'interval_weeks': 1,
+            'start_time': time(18, 0),
+            'duration_minutes': 90,
+            'valid_from': today,
+            'valid_until': None,
+            'requirements': ['Comfortable clothing', 'Water bottle'],
+            'topics_covered': []
+        }
+    ])
+
+@event.listens_for(Class.__table__, 'after_create')
+def seed_default_classes(target, connection, **kw):
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    tomorrow = today + timedelta(days=1, hours=18)
+    next_week = today + timedelta(days=7, hours=10)
+    connection.execute(target.insert(), [
+        {
+            'instructor_id': 1,
+            'title': 'Basic Self-Defense',
+            'description': 'Learn fundamental self-defense techniques including basic strikes, blocks, and escapes. This class is perfect for beginners with no prior experience.',
+            'type': 'self-defense',
+            'level': 'beginner',
+            'capacity': 20,
+            'registered': 0,
+            'starts_at': tomorrow,
+            'ends_at': tomorrow + timedelta(minutes=90),
+            'location': 'Main Studio, 123 Safety St',
+            'requirements': ['Comfortable clothing', 'Water bottle'],
+            'topics_covered': ['Basic stance', 'Blocking techniques', 'Escape methods']
+        },
+        {
+            'instructor_id': 2,
+            'title': "Women's Safety Workshop",
+            'description': 'Specialized safety techniques for women',
+            'type': 'workshop',
+            'level': 'all-levels',
+            'capacity': 15,
+            'registered': 0,
+            'starts_at': next_week,
+            'ends_at': next_week + timedelta(hours=2),
+            'location': 'Community Center, 456 Security Ave',
+            'requirements': [],
+            'topics_covered': []
+        }
+    ])
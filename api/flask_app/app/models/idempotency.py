@@ -0,0 +1,17 @@
+from app import db
+from datetime import datetime
+
+class IdempotencyKey(db.Model):
+    # One row per (user, route, Idempotency-Key). Claimed as 'pending' before
+    # the request runs and completed with the response to replay; rows are
+    # pruned once expires_at passes.
+    __tablename__ = 'idempotency_key'
+
+    key = db.Column(db.String(400), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.LargeBinary, nullable=True)
+    response_mimetype = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
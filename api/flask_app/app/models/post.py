@@ -0,0 +1,62 @@
+from app import db
+from datetime import datetime
+from app.services.serialization import Schema
+
+class Post(db.Model):
+    # Feed pages are read newest-first by keyset on (created_at, id), either
+    # across all posts or within one category
+    __table_args__ = (
+        db.Index('ix_post_created_id', 'created_at', 'id'),
+        db.Index('ix_post_category_created_id', 'category', 'created_at', 'id'),
+        db.Index('ix_post_hot_id', 'hot_score', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    category = db.Column(db.String(50), nullable=False, default='general')
+    likes = db.Column(db.Integer, nullable=False, default=0)
+    comments_count = db.Column(db.Integer, nullable=False, default=0)
+    hot_score = db.Column(db.Float, nullable=False, default=0.0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self, author=None):
+        data = post_schema.dump(self)
+        if author is not None:
+            data['author'] = author
+        return data
+
+post_schema = Schema(
+    Post, ('id', 'title', 'content', 'user_id', 'created_at', 'likes', 'comments_count', 'category'),
+    rename={'user_id': 'author_id'}, formats={'created_at': datetime.isoformat}
+)
+
+class PostLike(db.Model):
+    __tablename__ = 'post_like'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class Comment(db.Model):
+    __table_args__ = (
+        db.Index('ix_comment_post_created_id', 'post_id', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self, author=None):
+        data = comment_schema.dump(self)
+        if author is not None:
+            data['author'] = author
+        return data
+
+comment_schema = Schema(
+    Comment, ('id', 'post_id', 'content', 'user_id', 'created_at'),
+    rename={'user_id': 'author_id'}, formats={'created_at': datetime.isoformat}
+)
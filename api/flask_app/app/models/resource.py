@@ -0,0 +1,34 @@
+from app import db
+from sqlalchemy import event
+from app.services.serialization import Schema
+
+class Resource(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    url = db.Column(db.String(500), nullable=False)
+    category = db.Column(db.String(50), nullable=False, index=True)
+
+    def to_dict(self):
+        return resource_schema.dump(self)
+
+resource_schema = Schema(Resource, ('id', 'title', 'description', 'url', 'category'))
+
+DEFAULT_RESOURCES = [
+    {
+        'title': 'Emergency Services Guide',
+        'description': 'A comprehensive guide to emergency services in your area',
+        'url': 'https://example.com/resources/emergency-guide',
+        'category': 'guides'
+    },
+    {
+        'title': 'Safety Equipment Recommendations',
+        'description': 'Recommended safety equipment for personal protection',
+        'url': 'https://example.com/resources/safety-equipment',
+        'category': 'equipment'
+    }
+]
+
+@event.listens_for(Resource.__table__, 'after_create')
+def seed_default_resources(target, connection, **kw):
+    connection.execute(target.insert(), DEFAULT_RESOURCES)
@@ -0,0 +1,16 @@
+from app import db
+from datetime import datetime
+
+class RevokedToken(db.Model):
+    __tablename__ = 'revoked_token'
+    # Pruning can empty the table, and a plain INTEGER PRIMARY KEY would then
+    # hand out ids below what other workers have already seen
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    # Monotonic id doubles as the denylist version: workers fetch only rows
+    # with an id above the last one they have seen
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
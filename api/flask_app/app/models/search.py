@@ -0,0 +1,66 @@
+from app import db
+from sqlalchemy import DDL, event
+from app.models.post import Post
+from app.models.resource import Resource
+
+# FTS5 index shared by posts and resources. Rowids are interleaved (post id*2,
+# resource id*2+1) so the triggers can find a document by rowid instead of
+# scanning an unindexed kind column. The table is kept current by triggers on
+# the source tables, so every write path updates it incrementally.
+KIND_POST = 0
+KIND_RESOURCE = 1
+
+community_search = db.Table(
+    'community_search', db.MetaData(),
+    db.Column('rowid', db.Integer, primary_key=True),
+    db.Column('title', db.Text),
+    db.Column('body', db.Text)
+)
+
+CREATE_INDEX = """CREATE VIRTUAL TABLE IF NOT EXISTS community_search
+    USING fts5(title, body, tokenize = 'porter unicode61', prefix = '2 3')"""
+
+def _triggers(table, title, body, kind):
+    rowid = f"{{row}}.id * 2 + {kind}"
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO community_search(rowid, title, body)
+                VALUES ({rowid.format(row='new')}, new.{title}, new.{body});
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_update
+            AFTER UPDATE OF {title}, {body} ON {table}
+            BEGIN
+                UPDATE community_search SET title = new.{title}, body = new.{body}
+                WHERE rowid = {rowid.format(row='old')};
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM community_search WHERE rowid = {rowid.format(row='old')};
+            END"""
+    ]
+
+# Trigger DDL per source table
+SEARCH_TRIGGERS = {
+    'post': _triggers('post', 'title', 'content', KIND_POST),
+    'resource': _triggers('resource', 'title', 'description', KIND_RESOURCE)
+}
+
+for _table in (Post.__table__, Resource.__table__):
+    # Prepended (hence reversed) so the index and triggers exist before any
+    # other after_create hook, such as the default resource seed, adds rows
+    for _statement in reversed([CREATE_INDEX] + SEARCH_TRIGGERS[_table.name]):
+        event.listen(_table, 'after_create', DDL(_statement).execute_if(dialect='sqlite'),
+                     insert=True)
+
+def rebuild_search_index(connection):
+    connection.exec_driver_sql(CREATE_INDEX)
+    connection.exec_driver_sql("DELETE FROM community_search")
+    connection.exec_driver_sql(
+        f"INSERT INTO community_search(rowid, title, body) "
+        f"SELECT id * 2 + {KIND_POST}, title, content FROM post"
+    )
+    connection.exec_driver_sql(
+        f"INSERT INTO community_search(rowid, title, body) "
+        f"SELECT id * 2 + {KIND_RESOURCE}, title, description FROM resource"
+    )
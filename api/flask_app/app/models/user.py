@@ -1,6 +1,9 @@
 from app import db
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from app.services.passwords import passwords
+from app.services.serialization import Schema
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -11,20 +14,31 @@ class User(db.Model):
     phone = db.Column(db.String(20), nullable=False)
     address = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on every update (see bump_version); lets per-process profile
+    # caches detect writes made by other workers
+    version = db.Column(db.Integer, nullable=False, default=1)
     
+    # Both run in the bounded hashing pool and may raise HashingBusy
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
         
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash)
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'email': self.email,
-            'username': self.username,
-            'full_name': self.full_name,
-            'phone': self.phone,
-            'address': self.address,
-            'created_at': self.created_at.isoformat()
-        }
\ No newline at end of file
+        return user_schema.dump(self)
+
+@event.listens_for(User, 'before_update')
+def bump_version(mapper, connection, target):
+    # Incremented in the UPDATE itself rather than used as an optimistic
+    # lock: concurrent updates both land and both bump it
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = User.version + 1
+
+user_schema = Schema(
+    User, ('id', 'email', 'username', 'full_name', 'phone', 'address', 'created_at'),
+    formats={'created_at': datetime.isoformat}
+)
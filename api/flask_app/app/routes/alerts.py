@@ -1,82 +1,352 @@
-from flask import Blueprint, jsonify, request
-from datetime import datetime
+import math
+import click
+from flask import Blueprint, current_app, jsonify, request
 from app import db
-from app.models.user import User
+from app.services.database import read_only
+from app.services.idempotency import idempotency
+from app.models.alert import Alert, AlertLocation, alert_rtree
 from app.models.emergency_contact import EmergencyContact
+from app.models.user import User
+from app.services.notifications import notifications, enqueue_alert_notifications
+from app.services.locations import locations, parse_ping
+from app.services.geo import haversine, bounding_boxes, parse_point
+from app.services.user_cache import user_cache
+from app.services.alert_archive import alert_archive, history_dict
+from app.services.alert_stream import StreamFull, alert_stream, record_event
+from app.services.alert_stream_server import StreamServer
+from app.services.pagination import encode_cursor
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from datetime import datetime
+from sqlalchemy import and_, or_, update
 
 bp = Blueprint('alerts', __name__, url_prefix='/api/alerts')
 
-# In a real application, you would define an Alert model
-# For now, we'll simulate alert functionality
-
 @bp.route('/sos', methods=['POST'])
 @jwt_required()
+@idempotency.idempotent
 def create_sos():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    profile = user_cache.get_profile(get_jwt_identity())
     
-    if not user:
+    if not profile:
         return jsonify({"error": "User not found"}), 404
     
     data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     alert_type = data.get('type', 'emergency')
-    location = data.get('location', {})
+    location = data.get('location') or {}
     message = data.get('message', '')
     
-    # In a real application, you would:
-    # 1. Create an alert record in the database
-    # 2. Notify emergency contacts
-    # 3. Potentially integrate with emergency services
+    if not isinstance(alert_type, str) or not 0 < len(alert_type) <= 30:
+        return jsonify({"error": "type must be a string of at most 30 characters"}), 400
+    if message is not None and not isinstance(message, str):
+        return jsonify({"error": "message must be a string"}), 400
+    # Location is optional, but when given it must be a real point: it goes
+    # into the R*Tree that nearby searches read
+    if not isinstance(location, dict):
+        return jsonify({"error": "location must be an object with lat and lng"}), 400
+    latitude = longitude = None
+    if location.get('lat') is not None or location.get('lng') is not None:
+        try:
+            latitude, longitude = parse_point(location.get('lat'), location.get('lng'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "location needs numeric lat (-90..90) and lng (-180..180)"}), 400
     
-    # Get user's emergency contacts
-    contacts = EmergencyContact.query.filter_by(user_id=user_id).all()
+    alert = Alert(
+        user_id=profile['id'],
+        type=alert_type,
+        message=message,
+        latitude=latitude,
+        longitude=longitude
+    )
+    db.session.add(alert)
+    db.session.flush()
     
-    # Simulate alert processing
-    response = {
+    # Alert and outbox rows commit together; delivery happens in the
+    # background dispatcher so contact count never shows up in SOS latency
+    queued = enqueue_alert_notifications(alert)
+    record_event(alert.id, 'created', alert.to_dict())
+    response = idempotency.record((jsonify({
         "success": True,
         "message": f"SOS alert ({alert_type}) created successfully",
-        "timestamp": datetime.utcnow().isoformat(),
-        "location": location,
-        "user": user.to_dict(),
-        "contacts_notified": len(contacts)
-    }
+        "alert_id": alert.id,
+        "timestamp": alert.created_at.isoformat(),
+        "location": alert.location(),
+        "user": profile,
+        "contacts_notified": queued
+    }), 201))
+    db.session.commit()
+    notifications.wake()
+    alert_stream.wake()
+    locations.track(alert.id, profile['id'])
     
-    return jsonify(response), 201
+    return response
 
-@bp.route('/history', methods=['GET'])
+@bp.route('/<int:alert_id>/locations', methods=['POST'])
 @jwt_required()
-def get_alert_history():
-    user_id = get_jwt_identity()
+def add_locations(alert_id):
+    user_id = int(get_jwt_identity())
     
-    # In a real application, you would fetch alerts from database
-    # For now, return a sample response
+    # Ownership is cached with the live track, so steady-state pings never
+    # touch the database; the flusher writes them in bulk
+    owner = locations.owner(alert_id)
+    if owner is None:
+        alert = Alert.query.get(alert_id)
+        if not alert or alert.status != 'active':
+            return jsonify({"error": "Active alert not found"}), 404
+        owner = alert.user_id
+        locations.track(alert_id, owner)
     
-    sample_alerts = [
-        {
-            "id": 1,
-            "type": "emergency",
-            "status": "resolved",
-            "created_at": "2023-05-01T14:30:00Z",
-            "location": {"lat": 37.7749, "lng": -122.4194}
-        },
+    if owner != user_id:
+        return jsonify({"error": "Active alert not found"}), 404
+    
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    pings = data.get('pings', [data])
+    if not isinstance(pings, list):
+        return jsonify({"error": "pings must be a list"}), 400
+    try:
+        pings = [parse_ping(p) for p in pings]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Each ping needs numeric lat and lng, and an ISO 8601 timestamp if any"}), 400
+    
+    # Refused if the alert was cancelled meanwhile and its track dropped
+    if not locations.append(alert_id, pings):
+        return jsonify({"error": "Active alert not found"}), 404
+    
+    return jsonify({"accepted": len(pings)}), 202
+
+@bp.route('/<int:alert_id>/location', methods=['GET'])
+@read_only
+@jwt_required()
+def get_latest_location(alert_id):
+    user_id = int(get_jwt_identity())
+    
+    owner = locations.owner(alert_id)
+    if owner is None:
+        # Not tracked in this process (e.g. after a restart): fall back to
+        # the last flushed ping
+        alert = Alert.query.get(alert_id)
+        if not alert or alert.user_id != user_id:
+            return jsonify({"error": "Alert not found"}), 404
+        last = (AlertLocation.query.filter_by(alert_id=alert_id)
+                .order_by(AlertLocation.recorded_at.desc()).first())
+        return jsonify({
+            "alert_id": alert_id,
+            "location": last.to_dict() if last else None
+        }), 200
+    
+    if owner != user_id:
+        return jsonify({"error": "Alert not found"}), 404
+    
+    ping = locations.latest(alert_id)
+    if ping is None:
+        return jsonify({"alert_id": alert_id, "location": None}), 200
+    
+    return jsonify({
+        "alert_id": alert_id,
+        "location": {
+            "lat": ping['latitude'],
+            "lng": ping['longitude'],
+            "accuracy": ping['accuracy'],
+            "recorded_at": ping['recorded_at'].isoformat()
+        }
+    }), 200
+
+@bp.route('/nearby', methods=['GET'])
+@read_only
+@jwt_required()
+def get_nearby_alerts():
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius = request.args.get('radius', 1000, type=float)
+    limit = request.args.get('limit', 50, type=int)
+    
+    # float() takes 'nan' and 'inf', which fail every comparison below
+    if lat is None or lng is None or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({"error": "lat and lng are required"}), 400
+    if radius is None or not 0 < radius < math.inf:
+        return jsonify({"error": "radius must be a positive number of meters"}), 400
+    if limit is None or limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    # Only active alerts are indexed by position
+    if request.args.get('status', 'active') != 'active':
+        return jsonify({"error": "Only active alerts can be searched by location"}), 400
+    radius = min(radius, 50000)
+    limit = min(limit, 200)
+    
+    # Bounding-box probe on the R*Tree, then an exact haversine refine over
+    # the handful of candidates it returns
+    boxes = or_(*(
+        and_(alert_rtree.c.max_lat >= south, alert_rtree.c.min_lat <= north,
+             alert_rtree.c.max_lng >= west, alert_rtree.c.min_lng <= east)
+        for south, north, west, east in bounding_boxes(lat, lng, radius)
+    ))
+    # Plain column tuples: the refine step can discard most candidates, so
+    # don't pay for ORM instances that are thrown away
+    candidates = (
+        db.session.query(Alert.id, Alert.type, Alert.status, Alert.message,
+                         Alert.latitude, Alert.longitude, Alert.created_at)
+        .join(alert_rtree, alert_rtree.c.id == Alert.id)
+        .filter(boxes)
+    )
+    
+    nearby = []
+    for row in candidates:
+        distance = haversine(lat, lng, row.latitude, row.longitude)
+        if distance <= radius:
+            nearby.append((distance, row))
+    nearby.sort(key=lambda pair: pair[0])
+    
+    return jsonify([
         {
-            "id": 2,
-            "type": "medical",
-            "status": "resolved",
-            "created_at": "2023-04-15T09:45:00Z",
-            "location": {"lat": 37.7749, "lng": -122.4194}
+            "id": row.id,
+            "type": row.type,
+            "status": row.status,
+            "message": row.message,
+            "location": {"lat": row.latitude, "lng": row.longitude},
+            "created_at": row.created_at.isoformat(),
+            "distance_m": round(distance, 1)
         }
-    ]
+        for distance, row in nearby[:limit]
+    ]), 200
+
+@bp.route('/history', methods=['GET'])
+@read_only
+@jwt_required()
+def get_alert_history():
+    # Optional query parameters: cursor, limit
+    user_id = int(get_jwt_identity())
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    cursor = request.args.get('cursor')
+    
+    try:
+        rows, has_more = alert_archive.history(user_id, cursor, limit)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
     
-    return jsonify(sample_alerts), 200
+    return jsonify({
+        "alerts": [history_dict(row) for row in rows],
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }), 200
 
 @bp.route('/<int:alert_id>/cancel', methods=['POST'])
 @jwt_required()
 def cancel_alert(alert_id):
-    # In a real application, you would update the alert status in the database
+    user_id = int(get_jwt_identity())
+    
+    # Write out pings buffered so far while the alert is still active; once
+    # it's cancelled the flusher discards them. Best effort: a failed flush
+    # mustn't fail the cancel.
+    try:
+        locations.flush()
+    except Exception:
+        current_app.logger.exception("Location flush before cancelling alert %s failed", alert_id)
+    
+    # Conditional transition: only the owner can cancel, and only while the
+    # alert is still active, so concurrent cancels can't both succeed
+    cancelled = db.session.execute(
+        update(Alert)
+        .where(Alert.id == alert_id, Alert.user_id == user_id, Alert.status == 'active')
+        .values(status='cancelled', updated_at=datetime.utcnow())
+        .returning(Alert.id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if cancelled is not None:
+        record_event(alert_id, 'cancelled', {'status': 'cancelled'})
+    db.session.commit()
+    
+    if cancelled is None:
+        alert = Alert.query.get(alert_id)
+        if not alert or alert.user_id != user_id:
+            return jsonify({"error": "Alert not found"}), 404
+        return jsonify({"error": f"Alert is already {alert.status}"}), 409
+    
+    locations.forget(alert_id)
+    alert_stream.wake()
     
     return jsonify({
         "success": True,
         "message": f"Alert {alert_id} cancelled successfully"
-    }), 200
\ No newline at end of file
+    }), 200
+
+def can_watch(alert, user_id):
+    # The owner, or a user listed among the owner's emergency contacts
+    if alert.user_id == user_id:
+        return True
+    viewer = db.session.get(User, user_id)
+    if viewer is None:
+        return False
+    return db.session.query(EmergencyContact.id).filter(
+        EmergencyContact.user_id == alert.user_id,
+        or_(EmergencyContact.email == viewer.email, EmergencyContact.phone == viewer.phone)
+    ).first() is not None
+
+@bp.route('/<int:alert_id>/stream', methods=['GET'])
+@read_only
+@jwt_required()
+def stream_alert(alert_id):
+    # Server-sent events: the stored log after Last-Event-ID, then live
+    # events, with heartbeats while idle. EventSource can't set headers on
+    # its first request, so ?last_event_id= is accepted too.
+    user_id = int(get_jwt_identity())
+    alert = Alert.query.get(alert_id)
+    
+    if not alert or not can_watch(alert, user_id):
+        return jsonify({"error": "Alert not found"}), 404
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+    
+    try:
+        return alert_stream.stream(alert_id, last_event_id)
+    except StreamFull:
+        response = jsonify({"error": "Too many open streams, please retry shortly"})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+@bp.route('/<int:alert_id>/acknowledge', methods=['POST'])
+@jwt_required()
+def acknowledge_alert(alert_id):
+    # A contact letting the sender know help is on the way
+    user_id = int(get_jwt_identity())
+    alert = Alert.query.get(alert_id)
+    
+    if not alert or alert.user_id == user_id or not can_watch(alert, user_id):
+        return jsonify({"error": "Alert not found"}), 404
+    if alert.status != 'active':
+        return jsonify({"error": f"Alert is already {alert.status}"}), 409
+    
+    profile = user_cache.get_profile(user_id)
+    record_event(alert_id, 'acknowledged', {
+        "user_id": user_id,
+        "name": profile['full_name'] if profile else None,
+        "message": (request.get_json(silent=True) or {}).get('message', '')
+    })
+    db.session.commit()
+    alert_stream.wake()
+    
+    return jsonify({"success": True}), 201
+
+@bp.cli.command('serve-streams')
+@click.option('--host', default='0.0.0.0')
+@click.option('--port', type=int, default=5001)
+def serve_streams_command(host, port):
+    """Serve alert event streams from an asyncio event loop."""
+    StreamServer(current_app._get_current_object()).run(host, port)
+
+@bp.cli.command('compact')
+def compact_command():
+    """Move closed alerts past the archive cutoff into monthly archive tables."""
+    moved = alert_archive.compact()
+    print(f"Archived {moved} alerts")
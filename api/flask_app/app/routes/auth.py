@@ -1,8 +1,23 @@
-from flask import Blueprint, request, jsonify
+import hmac
+import json
+
+import click
+from flask import Blueprint, current_app, request, jsonify
+from flask.cli import with_appcontext
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
 from app import db, jwt
+from app.services.database import read_only
+from app.models.emergency_contact import EmergencyContact
 from app.models.user import User
+from app.services.onboarding import (
+    conflict_error, contact_rows, import_users, read_ndjson, validate
+)
+from app.services.user_cache import user_cache
+from app.services.revocation import revocation
 from flask_jwt_extended import (
-    create_access_token, jwt_required, get_jwt_identity
+    create_access_token, jwt_required, get_jwt, get_jwt_identity
 )
 
 bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -11,14 +26,11 @@ bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 def register():
     data = request.json
     
-    # Check if username or email already exists
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({"error": "Email already registered"}), 409
+    error = validate(data)
+    if error:
+        return jsonify({"error": error}), 400
     
-    if User.query.filter_by(username=data['username']).first():
-        return jsonify({"error": "Username already taken"}), 409
-    
-    # Create new user
+    # Hash before touching the database so the transaction stays short
     user = User(
         email=data['email'],
         username=data['username'],
@@ -28,39 +40,71 @@ def register():
     )
     user.set_password(data['password'])
     
-    db.session.add(user)
-    db.session.commit()
-    
-    # Handle additional user metadata if provided
-    if 'meta' in data:
-        meta = data['meta']
-        
-        # Handle emergency contacts
-        if 'emergency_contacts' in meta:
-            try:
-                from app.models.emergency_contact import EmergencyContact
-                for contact_data in meta['emergency_contacts']:
-                    contact = EmergencyContact(
-                        user_id=user.id,
-                        name=contact_data['name'],
-                        relationship=contact_data['relationship'],
-                        phone=contact_data['phone']
-                    )
-                    db.session.add(contact)
-            except ImportError:
-                # Log that EmergencyContact model couldn't be imported
-                print("Warning: EmergencyContact model not available")
-        
-        # Additional metadata could be stored in a separate profile table
-        # or user_meta table depending on your schema design
-        
+    # User and emergency contacts go in one transaction; the unique
+    # constraints on email and username reject duplicates, so there is no
+    # check-then-insert race
+    try:
+        db.session.add(user)
+        db.session.flush()
+        db.session.add_all(
+            EmergencyContact(**row) for row in contact_rows(data, user.id)
+        )
         db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        message = conflict_error(e)
+        if message is None:
+            raise
+        return jsonify({"error": message}), 409
     
     return jsonify({"message": "User registered successfully"}), 201
 
+@bp.route('/register/batch', methods=['POST'])
+def register_batch():
+    # Organisation onboarding: accepts {"users": [...]} or an NDJSON body of
+    # register payloads and reports per-record failures by position
+    key = current_app.config['ONBOARDING_API_KEY']
+    supplied = request.headers.get('X-Onboarding-Key', '')
+    if not key or not hmac.compare_digest(supplied, key):
+        return jsonify({"error": "Batch registration is not enabled for this key"}), 403
+    
+    max_users = current_app.config['REGISTER_BATCH_MAX']
+    too_large = jsonify({"error": f"At most {max_users} users per batch"}), 413
+    
+    # This route's own body limit (MAX_CONTENT_LENGTH is app-wide): a larger
+    # Content-Length is refused before reading, and a chunked body is cut off
+    # once it passes the limit. NDJSON stops at the first record over the cap.
+    try:
+        stream = get_input_stream(request.environ,
+                                  max_content_length=current_app.config['REGISTER_BATCH_MAX_BYTES'])
+        if request.mimetype == 'application/x-ndjson':
+            records = []
+            for record in read_ndjson(stream):
+                records.append(record)
+                if len(records) > max_users:
+                    return too_large
+        else:
+            try:
+                payload = json.loads(stream.read()) if request.is_json else None
+            except ValueError:
+                payload = None
+            records = payload.get('users') if isinstance(payload, dict) else None
+            if not isinstance(records, list):
+                return jsonify({"error": "Expected a list of users"}), 400
+            if len(records) > max_users:
+                return too_large
+    except RequestEntityTooLarge:
+        return too_large
+    
+    summary = import_users(records, chunk_size=current_app.config['IMPORT_CHUNK_SIZE'])
+    
+    return jsonify(summary), 200
+
 @bp.route('/login', methods=['POST'])
 def login():
     data = request.json
+    if not isinstance(data, dict) or not all(isinstance(data.get(f), str) for f in ('email', 'password')):
+        return jsonify({"error": "email and password must be strings"}), 400
     
     # Find user by email
     user = User.query.filter_by(email=data['email']).first()
@@ -68,31 +112,55 @@ def login():
     if not user or not user.check_password(data['password']):
         return jsonify({"error": "Invalid credentials"}), 401
     
+    # Upgrade hashes made with older KDF parameters while we have the
+    # plaintext; the user never notices
+    if user.password_needs_rehash():
+        user.set_password(data['password'])
+        db.session.commit()
+    
     # Create access token
     access_token = create_access_token(identity=str(user.id))
     
     return jsonify({
         "access_token": access_token,
-        "user": user.to_dict()
+        "user": user_cache.put(user)
     }), 200
 
 @bp.route('/logout', methods=['POST'])
 @jwt_required()
 def logout():
-    # In a production environment, you would invalidate the token here
-    # by adding it to a blocklist/deny list or using a revocation mechanism
-    # For now, we'll just return a successful response
-    # as the actual logout is handled by the client removing the token
+    # Persist the token's jti until it would have expired anyway; every
+    # worker picks it up on its next denylist poll
+    revocation.revoke(get_jwt())
     
     return jsonify({"message": "Logged out successfully"}), 200
 
 @bp.route('/me', methods=['GET'])
+@read_only
 @jwt_required()
 def get_current_user():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    profile = user_cache.get_profile(get_jwt_identity())
     
-    if not user:
+    if not profile:
         return jsonify({"error": "User not found"}), 404
     
-    return jsonify(user.to_dict()), 200
\ No newline at end of file
+    return jsonify(profile), 200
+
+@click.command('import-users')
+@click.argument('path', type=click.File('rb'))
+@click.option('--chunk-size', type=int, default=None, help='Users per transaction.')
+@with_appcontext
+def import_users_command(path, chunk_size):
+    """Bulk-create users and emergency contacts from a JSON lines file."""
+    def report(summary):
+        click.echo(f"{summary['processed']} processed, {summary['created']} created, "
+                   f"{len(summary['failed'])} failed", err=True)
+    
+    summary = import_users(
+        read_ndjson(path),
+        chunk_size=chunk_size or current_app.config['IMPORT_CHUNK_SIZE'],
+        progress=report
+    )
+    for failure in summary['failed']:
+        click.echo(f"line {failure['index'] + 1}: {failure['error']}")
+    click.echo(f"Imported {summary['created']} of {summary['processed']} users")
@@ -1,150 +1,265 @@
+import heapq
 from flask import Blueprint, jsonify, request
 from app import db
+from app.services.database import read_only
+from app.models.classes import MAX_CLASS_DURATION, OCCURRENCE_FORMAT, Class, ClassSeries, Instructor, Registration
+from app.services.response_cache import response_cache
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 
 bp = Blueprint('classes', __name__, url_prefix='/api/classes')
 
-# In a real application, you would define Class and Registration models
-# For now, we'll simulate class functionality
+MAX_WINDOW = timedelta(days=92)
+
+def parse_datetime(value):
+    # Stored times are naive UTC; an explicit offset is converted, not dropped
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def parse_occurrence_id(occurrence_id):
+    # "<series id>-<start as YYYYMMDDTHHMMSS>", see Class.occurrence_id
+    series_id, _, starts_at = occurrence_id.partition('-')
+    return int(series_id), datetime.strptime(starts_at, OCCURRENCE_FORMAT)
+
+def series_occurrence_dicts(series, start, end, materialized):
+    # Generator over one series' occurrences in the window; occurrences that
+    # already have a Class row (someone registered) are reported from the row
+    for starts_at in series.occurrences(start, end):
+        if (series.id, starts_at) in materialized:
+            continue
+        cls = Class.from_series(series, starts_at)
+        yield starts_at, cls.to_dict(series.instructor.name)
 
 @bp.route('/', methods=['GET'])
+@read_only
+@response_cache.cached(ttl=60, depends_on=(Class, ClassSeries, Instructor))
 def get_classes():
-    # In a real application, fetch classes from database
-    # Optional query parameters: type, level, date
-    
+    # Optional query parameters: from, to (ISO dates), type, level
     class_type = request.args.get('type')
     level = request.args.get('level')
     
-    # Generate sample classes
-    tomorrow = datetime.now() + timedelta(days=1)
-    next_week = datetime.now() + timedelta(days=7)
+    try:
+        start = parse_datetime(request.args['from']) if 'from' in request.args else \
+            datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        end = parse_datetime(request.args['to']) if 'to' in request.args else start + timedelta(days=7)
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO dates"}), 400
     
-    sample_classes = [
-        {
-            "id": 1,
-            "title": "Basic Self-Defense",
-            "description": "Learn fundamental self-defense techniques",
-            "instructor": "John Doe",
-            "type": "self-defense",
-            "level": "beginner",
-            "capacity": 20,
-            "registered": 12,
-            "date": tomorrow.strftime("%Y-%m-%d"),
-            "time": "18:00-19:30",
-            "location": "Main Studio, 123 Safety St"
-        },
-        {
-            "id": 2,
-            "title": "Women's Safety Workshop",
-            "description": "Specialized safety techniques for women",
-            "instructor": "Jane Smith",
-            "type": "workshop",
-            "level": "all-levels",
-            "capacity": 15,
-            "registered": 8,
-            "date": next_week.strftime("%Y-%m-%d"),
-            "time": "10:00-12:00",
-            "location": "Community Center, 456 Security Ave"
-        }
-    ]
+    if end <= start or end - start > MAX_WINDOW:
+        return jsonify({"error": "to must be after from and at most 92 days later"}), 400
     
-    # Apply filters if provided
-    filtered_classes = sample_classes
+    # Concrete classes: a starts_at range on ix_class_starts_ends, closed
+    # below by the longest a class can run so past classes aren't scanned
+    classes = (Class.query
+               .options(db.joinedload(Class.instructor))
+               .filter(Class.starts_at > start - MAX_CLASS_DURATION, Class.starts_at < end,
+                       Class.ends_at > start))
+    # Recurring definitions active in the window: ix_class_series_valid
+    series = (ClassSeries.query
+              .options(db.joinedload(ClassSeries.instructor))
+              .filter(ClassSeries.valid_from < end,
+                      or_(ClassSeries.valid_until.is_(None), ClassSeries.valid_until > start)))
     if class_type:
-        filtered_classes = [c for c in filtered_classes if c['type'] == class_type]
+        classes = classes.filter(Class.type == class_type)
+        series = series.filter(ClassSeries.type == class_type)
     if level:
-        filtered_classes = [c for c in filtered_classes if c['level'] == level]
+        classes = classes.filter(Class.level == level)
+        series = series.filter(ClassSeries.level == level)
+    
+    concrete = classes.order_by(Class.starts_at, Class.id).all()
+    materialized = {(cls.series_id, cls.starts_at) for cls in concrete if cls.series_id}
+    
+    streams = [((cls.starts_at, cls.to_dict(cls.instructor.name)) for cls in concrete)]
+    streams.extend(series_occurrence_dicts(s, start, end, materialized) for s in series)
     
-    return jsonify(filtered_classes), 200
+    return jsonify([item for _, item in heapq.merge(*streams, key=lambda pair: pair[0])]), 200
 
 @bp.route('/<int:class_id>', methods=['GET'])
+@read_only
 def get_class(class_id):
-    # In a real application, fetch specific class from database
-    
-    sample_class = {
-        "id": class_id,
-        "title": "Basic Self-Defense",
-        "description": "Learn fundamental self-defense techniques including basic strikes, blocks, and escapes. This class is perfect for beginners with no prior experience.",
-        "instructor": {
-            "name": "John Doe",
-            "bio": "Certified self-defense instructor with 10+ years of experience",
-            "qualifications": ["Black belt in Krav Maga", "Certified Personal Trainer"]
-        },
-        "type": "self-defense",
-        "level": "beginner",
-        "capacity": 20,
-        "registered": 12,
-        "date": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
-        "time": "18:00-19:30",
-        "duration_minutes": 90,
-        "location": "Main Studio, 123 Safety St",
-        "requirements": ["Comfortable clothing", "Water bottle"],
-        "topics_covered": ["Basic stance", "Blocking techniques", "Escape methods"]
-    }
-    
-    return jsonify(sample_class), 200
+    cls = Class.query.get(class_id)
+    
+    if not cls:
+        return jsonify({"error": "Class not found"}), 404
+    
+    result = cls.to_dict({
+        "name": cls.instructor.name,
+        "bio": cls.instructor.bio,
+        "qualifications": cls.instructor.qualifications
+    })
+    result['duration_minutes'] = int((cls.ends_at - cls.starts_at).total_seconds() // 60)
+    result['requirements'] = cls.requirements
+    result['topics_covered'] = cls.topics_covered
+    
+    return jsonify(result), 200
 
-@bp.route('/<int:class_id>/register', methods=['POST'])
-@jwt_required()
-def register_for_class(class_id):
-    user_id = get_jwt_identity()
+def claim_seat(class_id, user_id):
+    # Claim a seat with a single conditional UPDATE: the database checks and
+    # increments in one step, so concurrent sign-ups can't overbook and no
+    # application-level lock is needed. Losing the race means the waitlist.
+    claimed = db.session.execute(
+        update(Class)
+        .where(Class.id == class_id, Class.registered < Class.capacity)
+        .values(registered=Class.registered + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    
+    if not claimed and not db.session.query(Class.id).filter_by(id=class_id).first():
+        db.session.rollback()
+        return jsonify({"error": "Class not found"}), 404
+    
+    registration = Registration(
+        class_id=class_id,
+        user_id=user_id,
+        status='confirmed' if claimed else 'waitlisted'
+    )
+    db.session.add(registration)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Unique (class_id, user_id): rolling back also releases the seat
+        db.session.rollback()
+        return jsonify({"error": "Already registered for this class"}), 409
     
-    # In a real application:
-    # 1. Check if class has available spots
-    # 2. Check if user is already registered
-    # 3. Create registration record
+    if claimed:
+        message = f"Successfully registered for class {class_id}"
+    else:
+        message = f"Class {class_id} is full, you have been added to the waitlist"
     
     return jsonify({
         "success": True,
-        "message": f"Successfully registered for class {class_id}",
-        "registration_id": 12345,
+        "message": message,
+        "registration_id": registration.id,
+        "status": registration.status,
         "class_id": class_id,
         "user_id": user_id
     }), 201
 
+@bp.route('/<int:class_id>/register', methods=['POST'])
+@jwt_required()
+def register_for_class(class_id):
+    return claim_seat(class_id, int(get_jwt_identity()))
+
+def register_occurrence(series_id, starts_at, user_id):
+    series = ClassSeries.query.get(series_id)
+    
+    if not series:
+        return jsonify({"error": "Class series not found"}), 404
+    
+    if starts_at not in series.occurrences(starts_at, starts_at + timedelta(minutes=1)):
+        return jsonify({"error": "No occurrence of this class starts at that time"}), 404
+    
+    # First registration for an occurrence materializes it as a Class row;
+    # the (series_id, starts_at) unique constraint makes this race-free
+    occurrence = Class.from_series(series, starts_at)
+    values = {column.name: getattr(occurrence, column.name)
+              for column in Class.__table__.columns if column.name != 'id'}
+    db.session.execute(sqlite_insert(Class).values(**values).on_conflict_do_nothing())
+    class_id = db.session.query(Class.id).filter_by(series_id=series_id, starts_at=starts_at).scalar()
+    
+    return claim_seat(class_id, user_id)
+
+@bp.route('/series/<int:series_id>/register', methods=['POST'])
+@jwt_required()
+def register_for_occurrence(series_id):
+    try:
+        starts_at = parse_datetime(request.json['starts_at'])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({"error": "starts_at must be an ISO datetime"}), 400
+    
+    return register_occurrence(series_id, starts_at, int(get_jwt_identity()))
+
+@bp.route('/occurrences/<occurrence_id>/register', methods=['POST'])
+@jwt_required()
+def register_for_occurrence_id(occurrence_id):
+    # The occurrence_id from the class listing, for occurrences that have no
+    # Class row (and so no id) yet
+    try:
+        series_id, starts_at = parse_occurrence_id(occurrence_id)
+    except ValueError:
+        return jsonify({"error": "Class not found"}), 404
+    
+    return register_occurrence(series_id, starts_at, int(get_jwt_identity()))
+
+@bp.route('/<int:class_id>/register', methods=['DELETE'])
+@jwt_required()
+def cancel_registration(class_id):
+    user_id = int(get_jwt_identity())
+    
+    status = db.session.execute(
+        delete(Registration)
+        .where(Registration.class_id == class_id, Registration.user_id == user_id)
+        .returning(Registration.status)
+    ).scalar()
+    
+    if status is None:
+        db.session.rollback()
+        return jsonify({"error": "Registration not found"}), 404
+    
+    if status == 'confirmed':
+        # Hand the seat to the longest-waiting user; only if nobody is
+        # waiting does the class count go down
+        next_in_line = (
+            select(Registration.id)
+            .where(Registration.class_id == class_id, Registration.status == 'waitlisted')
+            .order_by(Registration.created_at, Registration.id)
+            .limit(1)
+            .scalar_subquery()
+        )
+        promoted = db.session.execute(
+            update(Registration)
+            .where(Registration.id == next_in_line)
+            .values(status='confirmed')
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not promoted:
+            db.session.execute(
+                update(Class)
+                .where(Class.id == class_id)
+                .values(registered=Class.registered - 1)
+                .execution_options(synchronize_session=False)
+            )
+    
+    db.session.commit()
+    
+    return jsonify({"success": True, "message": f"Registration for class {class_id} cancelled"}), 200
+
 @bp.route('/user/registrations', methods=['GET'])
+@read_only
 @jwt_required()
 def get_user_registrations():
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     
-    # In a real application, fetch user's class registrations from database
+    rows = (db.session.query(Registration, Class)
+            .join(Class, Class.id == Registration.class_id)
+            .filter(Registration.user_id == user_id)
+            .order_by(Class.starts_at)
+            .all())
     
-    sample_registrations = [
+    return jsonify([
         {
-            "registration_id": 1001,
+            "registration_id": registration.id,
             "class": {
-                "id": 1,
-                "title": "Basic Self-Defense",
-                "date": (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d"),
-                "time": "18:00-19:30"
+                "id": cls.id,
+                "title": cls.title,
+                "date": cls.starts_at.strftime("%Y-%m-%d"),
+                "time": f"{cls.starts_at:%H:%M}-{cls.ends_at:%H:%M}"
             },
-            "status": "confirmed",
-            "registered_on": (datetime.now() - timedelta(days=3)).isoformat()
+            "status": registration.status,
+            "registered_on": registration.created_at.isoformat()
         }
-    ]
-    
-    return jsonify(sample_registrations), 200
+        for registration, cls in rows
+    ]), 200
 
 @bp.route('/instructors', methods=['GET'])
+@read_only
+@response_cache.cached(ttl=300, depends_on=(Instructor,))
 def get_instructors():
-    # In a real application, fetch instructors from database
-    
-    sample_instructors = [
-        {
-            "id": 1,
-            "name": "John Doe",
-            "specialties": ["Self-defense", "Krav Maga"],
-            "bio": "Certified self-defense instructor with 10+ years of experience",
-            "image_url": "https://example.com/images/john-doe.jpg"
-        },
-        {
-            "id": 2,
-            "name": "Jane Smith",
-            "specialties": ["Women's self-defense", "Safety awareness"],
-            "bio": "Specializes in women's safety and self-defense techniques",
-            "image_url": "https://example.com/images/jane-smith.jpg"
-        }
-    ]
+    instructors = Instructor.query.order_by(Instructor.id).all()
     
-    return jsonify(sample_instructors), 200
\ No newline at end of file
+    return jsonify([instructor.to_dict() for instructor in instructors]), 200
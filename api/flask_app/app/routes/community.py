@@ -1,136 +1,342 @@
-from flask import Blueprint, jsonify, request
+import re
+from flask import Blueprint, g, jsonify, request
 from app import db
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.services.database import read_only
+from app.services.idempotency import idempotency
+from app.models.user import User
 from datetime import datetime
+from app.models.post import Post, PostLike, Comment, comment_schema, post_schema
+from app.models.resource import Resource, resource_schema
+from app.models.search import KIND_POST, KIND_RESOURCE, rebuild_search_index
+from sqlalchemy import delete, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from app.services.pagination import encode_cursor, keyset_page
+from app.services.feed import adjust_counters, hot_score
+from app.services.response_cache import response_cache
+from flask_jwt_extended import jwt_required, get_jwt_identity
 
 bp = Blueprint('community', __name__, url_prefix='/api/community')
 
-# In a real application, you would define Post and Comment models
-# For now, we'll simulate community functionality
+def author_dict(user_id, name):
+    return {"id": user_id, "name": name}
+
+def load_authors(user_ids):
+    # Request-scoped identity map of author dicts: every id missing from it
+    # is fetched in one IN query, so a page of comments costs one lookup no
+    # matter how many distinct authors it has
+    authors = g.setdefault('authors', {})
+    missing = set(user_ids) - authors.keys()
+    if missing:
+        rows = db.session.query(User.id, User.full_name).filter(User.id.in_(missing))
+        for user_id, name in rows:
+            authors[user_id] = author_dict(user_id, name)
+    return authors
+
+def with_author(schema, row, author):
+    data = schema.dump_row(row)
+    data['author'] = author
+    return data
+
+def feed_query():
+    # Column tuples (post columns, then the author's name) instead of Post
+    # instances: feed pages are serialized and thrown away
+    return db.session.query(*post_schema.columns, User.full_name).join(User, User.id == Post.user_id)
+
+def feed_posts(rows):
+    return [with_author(post_schema, row, author_dict(row.user_id, row.full_name)) for row in rows]
+
+def comments_page(post_id, cursor, limit, extra_authors=()):
+    # Threads read oldest-first along ix_comment_post_created_id
+    query = db.session.query(*comment_schema.columns).filter(Comment.post_id == post_id)
+    rows, has_more = keyset_page(
+        query, Comment.created_at, Comment.id, cursor, limit, descending=False
+    )
+    authors = load_authors([row.user_id for row in rows] + list(extra_authors))
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    return [with_author(comment_schema, row, authors.get(row.user_id)) for row in rows], next_cursor, has_more
 
 @bp.route('/posts', methods=['GET'])
+@read_only
+@response_cache.cached(ttl=30, depends_on=(Post, User))
 def get_posts():
-    # In a real application, fetch posts from database
-    # Optional query parameters: page, limit, category
-    
-    page = request.args.get('page', 1, type=int)
-    limit = min(request.args.get('limit', 10, type=int), 50)
+    # Optional query parameters: cursor, limit, category
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
     category = request.args.get('category', None)
+    cursor = request.args.get('cursor')
     
-    # Sample posts
-    sample_posts = [
-        {
-            "id": 1,
-            "title": "Safety Tips for Night Walking",
-            "content": "Here are some important safety tips when walking at night...",
-            "author": {"id": 101, "name": "Safety Expert"},
-            "created_at": "2023-05-10T18:30:00Z",
-            "likes": 45,
-            "comments_count": 12,
-            "category": "tips"
-        },
-        {
-            "id": 2,
-            "title": "Self-Defense Basics Everyone Should Know",
-            "content": "Learning these basic self-defense moves can help in emergency situations...",
-            "author": {"id": 102, "name": "Defense Instructor"},
-            "created_at": "2023-05-08T14:20:00Z",
-            "likes": 78,
-            "comments_count": 25,
-            "category": "education"
-        }
-    ]
-    
+    query = feed_query()
     if category:
-        sample_posts = [post for post in sample_posts if post.get('category') == category]
+        query = query.filter(Post.category == category)
+    
+    try:
+        rows, has_more = keyset_page(query, Post.created_at, Post.id, cursor, limit)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    
+    return jsonify({
+        "posts": feed_posts(rows),
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }), 200
+
+@bp.route('/posts/hot', methods=['GET'])
+@read_only
+def get_hot_posts():
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    cursor = request.args.get('cursor')
+    
+    # hot_score is maintained on every like/comment, so this is one ordered
+    # slice of ix_post_hot_id rather than an aggregate over likes and comments
+    query = feed_query().add_columns(Post.hot_score)
+    try:
+        rows, has_more = keyset_page(query, Post.hot_score, Post.id, cursor, limit)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(rows[-1].hot_score, rows[-1].id)
     
     return jsonify({
-        "posts": sample_posts,
-        "page": page,
+        "posts": feed_posts(rows),
         "limit": limit,
-        "total": len(sample_posts)
+        "next_cursor": next_cursor,
+        "has_more": has_more
     }), 200
 
 @bp.route('/posts', methods=['POST'])
 @jwt_required()
+@idempotency.idempotent
 def create_post():
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     data = request.json
     
-    # In a real application, save post to database
+    if not data.get('title') or not data.get('content'):
+        return jsonify({"error": "Title and content are required"}), 400
     
-    return jsonify({
-        "id": 999,  # This would be the new post ID
-        "title": data.get('title'),
-        "content": data.get('content'),
-        "created_at": datetime.utcnow().isoformat(),
-        "author_id": user_id
-    }), 201
+    created_at = datetime.utcnow()
+    post = Post(
+        user_id=user_id,
+        title=data['title'],
+        content=data['content'],
+        category=data.get('category') or 'general',
+        created_at=created_at,
+        hot_score=hot_score(0, 0, created_at)
+    )
+    db.session.add(post)
+    db.session.flush()
+    response = idempotency.record((jsonify(post.to_dict()), 201))
+    db.session.commit()
+    
+    return response
 
 @bp.route('/posts/<int:post_id>', methods=['GET'])
+@read_only
 def get_post(post_id):
-    # In a real application, fetch specific post from database
-    
-    sample_post = {
-        "id": post_id,
-        "title": "Sample Post Title",
-        "content": "This is the full content of the sample post...",
-        "author": {"id": 101, "name": "Author Name"},
-        "created_at": "2023-05-10T18:30:00Z",
-        "likes": 45,
-        "comments": [
-            {
-                "id": 1,
-                "content": "Great post, thanks for sharing!",
-                "author": {"id": 201, "name": "Commenter 1"},
-                "created_at": "2023-05-10T19:00:00Z"
-            },
-            {
-                "id": 2,
-                "content": "This was very helpful information.",
-                "author": {"id": 202, "name": "Commenter 2"},
-                "created_at": "2023-05-10T19:30:00Z"
-            }
-        ]
-    }
-    
-    return jsonify(sample_post), 200
+    post = Post.query.get(post_id)
+    
+    if not post:
+        return jsonify({"error": "Post not found"}), 404
+    
+    # Only the first page of comments is embedded; the rest comes from
+    # GET /posts/<id>/comments with the returned cursor
+    limit = max(1, min(request.args.get('comments_limit', 20, type=int), 50))
+    comments, next_cursor, has_more = comments_page(
+        post_id, None, limit, extra_authors=[post.user_id]
+    )
+    
+    result = post.to_dict(g.authors.get(post.user_id))
+    result['comments'] = comments
+    result['comments_next_cursor'] = next_cursor
+    result['comments_has_more'] = has_more
+    return jsonify(result), 200
+
+@bp.route('/posts/<int:post_id>/comments', methods=['GET'])
+@read_only
+def get_comments(post_id):
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+    cursor = request.args.get('cursor')
+    
+    if not db.session.query(Post.query.filter_by(id=post_id).exists()).scalar():
+        return jsonify({"error": "Post not found"}), 404
+    
+    try:
+        comments, next_cursor, has_more = comments_page(post_id, cursor, limit)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+    
+    return jsonify({
+        "comments": comments,
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "has_more": has_more
+    }), 200
 
 @bp.route('/posts/<int:post_id>/comments', methods=['POST'])
 @jwt_required()
+@idempotency.idempotent
 def add_comment(post_id):
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     data = request.json
     
-    # In a real application, save comment to database
+    if not data.get('content'):
+        return jsonify({"error": "Content is required"}), 400
+    
+    # The counter update also proves the post exists
+    if adjust_counters(post_id, comments=1) is None:
+        return jsonify({"error": "Post not found"}), 404
+    
+    comment = Comment(post_id=post_id, user_id=user_id, content=data['content'])
+    db.session.add(comment)
+    db.session.flush()
+    response = idempotency.record((jsonify(comment.to_dict()), 201))
+    db.session.commit()
+    
+    return response
+
+@bp.route('/posts/<int:post_id>/like', methods=['POST', 'DELETE'])
+@jwt_required()
+def like_post(post_id):
+    user_id = int(get_jwt_identity())
+    
+    # The (post_id, user_id) primary key makes like/unlike idempotent; the
+    # counter only moves when a row was actually inserted or deleted
+    if request.method == 'POST':
+        changed = db.session.execute(
+            sqlite_insert(PostLike)
+            .values(post_id=post_id, user_id=user_id, created_at=datetime.utcnow())
+            .on_conflict_do_nothing()
+        ).rowcount
+        delta = 1
+    else:
+        changed = db.session.execute(
+            delete(PostLike).where(PostLike.post_id == post_id, PostLike.user_id == user_id)
+        ).rowcount
+        delta = -1
+    
+    counters = adjust_counters(post_id, likes=delta if changed else 0)
+    if counters is None:
+        db.session.rollback()
+        return jsonify({"error": "Post not found"}), 404
+    db.session.commit()
     
     return jsonify({
-        "id": 999,  # This would be the new comment ID
-        "content": data.get('content'),
         "post_id": post_id,
-        "author_id": user_id,
-        "created_at": datetime.utcnow().isoformat()
-    }), 201
+        "liked": request.method == 'POST',
+        "likes": counters.likes
+    }), 200
 
 @bp.route('/resources', methods=['GET'])
+@read_only
+@response_cache.cached(ttl=300, depends_on=(Resource,))
 def get_resources():
-    # In a real application, fetch resources from database
-    
-    sample_resources = [
-        {
-            "id": 1,
-            "title": "Emergency Services Guide",
-            "description": "A comprehensive guide to emergency services in your area",
-            "url": "https://example.com/resources/emergency-guide",
-            "category": "guides"
-        },
-        {
-            "id": 2,
-            "title": "Safety Equipment Recommendations",
-            "description": "Recommended safety equipment for personal protection",
-            "url": "https://example.com/resources/safety-equipment",
-            "category": "equipment"
-        }
-    ]
-    
-    return jsonify(sample_resources), 200
\ No newline at end of file
+    rows = db.session.execute(resource_schema.select().order_by(Resource.id))
+    
+    return jsonify(resource_schema.dump_rows(rows)), 200
+
+SEARCH_TERM = re.compile(r'\w+\*?')
+
+# Prefix terms shorter than this are searched as whole words: a one- or
+# two-letter prefix expands to a large share of the vocabulary
+SEARCH_MIN_PREFIX = 3
+
+# BM25 only ranks the newest SEARCH_CANDIDATES matches. Finding them is a
+# rowid-ordered walk of the doclists that stops at the LIMIT, so a term that
+# appears in every post costs the same as one that appears in a thousand;
+# selective queries, with fewer matches than the cap, rank every match.
+# (bm25() still reads each term's doclist once for its IDF; that is what the
+# remaining latency grows with.) highlight()/snippet() then run for the returned rows alone (CROSS JOIN
+# keeps SQLite from reordering the join, so each is a rowid lookup).
+SEARCH_CANDIDATES = 500
+
+SEARCH_SQL = text("""
+    WITH candidates AS (
+        SELECT rowid FROM community_search
+        WHERE community_search MATCH :match
+        ORDER BY rowid DESC
+        LIMIT :candidates
+    ), ranked AS (
+        SELECT rowid, bm25(community_search, 4.0, 1.0) AS score
+        FROM community_search
+        WHERE community_search MATCH :match
+          AND rowid >= (SELECT min(rowid) FROM candidates)
+        ORDER BY score
+        LIMIT :limit
+    )
+    SELECT ranked.rowid,
+           highlight(community_search, 0, '<mark>', '</mark>') AS title_highlight,
+           snippet(community_search, 1, '<mark>', '</mark>', '...', 16) AS snippet,
+           ranked.score
+    FROM ranked CROSS JOIN community_search ON community_search.rowid = ranked.rowid
+    WHERE community_search MATCH :match
+    ORDER BY ranked.score
+""")
+
+def build_match(q):
+    # Quote every term so user input can't inject FTS5 syntax; a trailing *
+    # keeps its meaning as a prefix query once the prefix is long enough
+    terms = []
+    for term in SEARCH_TERM.findall(q):
+        word = term.rstrip('*')
+        prefix = term.endswith('*') and len(word) >= SEARCH_MIN_PREFIX
+        terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return ' '.join(terms)
+
+@bp.route('/search', methods=['GET'])
+@read_only
+def search():
+    q = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+    
+    match = build_match(q)
+    if not match:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    
+    hits = db.session.execute(
+        SEARCH_SQL, {"match": match, "candidates": SEARCH_CANDIDATES, "limit": limit}
+    ).all()
+    
+    post_ids = [hit.rowid // 2 for hit in hits if hit.rowid % 2 == KIND_POST]
+    resource_ids = [hit.rowid // 2 for hit in hits if hit.rowid % 2 == KIND_RESOURCE]
+    
+    posts = {}
+    if post_ids:
+        rows = feed_query().filter(Post.id.in_(post_ids)).all()
+        posts = {row.id: post for row, post in zip(rows, feed_posts(rows))}
+    
+    resources = {}
+    if resource_ids:
+        rows = db.session.execute(resource_schema.select().where(Resource.id.in_(resource_ids)))
+        resources = {row.id: resource_schema.dump_row(row) for row in rows}
+    
+    results = []
+    for hit in hits:
+        kind, ref_id = hit.rowid % 2, hit.rowid // 2
+        item = (posts if kind == KIND_POST else resources).get(ref_id)
+        if item is None:
+            continue
+        results.append({
+            "type": "post" if kind == KIND_POST else "resource",
+            "item": item,
+            "title_highlight": hit.title_highlight,
+            "snippet": hit.snippet,
+            "score": -hit.score
+        })
+    
+    return jsonify({"query": q, "results": results}), 200
+
+@bp.cli.command('reindex')
+def reindex_command():
+    """Rebuild the community full-text search index from scratch."""
+    with db.engine.begin() as connection:
+        rebuild_search_index(connection)
+    print("Community search index rebuilt")
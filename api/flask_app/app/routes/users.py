@@ -1,21 +1,30 @@
-from flask import Blueprint, jsonify, request
+import hashlib
+import json
+import click
+from flask import Blueprint, Response, current_app, jsonify, request
 from app import db
+from app.services.database import read_only
 from app.models.user import User
-from app.models.emergency_contact import EmergencyContact
+from app.models.emergency_contact import EmergencyContact, contact_schema
+from app.services.user_cache import user_cache
+from app.services.user_export import ExportBusy, ndjson_chunks, user_export
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import bindparam, delete, insert, update
+
+CONTACT_FIELDS = ('name', 'relationship', 'phone', 'email')
 
 bp = Blueprint('users', __name__, url_prefix='/api/users')
 
 @bp.route('/profile', methods=['GET'])
+@read_only
 @jwt_required()
 def get_profile():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    profile = user_cache.get_profile(get_jwt_identity())
     
-    if not user:
+    if not profile:
         return jsonify({"error": "User not found"}), 404
     
-    return jsonify(user.to_dict()), 200
+    return jsonify(profile), 200
 
 @bp.route('/profile', methods=['PUT'])
 @jwt_required()
@@ -38,15 +47,109 @@ def update_profile():
     
     db.session.commit()
     
-    return jsonify(user.to_dict()), 200
+    # The update bumped user.version; refresh this worker's entry now, and
+    # other workers will notice the version change on their next probe
+    return jsonify(user_cache.put(user)), 200
+
+def load_contacts(user_id):
+    # Plain rows, no ORM instances: the list is only serialized
+    rows = db.session.execute(
+        contact_schema.select()
+        .where(EmergencyContact.user_id == user_id)
+        .order_by(EmergencyContact.id)
+    )
+    return contact_schema.dump_rows(rows)
+
+def contacts_etag(contacts):
+    # The list's version is a digest of its contents, so it changes exactly
+    # when a contact is added, edited or removed, whichever endpoint did it
+    return hashlib.sha1(json.dumps(contacts, sort_keys=True).encode()).hexdigest()
+
+def contacts_response(contacts, changed=True):
+    # A GET revalidating its copy, or a sync that changed nothing for a
+    # client that already holds the current version, gets a bodiless 304
+    etag = contacts_etag(contacts)
+    not_modified = (request.method == 'GET' or not changed) and request.if_none_match.contains(etag)
+    if not_modified or (not changed and request.if_match.contains(etag)):
+        response = Response(status=304)
+    else:
+        response = jsonify(contacts)
+    response.set_etag(etag)
+    return response
 
 @bp.route('/emergency-contacts', methods=['GET'])
+@read_only
 @jwt_required()
 def get_emergency_contacts():
     user_id = get_jwt_identity()
-    contacts = EmergencyContact.query.filter_by(user_id=user_id).all()
     
-    return jsonify([contact.to_dict() for contact in contacts]), 200
+    return contacts_response(load_contacts(user_id))
+
+@bp.route('/emergency-contacts', methods=['PUT'])
+@jwt_required()
+def sync_emergency_contacts():
+    # Replaces the whole list in one transaction. Items with an "id" update
+    # that contact; items without one reuse an existing contact with the same
+    # phone number or are inserted; contacts left out are deleted.
+    user_id = int(get_jwt_identity())
+    desired = request.json
+    if isinstance(desired, dict):
+        desired = desired.get('contacts')
+    if not isinstance(desired, list):
+        return jsonify({"error": "Expected a list of contacts"}), 400
+    
+    for item in desired:
+        if not isinstance(item, dict) or any(not item.get(f) for f in ('name', 'relationship', 'phone')):
+            return jsonify({"error": "Each contact needs name, relationship and phone"}), 400
+    
+    current = load_contacts(user_id)
+    
+    # Optimistic concurrency for clients that send back the ETag they synced from
+    if request.if_match and not request.if_match.contains(contacts_etag(current)):
+        return jsonify({"error": "Contacts changed since they were last fetched"}), 412
+    
+    by_id = {contact['id']: contact for contact in current}
+    unclaimed = {contact['phone']: contact['id'] for contact in reversed(current)}
+    claimed = set()
+    for item in desired:
+        contact_id = item.get('id')
+        if contact_id is not None and (contact_id not in by_id or contact_id in claimed):
+            return jsonify({"error": f"Unknown contact id {contact_id}"}), 400
+        if contact_id is not None:
+            claimed.add(contact_id)
+    
+    inserts, updates = [], []
+    for item in desired:
+        contact_id = item.get('id')
+        if contact_id is None:
+            contact_id = unclaimed.get(item['phone'])
+            if contact_id is None or contact_id in claimed:
+                inserts.append(dict({f: item.get(f) for f in CONTACT_FIELDS}, user_id=user_id))
+                continue
+            claimed.add(contact_id)
+        values = {f: item.get(f, by_id[contact_id][f]) for f in CONTACT_FIELDS}
+        if any(values[f] != by_id[contact_id][f] for f in CONTACT_FIELDS):
+            updates.append(dict({'b_' + f: values[f] for f in CONTACT_FIELDS}, b_id=contact_id))
+    deletes = [contact_id for contact_id in by_id if contact_id not in claimed]
+    
+    if not (inserts or updates or deletes):
+        return contacts_response(current, changed=False)
+    
+    table = EmergencyContact.__table__
+    if deletes:
+        db.session.execute(delete(table).where(table.c.id.in_(deletes)))
+    if updates:
+        db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('b_id'))
+            .values({f: bindparam('b_' + f) for f in CONTACT_FIELDS}),
+            updates
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+    db.session.commit()
+    
+    return contacts_response(load_contacts(user_id))
 
 @bp.route('/emergency-contacts', methods=['POST'])
 @jwt_required()
@@ -90,4 +193,37 @@ def manage_emergency_contact(contact_id):
     
     db.session.commit()
     
-    return jsonify(contact.to_dict()), 200
\ No newline at end of file
+    return jsonify(contact.to_dict()), 200
+
+@bp.route('/export', methods=['GET'])
+@read_only
+@jwt_required()
+def export_data():
+    # Everything stored about the caller as NDJSON, streamed straight from
+    # the database; gzipped when the client accepts it
+    user_id = int(get_jwt_identity())
+    
+    if not user_cache.get_profile(user_id):
+        return jsonify({"error": "User not found"}), 404
+    
+    try:
+        return user_export.stream(user_id, compress=request.accept_encodings['gzip'] > 0)
+    except ExportBusy:
+        response = jsonify({"error": "Too many exports in progress, please retry shortly"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+@bp.cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True), default='-')
+@click.option('--user-id', type=int, default=None, help='Export one user instead of everyone.')
+@click.option('--gzip/--no-gzip', 'compress', default=None, help='Defaults to on for *.gz paths.')
+def export_command(path, user_id, compress):
+    """Write every user's data (or one user's) as NDJSON to PATH or stdout."""
+    if compress is None:
+        compress = path.endswith('.gz')
+    written = 0
+    with click.open_file(path, 'wb') as out:
+        for chunk in ndjson_chunks(current_app._get_current_object(), user_id, compress):
+            out.write(chunk)
+            written += len(chunk)
+    click.echo(f"Wrote {written} bytes", err=True)
@@ -0,0 +1,205 @@
+import math
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import closing
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+
+class MemoryBucketStore:
+    # Token buckets for this process only. Idle buckets are full again after
+    # burst / rate seconds, so they can be dropped when the table grows.
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys and now >= self._next_prune:
+                self._next_prune = now + 10
+                self._prune(now)
+            return allowed, tokens
+
+    def _prune(self, now):
+        # Called with the lock held
+        stale = [key for key, (_, updated) in self._buckets.items() if now - updated > 60]
+        for key in stale:
+            del self._buckets[key]
+
+
+class SQLiteBucketStore:
+    # Shared by every worker pointing at the same file, so a client can't
+    # multiply its allowance by the number of processes. Each take is a
+    # single UPSERT, atomic under SQLite's write lock.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._next_prune = 0.0
+        # A throwaway connection: this may run in a master process that
+        # forks workers, and sqlite connections must not cross a fork
+        with closing(sqlite3.connect(path, timeout=5, isolation_level=None)) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS admission_bucket (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    allowed INTEGER NOT NULL
+                )
+            """)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, rate, burst, now):
+        conn = self._connection()
+        # SET expressions all see the old row, so `allowed` and `tokens` are
+        # computed from the same refill
+        allowed, tokens = conn.execute("""
+            INSERT INTO admission_bucket (key, tokens, updated, allowed)
+            VALUES (:key, :burst - 1, :now, 1)
+            ON CONFLICT(key) DO UPDATE SET
+                allowed = min(:burst, tokens + (:now - updated) * :rate) >= 1,
+                tokens = min(:burst, tokens + (:now - updated) * :rate)
+                         - (min(:burst, tokens + (:now - updated) * :rate) >= 1),
+                updated = :now
+            RETURNING allowed, tokens
+        """, {'key': key, 'rate': rate, 'burst': burst, 'now': now}).fetchone()
+        if now >= self._next_prune:
+            self._next_prune = now + 60
+            conn.execute('DELETE FROM admission_bucket WHERE updated < ?', (now - 3600,))
+        return bool(allowed), tokens
+
+
+def _reject(status, message, retry_after):
+    response = jsonify({"error": message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class _Gate:
+    def __init__(self, app):
+        config = app.config
+        self.priority = set(config['ADMISSION_PRIORITY_BLUEPRINTS'])
+        self.limits = dict(config['ADMISSION_CONCURRENCY'])
+        self.default_limit = config['ADMISSION_DEFAULT_CONCURRENCY']
+        self.queue_timeout = config['ADMISSION_QUEUE_TIMEOUT']
+        self.user_rate, self.user_burst = config['ADMISSION_USER_RATE']
+        self.ip_rate, self.ip_burst = config['ADMISSION_IP_RATE']
+        if config['ADMISSION_STORE'] == 'sqlite':
+            self.store = SQLiteBucketStore(config['ADMISSION_STORE_PATH'])
+        else:
+            self.store = MemoryBucketStore(config['ADMISSION_MAX_KEYS'])
+        self._slots = {}
+        self._lock = threading.Lock()
+        self.rejected = Counter()
+
+    def _slot(self, blueprint):
+        # Concurrency is bounded per process: it protects this process's
+        # worker threads, which is what a priority request would queue on
+        slot = self._slots.get(blueprint)
+        if slot is None:
+            with self._lock:
+                slot = self._slots.get(blueprint)
+                if slot is None:
+                    slot = threading.BoundedSemaphore(self.limits.get(blueprint, self.default_limit))
+                    self._slots[blueprint] = slot
+        return slot
+
+    def _identity(self):
+        try:
+            verify_jwt_in_request(optional=True)
+            return get_jwt_identity()
+        except Exception:
+            # Bad or expired tokens are the route's problem; rate-limit by IP
+            return None
+
+    def admit(self):
+        blueprint = request.blueprint
+        if blueprint is None or blueprint in self.priority or request.method == 'OPTIONS':
+            return None
+
+        now = time.time()
+        buckets = [('ip:' + (request.remote_addr or '-'), self.ip_rate, self.ip_burst)]
+        user_id = self._identity()
+        if user_id is not None:
+            buckets.append(('user:' + str(user_id), self.user_rate, self.user_burst))
+        for key, rate, burst in buckets:
+            allowed, tokens = self.store.take(key, rate, burst, now)
+            if not allowed:
+                self.rejected[(blueprint, 429)] += 1
+                return _reject(429, "Too many requests", (1 - tokens) / rate)
+
+        slot = self._slot(blueprint)
+        if not slot.acquire(timeout=self.queue_timeout):
+            self.rejected[(blueprint, 503)] += 1
+            return _reject(503, "Server busy, please retry shortly", 1)
+        g.admission_slot = slot
+        return None
+
+    def release(self, exc=None):
+        slot = g.pop('admission_slot', None)
+        if slot is not None:
+            slot.release()
+
+    def stats(self):
+        return {
+            'rejected': {f'{blueprint}:{status}': count
+                         for (blueprint, status), count in self.rejected.items()}
+        }
+
+
+class AdmissionControl:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ADMISSION_ENABLED', True)
+        # Never throttled or counted: SOS, location pings and alert streams
+        app.config.setdefault('ADMISSION_PRIORITY_BLUEPRINTS', ('alerts',))
+        # In-flight requests per blueprint and process. Keep the total below
+        # the server's thread count so priority requests always find a thread.
+        app.config.setdefault('ADMISSION_CONCURRENCY', {
+            'community': 8, 'classes': 4, 'users': 4, 'auth': 4
+        })
+        app.config.setdefault('ADMISSION_DEFAULT_CONCURRENCY', 4)
+        app.config.setdefault('ADMISSION_QUEUE_TIMEOUT', 0.25)
+        # (tokens per second, burst)
+        app.config.setdefault('ADMISSION_USER_RATE', (10, 40))
+        app.config.setdefault('ADMISSION_IP_RATE', (50, 200))
+        app.config.setdefault('ADMISSION_STORE', 'memory')  # or 'sqlite'
+        app.config.setdefault('ADMISSION_STORE_PATH', 'admission.sqlite')
+        app.config.setdefault('ADMISSION_MAX_KEYS', 100000)
+
+        if not app.config['ADMISSION_ENABLED']:
+            return
+
+        gate = _Gate(app)
+        app.extensions['admission'] = gate
+        app.before_request(gate.admit)
+        app.teardown_request(gate.release)
+
+    def stats(self):
+        gate = current_app.extensions.get('admission')
+        return gate.stats() if gate is not None else {}
+
+
+admission = AdmissionControl()
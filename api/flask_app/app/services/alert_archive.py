@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, insert, literal, select, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models.alert import (
+    ARCHIVE_PREFIX, Alert, AlertArchiveMonth, AlertEvent, AlertLocation, NotificationOutbox,
+    alert_archive_table
+)
+from app.services.pagination import keyset_page
+from app.services import workers
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; every process archives there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+alert_table = Alert.__table__
+month_table = AlertArchiveMonth.__table__
+
+# Rows that only make sense while an alert is live; deleted with it when it
+# moves to the archive
+ALERT_CHILD_TABLES = (AlertEvent.__table__, AlertLocation.__table__, NotificationOutbox.__table__)
+
+
+def month_key(moment):
+    return f'{moment.year:04d}{moment.month:02d}'
+
+
+def month_bounds(month):
+    start = datetime(int(month[:4]), int(month[4:]), 1)
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+def archive_months(connection=None):
+    # Newest first. Read from the schema so partitions created by another
+    # worker's archiver are picked up without any coordination.
+    names = (connection or db.session).execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :pattern"
+    ), {'pattern': ARCHIVE_PREFIX + '%'}).scalars()
+    months = [name[len(ARCHIVE_PREFIX):] for name in names]
+    return sorted((month for month in months if month.isdigit()), reverse=True)
+
+
+def user_archive_months(user_id):
+    # Newest first
+    return db.session.execute(
+        select(month_table.c.month)
+        .where(month_table.c.user_id == user_id)
+        .order_by(month_table.c.month.desc())
+    ).scalars().all()
+
+
+def index_archive_months(connection, month, source):
+    # Records which users have rows in `month`, from the rows in `source`
+    connection.execute(
+        insert(month_table).prefix_with('OR IGNORE').from_select(
+            ['user_id', 'month'],
+            select(source.c.user_id, literal(month)).distinct()
+        )
+    )
+
+
+def history_dict(row):
+    location = {}
+    if row.latitude is not None and row.longitude is not None:
+        location = {'lat': row.latitude, 'lng': row.longitude}
+    return {
+        'id': row.id,
+        'type': row.type,
+        'status': row.status,
+        'message': row.message,
+        'location': location,
+        'created_at': row.created_at.isoformat()
+    }
+
+
+def _partition_page(table, user_id, cursor, limit):
+    query = db.session.query(table).filter(table.c.user_id == user_id)
+    rows, _ = keyset_page(query, table.c.created_at, table.c.id, cursor, limit + 1)
+    return rows
+
+
+def alert_history(user_id, cursor, limit):
+    # Newest first across the hot table and the monthly partitions holding
+    # this user's alerts. Each partition is read through its (user_id,
+    # created_at) index, and older partitions are skipped once they can no
+    # longer reach the page. Raises ValueError for a bad cursor.
+    def sort_key(row):
+        return (row.created_at, row.id)
+
+    rows = _partition_page(alert_table, user_id, cursor, limit)
+    bound = sort_key(rows[-1]) if len(rows) > limit else None
+    for month in user_archive_months(user_id):
+        start, end = month_bounds(month)
+        if bound is not None and bound[0] >= end:
+            break
+        partition = _partition_page(alert_archive_table(month), user_id, cursor, limit)
+        if not partition:
+            continue
+        rows = sorted(rows + partition, key=sort_key, reverse=True)[:limit + 1]
+        if len(rows) > limit:
+            bound = sort_key(rows[-1])
+
+    return rows[:limit], len(rows) > limit
+
+
+class _Archiver:
+    def __init__(self, app):
+        self.app = app
+        self.archive_after = timedelta(days=app.config['ALERT_ARCHIVE_AFTER_DAYS'])
+        self.interval = app.config['ALERT_ARCHIVE_INTERVAL']
+        self.batch_size = app.config['ALERT_ARCHIVE_BATCH_SIZE']
+        self.lock_path = app.config['ALERT_ARCHIVE_LOCK_PATH'] or \
+            os.path.join(app.instance_path, 'alert-archiver.lock')
+        self._lock_file = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='alert-archiver', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _leading(self):
+        # Every worker runs this thread, but only the one holding an
+        # exclusive flock on the lock file archives. The lock goes with its
+        # process, and another worker takes over on its next tick.
+        if fcntl is None:
+            return True
+        if self._lock_file is None:
+            self._lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+
+    def compact(self, now=None):
+        # Moves closed alerts older than the cutoff into their month's
+        # partition, one batch per transaction so SOS inserts never wait long
+        # on the write lock. Active alerts stay hot however old they are.
+        cutoff = (now or datetime.utcnow()) - self.archive_after
+        moved = 0
+        while not self._stopping.is_set():
+            batch = db.session.execute(
+                select(alert_table.c.id, alert_table.c.created_at)
+                .where(alert_table.c.status != 'active', alert_table.c.created_at < cutoff)
+                .order_by(alert_table.c.id)
+                .limit(self.batch_size)
+            ).all()
+            if not batch:
+                break
+
+            by_month = defaultdict(list)
+            for alert_id, created_at in batch:
+                by_month[month_key(created_at)].append(alert_id)
+
+            try:
+                for month, ids in by_month.items():
+                    archive = alert_archive_table(month)
+                    archive.create(db.session.connection(), checkfirst=True)
+                    moving = select(alert_table).where(alert_table.c.id.in_(ids))
+                    # Copy whatever is still there at write time: if these
+                    # rows were moved first, every statement is a no-op
+                    db.session.execute(
+                        insert(archive).from_select(
+                            [column.name for column in alert_table.columns], moving
+                        )
+                    )
+                    index_archive_months(db.session.connection(), month, moving.subquery())
+                    db.session.execute(delete(alert_table).where(alert_table.c.id.in_(ids)))
+                    # Closed alerts have nothing left to stream, track or send
+                    for table in ALERT_CHILD_TABLES:
+                        db.session.execute(delete(table).where(table.c.alert_id.in_(ids)))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            moved += len(batch)
+        return moved
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                if not self._leading():
+                    continue
+                with self.app.app_context():
+                    moved = self.compact()
+                if moved:
+                    logger.info("Archived %d alerts", moved)
+            except OperationalError as e:
+                logger.warning("Alert archiving deferred: %s", e.orig)
+            except Exception:
+                logger.exception("Alert archiving failed")
+
+
+class AlertArchive:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ALERT_ARCHIVE_AFTER_DAYS', 30)
+        app.config.setdefault('ALERT_ARCHIVE_INTERVAL', 3600)
+        app.config.setdefault('ALERT_ARCHIVE_BATCH_SIZE', 1000)
+        app.config.setdefault('ALERT_ARCHIVER_ENABLED', True)
+        # Defaults to alert-archiver.lock in the instance folder
+        app.config.setdefault('ALERT_ARCHIVE_LOCK_PATH', None)
+
+        archiver = _Archiver(app)
+        app.extensions['alert_archive'] = archiver
+        if app.config['ALERT_ARCHIVER_ENABLED']:
+            workers.register(app, 'alert_archive', archiver.start, archiver.stop)
+
+    def compact(self, now=None):
+        return current_app.extensions['alert_archive'].compact(now)
+
+    def history(self, user_id, cursor, limit):
+        return alert_history(user_id, cursor, limit)
+
+
+alert_archive = AlertArchive()
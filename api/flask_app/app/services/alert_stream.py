@@ -0,0 +1,314 @@
+import json
+import logging
+import queue
+import threading
+from collections import defaultdict
+from datetime import datetime
+
+from flask import Response, current_app, request
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models.alert import AlertEvent
+from app.services import workers
+
+logger = logging.getLogger(__name__)
+
+event_table = AlertEvent.__table__
+
+# A stream ends after sending one of these
+TERMINAL_EVENTS = ('cancelled', 'resolved')
+
+
+class StreamFull(Exception):
+    pass
+
+
+def record_event(alert_id, event_type, data):
+    # Joins the caller's transaction; call alert_stream.wake() after commit
+    db.session.execute(insert(event_table), {
+        'alert_id': alert_id,
+        'type': event_type,
+        'data': data,
+        'created_at': datetime.utcnow()
+    })
+
+
+def event_dict(row):
+    return {'id': row.id, 'alert_id': row.alert_id, 'type': row.type, 'data': row.data}
+
+
+def frame(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class _Subscriber:
+    # A stream served by a worker thread. The stream server has its own
+    # subscriber type that hands events to its event loop.
+    __slots__ = ('alert_id', 'queue', 'evicted')
+
+    def __init__(self, alert_id, queue_size):
+        self.alert_id = alert_id
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.evicted = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            return False
+        return True
+
+
+class _Hub:
+    # One dispatcher thread per process tails alert_event for the alerts
+    # someone is watching and fans new rows out to their subscribers, so the
+    # database cost is one query per tick no matter how many clients are
+    # watching, and none while nobody is.
+    # Tailing the table rather than publishing in-process also delivers
+    # events written by other workers.
+    def __init__(self, app):
+        self.app = app
+        self.queue_size = app.config['ALERT_STREAM_QUEUE_SIZE']
+        self.heartbeat = app.config['ALERT_STREAM_HEARTBEAT']
+        self.poll_interval = app.config['ALERT_STREAM_POLL_INTERVAL']
+        self.max_subscribers = app.config['ALERT_STREAM_MAX_SUBSCRIBERS']
+        self.replay_page = app.config['ALERT_STREAM_REPLAY_PAGE']
+        self.batch_size = 500
+        self._subscribers = defaultdict(set)
+        self._count = 0
+        self._last_id = None
+        # Bumped whenever an alert gains its first watcher
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self.evictions = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name='alert-stream', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise StreamFull()
+            if self._last_id is None:
+                # First watcher: start tailing from here. Anything older
+                # reaches the subscriber through its replay.
+                self._last_id = db.session.execute(
+                    select(func.max(event_table.c.id))
+                ).scalar() or 0
+            if subscriber.alert_id not in self._subscribers:
+                self._generation += 1
+            self._subscribers[subscriber.alert_id].add(subscriber)
+            self._count += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            watchers = self._subscribers.get(subscriber.alert_id)
+            if watchers and subscriber in watchers:
+                watchers.discard(subscriber)
+                self._count -= 1
+                if not watchers:
+                    del self._subscribers[subscriber.alert_id]
+
+    def publish(self, event):
+        with self._lock:
+            watchers = list(self._subscribers.get(event['alert_id'], ()))
+        for subscriber in watchers:
+            if not subscriber.offer(event):
+                self.evict(subscriber)
+
+    def evict(self, subscriber):
+        # Slow consumer: cut it loose instead of buffering without bound.
+        # The client reconnects with Last-Event-ID and catches up from the log.
+        subscriber.evicted = True
+        self.unsubscribe(subscriber)
+        with self._lock:
+            self.evictions += 1
+
+    def poll(self):
+        with self._lock:
+            if not self._subscribers:
+                self._last_id = None
+                return 0
+            last_id = self._last_id
+            alert_ids = list(self._subscribers)
+            generation = self._generation
+
+        # One JSON parameter rather than one per alert, so the statement has
+        # a single shape and no variable limit however many alerts are watched
+        watched = func.json_each(json.dumps(alert_ids)).table_valued('value')
+        rows = db.session.execute(
+            select(event_table)
+            .where(event_table.c.id > last_id,
+                   event_table.c.alert_id.in_(select(watched.c.value)))
+            .order_by(event_table.c.id)
+            .limit(self.batch_size)
+        ).all()
+        for row in rows:
+            self.publish(event_dict(row))
+        if rows:
+            with self._lock:
+                # An alert watched since the query started may have events
+                # below these rows; leave them for the next poll, and let
+                # streams drop the repeats by id
+                if self._last_id is not None and self._generation == generation:
+                    self._last_id = max(self._last_id, rows[-1].id)
+        return len(rows)
+
+    def replay(self, alert_id, after_id):
+        # The next page of events after after_id, oldest first
+        rows = db.session.execute(
+            select(event_table)
+            .where(event_table.c.alert_id == alert_id, event_table.c.id > after_id)
+            .order_by(event_table.c.id)
+            .limit(self.replay_page)
+        ).all()
+        return [event_dict(row) for row in rows]
+
+    def stats(self):
+        return {'subscribers': self._count, 'evictions': self.evictions}
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    while self.poll() == self.batch_size:
+                        pass
+            except OperationalError as e:
+                logger.warning("Alert stream poll deferred: %s", e.orig)
+            except Exception:
+                logger.exception("Alert stream poll failed")
+
+
+class AlertStream:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ALERT_STREAM_QUEUE_SIZE', 64)
+        app.config.setdefault('ALERT_STREAM_HEARTBEAT', 15)
+        app.config.setdefault('ALERT_STREAM_POLL_INTERVAL', 1.0)
+        # Per process. Under a threaded server every open stream holds a
+        # worker thread, so keep this well below the threads left over after
+        # ADMISSION_CONCURRENCY; gunicorn.conf.py derives it from `threads`.
+        # Streams beyond it get a 503. In production streams go to the stream
+        # server (flask alerts serve-streams), where an idle stream is a
+        # coroutine and a socket, and ALERT_STREAM_SERVER_MAX_SUBSCRIBERS
+        # applies instead.
+        app.config.setdefault('ALERT_STREAM_MAX_SUBSCRIBERS', 16)
+        app.config.setdefault('ALERT_STREAM_SERVER_MAX_SUBSCRIBERS', 10000)
+        # Threads for the stream server's handshakes and replays
+        app.config.setdefault('ALERT_STREAM_SERVER_THREADS', 8)
+        # Events per replay query; a reconnecting client gets every event
+        # after its Last-Event-ID, a page at a time
+        app.config.setdefault('ALERT_STREAM_REPLAY_PAGE', 200)
+        app.config.setdefault('ALERT_STREAM_ENABLED', True)
+
+        hub = _Hub(app)
+        app.extensions['alert_stream'] = hub
+        if app.config['ALERT_STREAM_ENABLED']:
+            workers.register(app, 'alert_stream', hub.start, hub.stop)
+
+    @property
+    def _hub(self):
+        return current_app.extensions['alert_stream']
+
+    def wake(self):
+        hub = current_app.extensions.get('alert_stream')
+        if hub is not None:
+            hub.wake()
+
+    def stats(self):
+        return self._hub.stats()
+
+    def stream(self, alert_id, last_event_id=0):
+        # Subscribe before replaying so nothing committed in between is
+        # missed; duplicates are dropped by event id. Raises StreamFull.
+        hub = self._hub
+        # Set by the stream server, which writes the events itself
+        handoff = request.environ.get('safenest.stream_handoff')
+        if handoff is not None:
+            subscriber = handoff.subscriber(alert_id)
+        else:
+            subscriber = _Subscriber(alert_id, hub.queue_size)
+        hub.subscribe(subscriber)
+        try:
+            backlog = hub.replay(alert_id, last_event_id)
+        except Exception:
+            hub.unsubscribe(subscriber)
+            raise
+        # The stream may stay open for hours; don't pin a pooled connection
+        db.session.close()
+
+        headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        if handoff is not None:
+            handoff.accept(subscriber, last_event_id, backlog)
+            return Response(mimetype='text/event-stream', headers=headers)
+
+        def generate():
+            last_id = last_event_id
+            page = backlog
+            try:
+                yield f"retry: {int(hub.poll_interval * 1000) + 1000}\n\n"
+                while page:
+                    for event in page:
+                        last_id = event['id']
+                        yield frame(event)
+                        if event['type'] in TERMINAL_EVENTS:
+                            return
+                    if len(page) < hub.replay_page:
+                        break
+                    # Outside the request by now; the context closes the
+                    # session again once the page is read
+                    with hub.app.app_context():
+                        page = hub.replay(alert_id, last_id)
+                while True:
+                    if subscriber.evicted:
+                        yield "event: evicted\ndata: {}\n\n"
+                        return
+                    try:
+                        event = subscriber.queue.get(timeout=hub.heartbeat)
+                    except queue.Empty:
+                        # Comment frame: keeps proxies from timing the
+                        # connection out and surfaces dead clients
+                        yield ": heartbeat\n\n"
+                        continue
+                    if event['id'] <= last_id:
+                        continue
+                    last_id = event['id']
+                    yield frame(event)
+                    if event['type'] in TERMINAL_EVENTS:
+                        return
+            finally:
+                hub.unsubscribe(subscriber)
+
+        response = Response(generate(), mimetype='text/event-stream', headers=headers)
+        # Also covers clients that disconnect before the first frame
+        response.call_on_close(lambda: hub.unsubscribe(subscriber))
+        return response
+
+
+alert_stream = AlertStream()
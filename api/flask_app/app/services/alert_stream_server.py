@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.datastructures import Headers
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from app.services.alert_stream import TERMINAL_EVENTS, frame
+
+logger = logging.getLogger(__name__)
+
+# Alert streams are long-lived and almost always idle. Under a threaded WSGI
+# server each one holds a worker thread for hours; here an idle stream is a
+# coroutine and a socket, so one process can hold thousands. The handshake
+# (JWT, revocation, access check, replay) still runs through the Flask app
+# on a small thread pool; only the waiting happens on the event loop.
+#
+#   flask --app wsgi:production_app alerts serve-streams --port 5001
+#
+# with the reverse proxy sending GET /api/alerts/<id>/stream here.
+
+STREAM_PATH = re.compile(r'/api/alerts/\d+/stream')
+MAX_REQUEST_HEAD = 16 * 1024
+REQUEST_HEAD_TIMEOUT = 10
+
+
+class _LoopSubscriber:
+    # Lives on the event loop. The hub's dispatcher thread hands it events
+    # through call_soon_threadsafe, never touching the asyncio queue itself.
+    __slots__ = ('alert_id', 'queue', 'evicted', 'hub', 'loop')
+
+    def __init__(self, hub, loop, alert_id):
+        self.alert_id = alert_id
+        self.queue = asyncio.Queue(maxsize=hub.queue_size)
+        self.evicted = False
+        self.hub = hub
+        self.loop = loop
+
+    def offer(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Loop closed: the server is shutting down
+            pass
+        return True
+
+    def _put(self, event):
+        if self.evicted:
+            return
+        if self.queue.full():
+            self.hub.evict(self)
+        else:
+            self.queue.put_nowait(event)
+
+
+class _Handoff:
+    # Passed to the Flask route in the WSGI environ; AlertStream.stream()
+    # subscribes with it and leaves the events to the event loop
+    def __init__(self, hub, loop):
+        self.hub = hub
+        self.loop = loop
+        self.accepted = None
+
+    def subscriber(self, alert_id):
+        return _LoopSubscriber(self.hub, self.loop, alert_id)
+
+    def accept(self, subscriber, last_event_id, backlog):
+        self.accepted = (subscriber, last_event_id, backlog)
+
+
+def _write_head(writer, status, headers, streaming=False):
+    lines = [f'HTTP/1.1 {status}']
+    for name, value in headers:
+        lowered = name.lower()
+        if lowered == 'connection' or (streaming and lowered == 'content-length'):
+            continue
+        lines.append(f'{name}: {value}')
+    # The body of a stream runs until the connection closes
+    lines.append('Connection: close')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+
+class StreamServer:
+    def __init__(self, app):
+        self.app = app
+        self.hub = app.extensions['alert_stream']
+        self.hub.max_subscribers = app.config['ALERT_STREAM_SERVER_MAX_SUBSCRIBERS']
+        self.executor = ThreadPoolExecutor(app.config['ALERT_STREAM_SERVER_THREADS'],
+                                           thread_name_prefix='alert-stream-server')
+
+    def run(self, host, port):
+        self.hub.start()
+        try:
+            asyncio.run(self.serve(host, port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=False)
+            self.hub.stop(5)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self._handle, host, port, limit=MAX_REQUEST_HEAD,
+                                            backlog=1024)
+        logger.info("Serving alert streams on %s", ', '.join(
+            str(sock.getsockname()) for sock in server.sockets))
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        try:
+            await self._serve(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError):
+            pass
+        except Exception:
+            logger.exception("Alert stream connection failed")
+        finally:
+            writer.close()
+
+    async def _serve(self, reader, writer):
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), REQUEST_HEAD_TIMEOUT)
+        request_line, *header_lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            _write_head(writer, '400 BAD REQUEST', [('Content-Length', '0')])
+            return
+        path, _, query = target.partition('?')
+        if method != 'GET' or not STREAM_PATH.fullmatch(path):
+            body = b'{"error": "Not found"}'
+            _write_head(writer, '404 NOT FOUND', [('Content-Type', 'application/json'),
+                                                  ('Content-Length', str(len(body)))])
+            writer.write(body)
+            await writer.drain()
+            return
+
+        headers = Headers()
+        for line in header_lines:
+            name, _, value = line.partition(':')
+            if name:
+                headers.add(name.strip(), value.strip())
+        loop = asyncio.get_running_loop()
+        handoff = _Handoff(self.hub, loop)
+        peer = writer.get_extra_info('peername')
+        environ = EnvironBuilder(path=path, query_string=query, headers=headers, environ_base={
+            'REMOTE_ADDR': peer[0] if peer else '',
+            'safenest.stream_handoff': handoff
+        }).get_environ()
+
+        body, status, response_headers = await loop.run_in_executor(
+            self.executor, run_wsgi_app, self.app, environ, True
+        )
+        if handoff.accepted is None or not status.startswith('200'):
+            if handoff.accepted is not None:
+                self.hub.unsubscribe(handoff.accepted[0])
+            _write_head(writer, status, response_headers)
+            writer.write(b''.join(body))
+            await writer.drain()
+            return
+
+        subscriber, last_event_id, backlog = handoff.accepted
+        try:
+            _write_head(writer, status, response_headers, streaming=True)
+            await self._stream(writer, subscriber, last_event_id, backlog)
+        finally:
+            self.hub.unsubscribe(subscriber)
+
+    def _replay(self, alert_id, after_id):
+        with self.app.app_context():
+            return self.hub.replay(alert_id, after_id)
+
+    async def _stream(self, writer, subscriber, last_id, page):
+        # Same frames as the threaded generator in AlertStream.stream()
+        hub = self.hub
+        loop = asyncio.get_running_loop()
+        writer.write(f"retry: {int(hub.poll_interval * 1000) + 1000}\n\n".encode())
+        while page:
+            for event in page:
+                last_id = event['id']
+                writer.write(frame(event).encode())
+                if event['type'] in TERMINAL_EVENTS:
+                    await writer.drain()
+                    return
+            await writer.drain()
+            if len(page) < hub.replay_page:
+                break
+            page = await loop.run_in_executor(self.executor, self._replay, subscriber.alert_id, last_id)
+        while True:
+            if subscriber.evicted:
+                writer.write(b"event: evicted\ndata: {}\n\n")
+                await writer.drain()
+                return
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), hub.heartbeat)
+            except asyncio.TimeoutError:
+                writer.write(b": heartbeat\n\n")
+                await writer.drain()
+                continue
+            if event['id'] <= last_id:
+                continue
+            last_id = event['id']
+            writer.write(frame(event).encode())
+            await writer.drain()
+            if event['type'] in TERMINAL_EVENTS:
+                return
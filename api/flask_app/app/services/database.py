@@ -0,0 +1,100 @@
+from functools import wraps
+
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+# Imported by app/__init__ before `db` exists, so this module must not import
+# from `app` at load time.
+
+PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',       # readers no longer block on the writer
+    'synchronous': 'NORMAL',     # fsync at checkpoints, safe with WAL
+    'temp_store': 'MEMORY',
+}
+
+
+class RoutingSession(Session):
+    # Inside a route marked @read_only, plain SELECTs go to the read-only
+    # pool; DML, flushes and everything outside such routes use the writer.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and isinstance(clause, Select) and has_app_context() \
+                and g.get('db_read_only'):
+            reader = current_app.extensions.get('db_reader')
+            if reader is not None:
+                return reader
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _is_file_database(url):
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+        and not url.database.startswith('file::memory:')
+
+
+def _install_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def configure_engine(app):
+    # Must run before db.init_app so the engine options are in place
+    app.config.setdefault('SQLITE_PROFILE', 'production')  # or 'default'
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config.setdefault('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    app.config.setdefault('SQLITE_CACHE_SIZE_KB', 64 * 1024)
+    # SQLite allows one writer at a time, so a big writer pool only queues
+    # inside SQLite; readers scale with threads
+    app.config.setdefault('SQLITE_WRITER_POOL_SIZE', 4)
+    app.config.setdefault('SQLITE_READER_POOL_SIZE', 16)
+
+    if app.config['SQLITE_PROFILE'] != 'production':
+        return
+    if not _is_file_database(make_url(app.config['SQLALCHEMY_DATABASE_URI'])):
+        return
+
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config['SQLITE_WRITER_POOL_SIZE'])
+    options.setdefault('max_overflow', app.config['SQLITE_WRITER_POOL_SIZE'])
+    options.setdefault('connect_args', {}).setdefault(
+        'timeout', app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000
+    )
+
+
+def init_engines(app, engine):
+    # Runs after db.init_app, in an app context, with the writer engine
+    if app.config['SQLITE_PROFILE'] != 'production' or engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = dict(
+        PRODUCTION_PRAGMAS,
+        busy_timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'],
+        mmap_size=app.config['SQLITE_MMAP_SIZE'],
+        cache_size=-app.config['SQLITE_CACHE_SIZE_KB']
+    )
+    _install_pragmas(engine, pragmas)
+
+    if not _is_file_database(engine.url):
+        return
+
+    reader = create_engine(
+        engine.url,
+        pool_size=app.config['SQLITE_READER_POOL_SIZE'],
+        max_overflow=app.config['SQLITE_READER_POOL_SIZE'],
+        connect_args={'timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    )
+    _install_pragmas(reader, dict(pragmas, query_only='ON'))
+    app.extensions['db_reader'] = reader
@@ -0,0 +1,50 @@
+import math
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app import db
+from app.models.post import Post
+
+# Reddit-style "hot" score: log-scaled engagement plus a term that grows with
+# post time. Unlike an age-decay formula it doesn't change as the clock moves,
+# so it is stored on the row, indexed, and only rewritten when engagement does.
+HOT_EPOCH = datetime(2023, 1, 1)
+HOT_HALF_LIFE_SECONDS = 45000
+COMMENT_WEIGHT = 2
+
+
+def hot_score(likes, comments_count, created_at):
+    engagement = likes + COMMENT_WEIGHT * comments_count
+    order = math.log10(max(engagement, 1))
+    age = (created_at - HOT_EPOCH).total_seconds()
+    return round(order + age / HOT_HALF_LIFE_SECONDS, 7)
+
+
+def adjust_counters(post_id, likes=0, comments=0):
+    # Counters move with a relative UPDATE (no read-modify-write race) and the
+    # hot score is recomputed from the values that statement returned, inside
+    # the caller's transaction. Returns the new counters, or None if the post
+    # doesn't exist.
+    #
+    # Counters alone don't invalidate cached feed pages, or every like would
+    # throw away the whole feed cache: cached pages show counts up to their
+    # TTL old, and the like response carries the live count.
+    row = db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(likes=Post.likes + likes,
+                comments_count=Post.comments_count + comments)
+        .returning(Post.likes, Post.comments_count, Post.created_at)
+        .execution_options(synchronize_session=False, response_cache_invalidate=False)
+    ).first()
+    if row is None:
+        return None
+
+    db.session.execute(
+        update(Post)
+        .where(Post.id == post_id)
+        .values(hot_score=hot_score(row.likes, row.comments_count, row.created_at))
+        .execution_options(synchronize_session=False, response_cache_invalidate=False)
+    )
+    return row
@@ -0,0 +1,45 @@
+import math
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def parse_point(lat, lng):
+    # float() takes numeric strings, 'nan' and 'inf'; the range check rejects
+    # the last two. Raises TypeError or ValueError.
+    lat, lng = float(lat), float(lng)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('coordinate out of range')
+    return lat, lng
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_boxes(lat, lng, radius_m):
+    # Returns (south, north, west, east) boxes covering the circle. The box
+    # is split in two when it crosses the antimeridian. A small pad absorbs
+    # the R*Tree's 32-bit float rounding.
+    pad = 1e-5
+    dlat = radius_m / METERS_PER_DEGREE_LAT
+    south = max(-90.0, lat - dlat - pad)
+    north = min(90.0, lat + dlat + pad)
+
+    cos_lat = math.cos(math.radians(max(abs(south), abs(north))))
+    if cos_lat < 1e-6 or north >= 90.0 or south <= -90.0:
+        return [(south, north, -180.0, 180.0)]
+
+    dlng = min(180.0, dlat / cos_lat + pad)
+    west = lng - dlng
+    east = lng + dlng
+    if west < -180.0:
+        return [(south, north, west + 360.0, 180.0), (south, north, -180.0, east)]
+    if east > 180.0:
+        return [(south, north, west, 180.0), (south, north, -180.0, east - 360.0)]
+    return [(south, north, west, east)]
@@ -0,0 +1,278 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.wrappers import Response
+
+from app import db
+from app.models.idempotency import IdempotencyKey
+
+key_table = IdempotencyKey.__table__
+
+MAX_KEY_LENGTH = 255
+
+
+class _Stored:
+    __slots__ = ('fingerprint', 'status_code', 'body', 'mimetype', 'expires_at')
+
+    def __init__(self, fingerprint, status_code, body, mimetype, expires_at):
+        self.fingerprint = fingerprint
+        self.status_code = status_code
+        self.body = body
+        self.mimetype = mimetype
+        self.expires_at = expires_at
+
+
+def _error(status, message, retry_after=None):
+    response = jsonify({"error": message})
+    response.status_code = status
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+class _KeyStore:
+    # Three layers, cheapest first: an LRU of finished responses, an
+    # in-process table of requests still running (duplicates wait on their
+    # event), and the idempotency_key table, which covers other workers and
+    # restarts. The table row is claimed before the view runs, so exactly
+    # one request per key reaches the write path, and views that write store
+    # their response in that row inside their own transaction (see
+    # Idempotency.record), so a crash can't leave the write committed and
+    # the key free to run again.
+    def __init__(self, app):
+        self.cache_size = app.config['IDEMPOTENCY_CACHE_SIZE']
+        self.ttl = timedelta(seconds=app.config['IDEMPOTENCY_TTL'])
+        self.wait_timeout = app.config['IDEMPOTENCY_WAIT_TIMEOUT']
+        # A pending row older than this belongs to a worker that died
+        self.lock_timeout = timedelta(seconds=app.config['IDEMPOTENCY_LOCK_TIMEOUT'])
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._next_prune = 0.0
+
+    def _recall(self, key):
+        with self._lock:
+            stored = self._cache.get(key)
+            if stored is None:
+                return None
+            if stored.expires_at <= datetime.utcnow():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return stored
+
+    def _remember(self, key, stored):
+        with self._lock:
+            self._cache[key] = stored
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _claim(self, connection, key, fingerprint, now):
+        claimed = connection.execute(
+            sqlite_insert(key_table)
+            .values(key=key, fingerprint=fingerprint, status='pending',
+                    created_at=now, expires_at=now + self.ttl)
+            .on_conflict_do_nothing()
+            .returning(key_table.c.key)
+        ).first()
+        if claimed is None:
+            # Take over a key whose owner died, or one that expired but
+            # hasn't been pruned yet
+            claimed = connection.execute(
+                update(key_table)
+                .where(key_table.c.key == key,
+                       or_(key_table.c.expires_at < now,
+                           (key_table.c.status == 'pending')
+                           & (key_table.c.created_at < now - self.lock_timeout)))
+                .values(fingerprint=fingerprint, status='pending', response_status=None,
+                        response_body=None, response_mimetype=None,
+                        created_at=now, expires_at=now + self.ttl)
+                .returning(key_table.c.key)
+            ).first()
+        return claimed is not None
+
+    def _prune(self, connection, now):
+        if time.monotonic() < self._next_prune:
+            return
+        self._next_prune = time.monotonic() + 60
+        connection.execute(delete(key_table).where(key_table.c.expires_at < now))
+
+    def _acquire(self, key, fingerprint):
+        # Returns None once this request owns the key, otherwise the response
+        # to send: the stored one, or an error
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            now = datetime.utcnow()
+            with db.engine.begin() as connection:
+                self._prune(connection, now)
+                if self._claim(connection, key, fingerprint, now):
+                    return None
+                row = connection.execute(
+                    select(key_table).where(key_table.c.key == key)
+                ).first()
+
+            if row is not None and row.fingerprint != fingerprint:
+                return self._mismatch()
+            if row is not None and row.status == 'done':
+                stored = _Stored(row.fingerprint, row.response_status, row.response_body,
+                                 row.response_mimetype, row.expires_at)
+                self._remember(key, stored)
+                return self._replay(stored, fingerprint)
+            # Still running in another worker
+            if time.monotonic() >= deadline:
+                return self._busy()
+            time.sleep(0.05)
+
+    def _complete(self, connection, key, stored):
+        connection.execute(
+            update(key_table)
+            .where(key_table.c.key == key, key_table.c.status == 'pending')
+            .values(status='done', response_status=stored.status_code,
+                    response_body=stored.body, response_mimetype=stored.mimetype)
+        )
+
+    def record(self, response):
+        # Inside the view's transaction: the row commits with its writes
+        pending = g.get('idempotency')
+        if pending is None:
+            return
+        key, fingerprint = pending
+        stored = _Stored(fingerprint, response.status_code, response.get_data(),
+                         response.mimetype, datetime.utcnow() + self.ttl)
+        self._complete(db.session, key, stored)
+        g.idempotency_recorded = stored
+
+    def _release(self, key):
+        # The request failed: let a retry run it again
+        with db.engine.begin() as connection:
+            connection.execute(
+                delete(key_table)
+                .where(key_table.c.key == key, key_table.c.status == 'pending')
+            )
+
+    def _mismatch(self):
+        return _error(422, "Idempotency-Key was already used for a different request")
+
+    def _busy(self):
+        return _error(409, "A request with this Idempotency-Key is still in progress",
+                      retry_after=1)
+
+    def _replay(self, stored, fingerprint):
+        if stored.fingerprint != fingerprint:
+            return self._mismatch()
+        response = Response(stored.body, status=stored.status_code, mimetype=stored.mimetype)
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def handle(self, key, fingerprint, run):
+        while True:
+            stored = self._recall(key)
+            if stored is not None:
+                return self._replay(stored, fingerprint)
+
+            with self._lock:
+                running = self._inflight.get(key)
+                if running is None:
+                    running = self._inflight[key] = threading.Event()
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                # A duplicate in this process: wait for the first one, then
+                # replay its response (or run it ourselves if it failed)
+                if not running.wait(self.wait_timeout):
+                    return self._busy()
+                continue
+
+            try:
+                return self._run(key, fingerprint, run)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                running.set()
+
+    def _run(self, key, fingerprint, run):
+        response = self._acquire(key, fingerprint)
+        if response is not None:
+            return response
+
+        g.idempotency = (key, fingerprint)
+        try:
+            response = make_response(run())
+        except Exception:
+            # Drop the view's uncommitted writes first; they hold SQLite's
+            # write lock
+            g.pop('idempotency_recorded', None)
+            db.session.rollback()
+            self._release(key)
+            raise
+        finally:
+            g.pop('idempotency', None)
+
+        stored = g.pop('idempotency_recorded', None)
+        if stored is None:
+            # The view wrote nothing, or failed before committing
+            db.session.rollback()
+            if response.status_code >= 500:
+                self._release(key)
+                return response
+            stored = _Stored(fingerprint, response.status_code, response.get_data(),
+                             response.mimetype, datetime.utcnow() + self.ttl)
+            with db.engine.begin() as connection:
+                self._complete(connection, key, stored)
+        self._remember(key, stored)
+        return response
+
+
+class Idempotency:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IDEMPOTENCY_TTL', 24 * 60 * 60)
+        app.config.setdefault('IDEMPOTENCY_CACHE_SIZE', 2048)
+        app.config.setdefault('IDEMPOTENCY_WAIT_TIMEOUT', 10)
+        app.config.setdefault('IDEMPOTENCY_LOCK_TIMEOUT', 60)
+
+        app.extensions['idempotency'] = _KeyStore(app)
+
+    def idempotent(self, view):
+        # Place under @jwt_required(): keys are scoped to the user and route.
+        # Requests without an Idempotency-Key header run as before; a retry
+        # with the same key and body gets the first response back without
+        # running the view, and a different body gets a 422.
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header = request.headers.get('Idempotency-Key')
+            if not header:
+                return view(*args, **kwargs)
+            if len(header) > MAX_KEY_LENGTH:
+                return _error(400, f"Idempotency-Key is limited to {MAX_KEY_LENGTH} characters")
+
+            key = f'{get_jwt_identity()}:{request.method}:{request.path}:{header}'
+            fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+            store = current_app.extensions['idempotency']
+            return store.handle(key, fingerprint, lambda: view(*args, **kwargs))
+        return wrapper
+
+    def record(self, rv):
+        # Views that write call this with their response just before
+        # committing, so the stored response commits with the write.
+        # Returns the response to send; a no-op without an Idempotency-Key.
+        response = make_response(rv)
+        current_app.extensions['idempotency'].record(response)
+        return response
+
+
+idempotency = Idempotency()
@@ -0,0 +1,263 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models.alert import Alert, AlertEvent, AlertLocation
+from app.services.alert_stream import alert_stream
+from app.services.geo import parse_point
+from app.services import workers
+
+logger = logging.getLogger(__name__)
+
+
+class _AlertTrack:
+    __slots__ = ('user_id', 'pending', 'latest', 'dropped', 'touched')
+
+    def __init__(self, user_id, buffer_size):
+        self.user_id = user_id
+        # Ring buffer: if the flusher falls behind, the oldest unflushed
+        # pings are dropped rather than letting memory grow without bound
+        self.pending = deque(maxlen=buffer_size)
+        self.latest = None
+        self.dropped = 0
+        self.touched = time.monotonic()
+
+
+class _LocationBuffer:
+    def __init__(self, app):
+        self.app = app
+        self.buffer_size = app.config['LOCATION_BUFFER_SIZE']
+        self.flush_interval = app.config['LOCATION_FLUSH_INTERVAL']
+        self.track_idle = app.config['LOCATION_TRACK_IDLE']
+        self._tracks = {}
+        # Alerts with unflushed pings, so a tick doesn't walk every track
+        self._dirty = set()
+        self._next_sweep = time.monotonic() + self.track_idle
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='location-flusher', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def track(self, alert_id, user_id):
+        with self._lock:
+            if alert_id not in self._tracks:
+                self._tracks[alert_id] = _AlertTrack(user_id, self.buffer_size)
+
+    def forget(self, *alert_ids):
+        with self._lock:
+            for alert_id in alert_ids:
+                self._tracks.pop(alert_id, None)
+                self._dirty.discard(alert_id)
+
+    def owner(self, alert_id):
+        track = self._tracks.get(alert_id)
+        return track.user_id if track else None
+
+    def append(self, alert_id, pings):
+        # False if the track was dropped meanwhile (cancelled or idle)
+        with self._lock:
+            track = self._tracks.get(alert_id)
+            if track is None:
+                return False
+            track.touched = time.monotonic()
+            self._dirty.add(alert_id)
+            for ping in pings:
+                if len(track.pending) == track.pending.maxlen:
+                    track.dropped += 1
+                track.pending.append(ping)
+                if track.latest is None or ping['recorded_at'] >= track.latest['recorded_at']:
+                    track.latest = ping
+        return True
+
+    def latest(self, alert_id):
+        track = self._tracks.get(alert_id)
+        return track.latest if track else None
+
+    def _drain(self):
+        rows = []
+        latest = []
+        with self._lock:
+            for alert_id in self._dirty:
+                track = self._tracks[alert_id]
+                rows.extend(dict(ping, alert_id=alert_id) for ping in track.pending)
+                track.pending.clear()
+                latest.append((alert_id, track.latest))
+            self._dirty.clear()
+
+            # Tracks idle this long are dropped; a later ping re-reads the
+            # alert and tracks it again if it's still active
+            now = time.monotonic()
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.track_idle
+                for alert_id in [alert_id for alert_id, track in self._tracks.items()
+                                 if now - track.touched > self.track_idle]:
+                    del self._tracks[alert_id]
+        return rows, latest
+
+    def flush(self):
+        rows, latest = self._drain()
+        if not rows:
+            return 0
+
+        # One transaction per tick: a bulk UPDATE moving each alert to its
+        # newest position, a bulk INSERT for every buffered ping, and one
+        # stream event per alert with that position. The UPDATE goes first so
+        # the transaction holds the write lock before alert status is read:
+        # an alert cancelled on any worker can't take pings after its
+        # 'cancelled' event, and its track is dropped here.
+        alert_table = Alert.__table__
+        try:
+            db.session.execute(
+                update(alert_table)
+                .where(alert_table.c.id == bindparam('b_id'), alert_table.c.status == 'active')
+                .values(latitude=bindparam('b_lat'), longitude=bindparam('b_lng')),
+                [{'b_id': alert_id, 'b_lat': ping['latitude'], 'b_lng': ping['longitude']}
+                 for alert_id, ping in latest]
+            )
+            active = set(db.session.scalars(
+                select(alert_table.c.id).where(
+                    alert_table.c.id.in_([alert_id for alert_id, _ in latest]),
+                    alert_table.c.status == 'active'
+                )
+            ))
+            inactive = [alert_id for alert_id, _ in latest if alert_id not in active]
+            if inactive:
+                rows = [row for row in rows if row['alert_id'] in active]
+                latest = [(alert_id, ping) for alert_id, ping in latest if alert_id in active]
+                self.forget(*inactive)
+            if not rows:
+                db.session.commit()
+                return 0
+            db.session.execute(insert(AlertLocation), rows)
+            db.session.execute(insert(AlertEvent.__table__), [{
+                'alert_id': alert_id,
+                'type': 'location',
+                'data': {
+                    'lat': ping['latitude'],
+                    'lng': ping['longitude'],
+                    'accuracy': ping['accuracy'],
+                    'recorded_at': ping['recorded_at'].isoformat()
+                },
+                'created_at': datetime.utcnow()
+            } for alert_id, ping in latest])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._requeue(rows)
+            raise
+        alert_stream.wake()
+        return len(rows)
+
+    def _requeue(self, rows):
+        # Back in front of anything buffered since, in their original order;
+        # on a full ring the oldest pings are the ones dropped, as in append
+        with self._lock:
+            for row in reversed(rows):
+                alert_id = row.pop('alert_id')
+                track = self._tracks.get(alert_id)
+                if track is None:
+                    continue
+                self._dirty.add(alert_id)
+                if len(track.pending) == track.pending.maxlen:
+                    track.dropped += 1
+                    continue
+                track.pending.appendleft(row)
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except OperationalError as e:
+                logger.warning("Location flush deferred: %s", e.orig)
+            except Exception:
+                logger.exception("Location flush failed")
+        # Last flush so a clean shutdown doesn't lose buffered pings
+        with self.app.app_context():
+            self.flush()
+
+
+class LocationTracker:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOCATION_BUFFER_SIZE', 300)
+        app.config.setdefault('LOCATION_FLUSH_INTERVAL', 1.0)
+        app.config.setdefault('LOCATION_FLUSHER_ENABLED', True)
+        # Seconds without a ping before a track is dropped from memory
+        app.config.setdefault('LOCATION_TRACK_IDLE', 300)
+
+        buffer = _LocationBuffer(app)
+        app.extensions['locations'] = buffer
+        if app.config['LOCATION_FLUSHER_ENABLED']:
+            workers.register(app, 'locations', buffer.start, buffer.stop)
+
+    @property
+    def _buffer(self):
+        return current_app.extensions['locations']
+
+    def track(self, alert_id, user_id):
+        self._buffer.track(alert_id, user_id)
+
+    def forget(self, alert_id):
+        self._buffer.forget(alert_id)
+
+    def owner(self, alert_id):
+        return self._buffer.owner(alert_id)
+
+    def append(self, alert_id, pings):
+        return self._buffer.append(alert_id, pings)
+
+    def latest(self, alert_id):
+        return self._buffer.latest(alert_id)
+
+    def flush(self):
+        return self._buffer.flush()
+
+
+def parse_ping(data):
+    # Raises KeyError, TypeError or ValueError for anything but a ping object
+    if not isinstance(data, dict):
+        raise TypeError('ping must be an object')
+    recorded_at = data.get('timestamp')
+    if recorded_at is not None and not isinstance(recorded_at, str):
+        raise TypeError('timestamp must be an ISO 8601 string')
+    if recorded_at:
+        recorded_at = datetime.fromisoformat(recorded_at.replace('Z', '+00:00'))
+        if recorded_at.tzinfo is not None:
+            recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+    latitude, longitude = parse_point(data['lat'], data['lng'])
+    ping = {
+        'latitude': latitude,
+        'longitude': longitude,
+        'accuracy': float(data['accuracy']) if data.get('accuracy') is not None else None,
+        'recorded_at': recorded_at or datetime.utcnow()
+    }
+    # float() accepts 'nan' and 'inf'
+    if not math.isfinite(ping['accuracy'] or 0):
+        raise ValueError('non-finite accuracy')
+    return ping
+
+
+locations = LocationTracker()
@@ -0,0 +1,276 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class _Histogram:
+    # Cumulative Prometheus histogram, one series per label tuple
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_values, value):
+        # Called with the registry lock held
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self, lines):
+        lines.append(f'# HELP {self.name} {self.help_text}')
+        lines.append(f'# TYPE {self.name} histogram')
+        for label_values, (counts, total) in sorted(self._series.items()):
+            labels = _labels(self.labels, label_values)
+            running = 0
+            for bound, count in zip(self.buckets, counts):
+                running += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {running}')
+            running += counts[-1]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {running}')
+            lines.append(f'{self.name}_sum{{{labels}}} {round(total, 6)}')
+            lines.append(f'{self.name}_count{{{labels}}} {running}')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _render_counter(lines, name, help_text, kind, labels, values):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+    for label_values, value in sorted(values.items()):
+        if labels:
+            lines.append(f'{name}{{{_labels(labels, label_values)}}} {value}')
+        else:
+            lines.append(f'{name} {value}')
+
+
+class _RequestStats:
+    __slots__ = ('started', 'queries', 'sql_seconds', 'statements', 'flagged', 'status', 'streamed')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = Counter()
+        self.flagged = set()
+        self.status = None
+        self.streamed = False
+
+
+class _Registry:
+    # Per-process numbers. With several workers each one serves its own
+    # /api/metrics; scrape them individually or aggregate in Prometheus.
+    def __init__(self, app):
+        self.n_plus_one_threshold = app.config['METRICS_N_PLUS_ONE_THRESHOLD']
+        self.explain = app.config['METRICS_EXPLAIN_QUERIES']
+        self._lock = threading.Lock()
+        self.latency = _Histogram(
+            'safenest_http_request_duration_seconds', 'Request latency by blueprint.',
+            ('blueprint',), LATENCY_BUCKETS
+        )
+        self.request_queries = _Histogram(
+            'safenest_http_request_sql_queries', 'SQL statements run per request.',
+            ('blueprint',), QUERY_BUCKETS
+        )
+        self.request_sql = _Histogram(
+            'safenest_http_request_sql_seconds', 'Time spent in SQL per request.',
+            ('blueprint',), LATENCY_BUCKETS
+        )
+        self.requests = Counter()
+        self.queries = Counter()
+        self.sql_seconds = Counter()
+        self.n_plus_one = Counter()
+        self._explained = set()
+
+    # Request hooks
+
+    def before_request(self):
+        g.metrics = _RequestStats()
+
+    def after_request(self, response):
+        stats = g.get('metrics')
+        if stats is not None:
+            stats.status = response.status_code
+            # An event stream's duration is the subscriber's session length
+            stats.streamed = response.mimetype == 'text/event-stream'
+        return response
+
+    def teardown_request(self, exc=None):
+        stats = g.pop('metrics', None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats.started
+        blueprint = request.blueprint or 'none'
+        status = stats.status or 500
+        with self._lock:
+            self.requests[(blueprint, request.method, str(status))] += 1
+            if not stats.streamed:
+                self.latency.observe((blueprint,), elapsed)
+            self.request_queries.observe((blueprint,), stats.queries)
+            self.request_sql.observe((blueprint,), stats.sql_seconds)
+
+    # SQLAlchemy engine events
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # On the statement's own context, so a statement that fails (and
+        # never reaches after_cursor_execute) leaves nothing behind
+        context.metrics_started = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.metrics_started
+        stats = g.get('metrics') if has_request_context() else None
+        blueprint = (request.blueprint or 'none') if stats is not None else 'background'
+        with self._lock:
+            self.queries[(blueprint,)] += 1
+            self.sql_seconds[(blueprint,)] += elapsed
+
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += elapsed
+            # Bound parameters are not part of the statement text, so the
+            # same query for different rows counts as one shape
+            stats.statements[statement] += 1
+            if stats.statements[statement] > self.n_plus_one_threshold \
+                    and statement not in stats.flagged:
+                stats.flagged.add(statement)
+                self._report_n_plus_one(statement)
+
+        if self.explain and not executemany and conn.dialect.name == 'sqlite':
+            self._explain(cursor, statement, parameters)
+
+    def _report_n_plus_one(self, statement):
+        endpoint = request.endpoint or request.path
+        with self._lock:
+            self.n_plus_one[(endpoint,)] += 1
+        logger.warning(
+            "Possible N+1 in %s %s: statement ran more than %d times: %s",
+            request.method, endpoint, self.n_plus_one_threshold, ' '.join(statement.split())[:300]
+        )
+
+    def _explain(self, cursor, statement, parameters):
+        # Each statement shape is explained once per process
+        head = statement.lstrip()[:6].upper()
+        if head not in ('SELECT', 'WITH') or statement in self._explained:
+            return
+        with self._lock:
+            if len(self._explained) >= 5000:
+                return
+            self._explained.add(statement)
+        try:
+            plan = cursor.connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        except Exception as e:
+            logger.debug("EXPLAIN QUERY PLAN failed: %s", e)
+            return
+        details = [row[-1] for row in plan]
+        # "SCAN t" reads the whole table; "SCAN t USING INDEX" and virtual
+        # tables (FTS, R*Tree) are reported differently
+        scans = [detail for detail in details
+                 if detail.startswith('SCAN ') and ' USING ' not in detail
+                 and 'VIRTUAL TABLE' not in detail and detail != 'SCAN CONSTANT ROW']
+        if scans:
+            logger.warning("Full table scan (%s): %s\n  plan: %s", ', '.join(scans),
+                           ' '.join(statement.split())[:300], ' | '.join(details))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            _render_counter(lines, 'safenest_http_requests_total', 'Requests served.',
+                            'counter', ('blueprint', 'method', 'status'), self.requests)
+            self.latency.render(lines)
+            self.request_queries.render(lines)
+            self.request_sql.render(lines)
+            _render_counter(lines, 'safenest_sql_queries_total',
+                            'SQL statements run, by blueprint or background worker.',
+                            'counter', ('blueprint',), self.queries)
+            _render_counter(lines, 'safenest_sql_seconds_total', 'Time spent in SQL.',
+                            'counter', ('blueprint',),
+                            {key: round(value, 6) for key, value in self.sql_seconds.items()})
+            _render_counter(lines, 'safenest_n_plus_one_total',
+                            'Requests that repeated one statement past the N+1 threshold.',
+                            'counter', ('endpoint',), self.n_plus_one)
+        _render_services(lines)
+        return '\n'.join(lines) + '\n'
+
+
+def _render_services(lines):
+    from app.services.admission import admission
+    from app.services.alert_stream import alert_stream
+    from app.services.user_cache import user_cache
+
+    _render_counter(lines, 'safenest_user_cache_events_total', 'Profile cache lookups by outcome.',
+                    'counter', ('outcome',),
+                    {(name,): value for name, value in user_cache.stats().items()
+                     if name not in ('size', 'max_entries')})
+    rejected = {}
+    for key, count in admission.stats().get('rejected', {}).items():
+        blueprint, _, status = key.rpartition(':')
+        rejected[(blueprint, status)] = count
+    _render_counter(lines, 'safenest_admission_rejected_total', 'Requests shed by admission control.',
+                    'counter', ('blueprint', 'status'), rejected)
+    stream = alert_stream.stats()
+    _render_counter(lines, 'safenest_alert_stream_subscribers', 'Open alert event streams.',
+                    'gauge', (), {(): stream['subscribers']})
+    _render_counter(lines, 'safenest_alert_stream_evictions_total',
+                    'Slow alert stream subscribers dropped.',
+                    'counter', (), {(): stream['evictions']})
+
+
+class Metrics:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, engines=()):
+        # Register before other before_request hooks, so requests they
+        # reject are still timed
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_N_PLUS_ONE_THRESHOLD', 10)
+        # Log EXPLAIN QUERY PLAN for SELECTs that scan whole tables. Costs an
+        # extra statement per new query shape, so meant for development.
+        app.config.setdefault('METRICS_EXPLAIN_QUERIES', app.debug)
+        # Peers that may read /api/metrics; None allows anyone. Keep a reverse
+        # proxy on the same host from forwarding it, or every client would
+        # look local.
+        app.config.setdefault('METRICS_ALLOWED_ADDRESSES', ('127.0.0.1', '::1'))
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        registry = _Registry(app)
+        app.extensions['metrics'] = registry
+        app.before_request(registry.before_request)
+        app.after_request(registry.after_request)
+        app.teardown_request(registry.teardown_request)
+        for engine in filter(None, engines):
+            event.listen(engine, 'before_cursor_execute', registry.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', registry.after_cursor_execute)
+
+    def render(self):
+        registry = current_app.extensions.get('metrics')
+        return registry.render() if registry is not None else ''
+
+    def allowed(self):
+        addresses = current_app.config['METRICS_ALLOWED_ADDRESSES']
+        return addresses is None or request.remote_addr in addresses
+
+
+metrics = Metrics()
@@ -0,0 +1,221 @@
+import logging
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, inspect, literal, select, update
+from sqlalchemy.schema import CreateTable
+
+from app import db
+from app.models.alert import ALERT_RTREE_DDL, Alert, alert_archive_table
+from app.models.post import Post
+from app.models.revoked_token import RevokedToken
+from app.models.search import CREATE_INDEX, SEARCH_TRIGGERS, rebuild_search_index
+from app.services.alert_archive import archive_months, index_archive_months
+from app.services.feed import hot_score
+
+logger = logging.getLogger(__name__)
+
+# Schema changes are applied by `flask db upgrade`, never on boot. The
+# version lives in SQLite's PRAGMA user_version and every step runs in its
+# own BEGIN IMMEDIATE transaction (SQLite DDL is transactional), so a failed
+# step leaves the database at the previous version and two processes
+# upgrading at once apply each step exactly once.
+#
+# To change the schema, append a step to MIGRATIONS with plain DDL; don't
+# edit an existing step, and don't add new tables to BASELINE_TABLES.
+
+# Tables as of version 1
+BASELINE_TABLES = (
+    'user', 'emergency_contact', 'revoked_token', 'idempotency_key',
+    'alert', 'notification_outbox', 'alert_event', 'alert_location', 'alert_archive_month',
+    'post', 'post_like', 'comment', 'resource',
+    'instructor', 'class_series', 'class', 'registration'
+)
+
+
+def _table_sql(connection, name):
+    return connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).scalar()
+
+
+def _backfill_hot_scores(connection):
+    posts = connection.execute(
+        select(Post.id, Post.likes, Post.comments_count, Post.created_at)
+    ).all()
+    if posts:
+        connection.execute(
+            update(Post.__table__).where(Post.__table__.c.id == bindparam('post_id'))
+            .values(hot_score=bindparam('score')),
+            [{'post_id': post.id, 'score': hot_score(post.likes, post.comments_count, post.created_at)}
+             for post in posts]
+        )
+
+
+# Run after a column is added to an existing table
+BACKFILLS = {
+    ('post', 'hot_score'): _backfill_hot_scores,
+}
+
+
+def _add_missing_columns(connection, table):
+    present = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    compiler = connection.dialect.ddl_compiler(connection.dialect, None)
+    for column in table.columns:
+        if column.name in present:
+            continue
+        spec = compiler.get_column_specification(column)
+        default = column.default
+        if default is not None and default.is_scalar:
+            value = literal(default.arg).compile(dialect=connection.dialect,
+                                                 compile_kwargs={'literal_binds': True})
+            spec += f' DEFAULT {value}'
+        elif not column.nullable:
+            raise RuntimeError(f"Can't add NOT NULL column {table.name}.{column.name} "
+                               "without a scalar default")
+        connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN {spec}')
+        logger.info("Added column %s.%s", table.name, column.name)
+        backfill = BACKFILLS.get((table.name, column.name))
+        if backfill is not None:
+            backfill(connection)
+
+
+def _rebuild_table(connection, table):
+    # SQLite can't alter a table's primary key, so copy the rows into a new
+    # table made from the model (SQLite's documented 12-step procedure).
+    # Indexes and triggers go with the old table and are recreated after.
+    temporary = f'{table.name}_rebuild'
+    create = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.exec_driver_sql(
+        create.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {temporary} ', 1)
+    )
+    present = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    names = ', '.join(column.name for column in table.columns if column.name in present)
+    connection.exec_driver_sql(
+        f'INSERT INTO {temporary} ({names}) SELECT {names} FROM {table.name}'
+    )
+    connection.exec_driver_sql(f'DROP TABLE {table.name}')
+    connection.exec_driver_sql(f'ALTER TABLE {temporary} RENAME TO {table.name}')
+    logger.info("Rebuilt table %s", table.name)
+
+
+def _baseline(connection):
+    # Creates a new database, or adopts one made by create_all at any
+    # earlier release: missing tables, columns and indexes are added, and
+    # the search and geo indexes are built over the existing rows
+    existing = set(inspect(connection).get_table_names())
+    tables = [db.metadata.tables[name] for name in BASELINE_TABLES]
+
+    # Also runs each new table's after_create hooks: virtual tables,
+    # triggers and default rows
+    db.metadata.create_all(connection, tables=[table for table in tables
+                                               if table.name not in existing])
+
+    for table in tables:
+        if table.name in existing:
+            _add_missing_columns(connection, table)
+
+    # Ids must never be reused: archived alerts keep theirs, and denylist
+    # polls read revoked_token ids above the last one seen
+    for table in (Alert.__table__, RevokedToken.__table__):
+        if table.name in existing and 'AUTOINCREMENT' not in _table_sql(connection, table.name).upper():
+            _rebuild_table(connection, table)
+
+    for table in tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+    if 'alert' in existing:
+        for statement in ALERT_RTREE_DDL:
+            connection.exec_driver_sql(statement)
+        if 'alert_rtree' not in existing:
+            # Only active alerts are searched by position
+            connection.exec_driver_sql(
+                "INSERT INTO alert_rtree SELECT id, latitude, latitude, longitude, longitude "
+                "FROM alert WHERE status = 'active' "
+                "AND latitude IS NOT NULL AND longitude IS NOT NULL"
+            )
+
+    if 'alert_archive_month' not in existing:
+        for month in archive_months(connection):
+            index_archive_months(connection, month, alert_archive_table(month))
+
+    sources = [name for name in SEARCH_TRIGGERS if name in existing]
+    if sources:
+        connection.exec_driver_sql(CREATE_INDEX)
+        for name in sources:
+            for statement in SEARCH_TRIGGERS[name]:
+                connection.exec_driver_sql(statement)
+        if 'community_search' not in existing:
+            rebuild_search_index(connection)
+
+
+MIGRATIONS = [
+    (1, 'baseline schema', _baseline),
+]
+
+HEAD = MIGRATIONS[-1][0]
+
+
+def current_version(connection):
+    return connection.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def upgrade(engine, target=HEAD):
+    # Returns the (version, description) steps applied
+    applied = []
+    with engine.connect() as connection:
+        for version, description, step in MIGRATIONS:
+            if version > target:
+                break
+            connection.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                # Re-read under the write lock: another process may have
+                # applied this step while we waited
+                if current_version(connection) >= version:
+                    connection.rollback()
+                    continue
+                step(connection)
+                connection.exec_driver_sql(f'PRAGMA user_version = {version}')
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            logger.info("Applied migration %d: %s", version, description)
+            applied.append((version, description))
+    return applied
+
+
+def check(engine):
+    # Cheap enough for boot: one pragma read
+    with engine.connect() as connection:
+        version = current_version(connection)
+    if version < HEAD:
+        raise RuntimeError(f"Database schema is at version {version}, this release needs "
+                           f"{HEAD}. Run `flask db upgrade` first.")
+    return version
+
+
+db_command = AppGroup('db', help='Manage the database schema.')
+
+
+@db_command.command('upgrade')
+@click.option('--to', 'target', type=int, default=HEAD, help='Stop at this version.')
+def upgrade_command(target):
+    """Apply pending schema migrations."""
+    applied = upgrade(db.engine, target)
+    for version, description in applied:
+        click.echo(f"Applied {version}: {description}")
+    with db.engine.connect() as connection:
+        click.echo(f"Schema at version {current_version(connection)}")
+
+
+@db_command.command('status')
+def status_command():
+    """Show the schema version and pending migrations."""
+    with db.engine.connect() as connection:
+        version = current_version(connection)
+    click.echo(f"Schema at version {version} (latest {HEAD})")
+    for number, description, _ in MIGRATIONS:
+        if number > version:
+            click.echo(f"  pending {number}: {description}")
@@ -0,0 +1,277 @@
+import json
+import logging
+import random
+import smtplib
+import threading
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from flask import current_app
+from sqlalchemy import case, insert, literal, select, update
+from sqlalchemy.exc import OperationalError
+from werkzeug.utils import import_string
+
+from app import db
+from app.models.alert import Alert, NotificationOutbox
+from app.models.emergency_contact import EmergencyContact
+from app.models.user import User
+from app.services import workers
+
+logger = logging.getLogger(__name__)
+
+outbox_table = NotificationOutbox.__table__
+
+
+class FileSender:
+    # Appends one JSON line per notification. Good enough for local
+    # development and tests; swap for a real gateway in production.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, notification):
+        line = json.dumps(notification, default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+class SMTPSender:
+    # Works against `python -m aiosmtpd -n` or any SMTP debugging server.
+    def __init__(self, host, port, from_addr, timeout=10):
+        self.host = host
+        self.port = port
+        self.from_addr = from_addr
+        self.timeout = timeout
+
+    def send(self, notification):
+        msg = EmailMessage()
+        msg['From'] = self.from_addr
+        msg['To'] = notification['recipient']
+        msg['Subject'] = f"SOS alert from {notification['user_name']}"
+        msg.set_content(json.dumps(notification, indent=2, default=str))
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            smtp.send_message(msg)
+
+
+def load_sender(config):
+    sender = config['NOTIFICATION_SENDER']
+    if sender == 'file':
+        return FileSender(config['NOTIFICATION_LOG_PATH'])
+    if sender == 'smtp':
+        return SMTPSender(
+            config['NOTIFICATION_SMTP_HOST'],
+            config['NOTIFICATION_SMTP_PORT'],
+            config['NOTIFICATION_FROM_ADDRESS'],
+            config['NOTIFICATION_SMTP_TIMEOUT']
+        )
+    if isinstance(sender, str):
+        sender = import_string(sender)
+    # Either an object with .send() or a factory taking the app config
+    return sender if hasattr(sender, 'send') else sender(config)
+
+
+def enqueue_alert_notifications(alert):
+    # A single INSERT ... SELECT fans the alert out to every contact, so the
+    # SOS request costs the same number of statements whatever the contact
+    # count. The caller owns the transaction.
+    contacts = select(
+        literal(alert.id),
+        EmergencyContact.id,
+        case((EmergencyContact.email.isnot(None), 'email'), else_='sms'),
+        db.func.coalesce(EmergencyContact.email, EmergencyContact.phone),
+        literal('pending'),
+        literal(0),
+        literal(datetime.utcnow()),
+        literal(datetime.utcnow())
+    ).where(EmergencyContact.user_id == alert.user_id)
+
+    result = db.session.execute(
+        insert(NotificationOutbox).from_select(
+            ['alert_id', 'contact_id', 'channel', 'recipient', 'status',
+             'attempts', 'next_attempt_at', 'created_at'],
+            contacts
+        )
+    )
+    return result.rowcount
+
+
+class _WorkerPool:
+    def __init__(self, app, sender):
+        self.app = app
+        self.sender = sender
+        self.batch_size = app.config['NOTIFICATION_BATCH_SIZE']
+        self.max_attempts = app.config['NOTIFICATION_MAX_ATTEMPTS']
+        self.backoff = app.config['NOTIFICATION_RETRY_BACKOFF']
+        self.poll_interval = app.config['NOTIFICATION_POLL_INTERVAL']
+        self.lease = timedelta(seconds=app.config['NOTIFICATION_LEASE_SECONDS'])
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self, workers):
+        for i in range(workers):
+            t = threading.Thread(
+                target=self._run, name=f'notification-worker-{i}', daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    handled = self.run_once()
+            except OperationalError as e:
+                # Typically "database is locked" or the schema not existing yet
+                logger.warning("Notification worker backing off: %s", e.orig)
+                handled = 0
+            except Exception:
+                logger.exception("Notification worker crashed, restarting loop")
+                handled = 0
+
+            if not handled:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        due = (
+            select(NotificationOutbox.id)
+            .where(
+                NotificationOutbox.status.in_(('pending', 'sending')),
+                NotificationOutbox.next_attempt_at <= now
+            )
+            .order_by(NotificationOutbox.next_attempt_at)
+            .limit(self.batch_size)
+        )
+        # The lease doubles as the retry time if this worker dies mid-batch
+        db.session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(due.scalar_subquery()))
+            .values(status='sending', claim_token=token,
+                    next_attempt_at=now + self.lease)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+
+        # Plain rows: every send commits, and commits would expire entities
+        rows = db.session.execute(
+            select(NotificationOutbox.id, NotificationOutbox.channel, NotificationOutbox.recipient,
+                   NotificationOutbox.attempts, Alert.id.label('alert_id'), Alert.type, Alert.message,
+                   Alert.latitude, Alert.longitude, Alert.created_at,
+                   User.full_name, User.phone, EmergencyContact.name.label('contact_name'))
+            .join(Alert, Alert.id == NotificationOutbox.alert_id)
+            .join(User, User.id == Alert.user_id)
+            .outerjoin(EmergencyContact,
+                       EmergencyContact.id == NotificationOutbox.contact_id)
+            .where(NotificationOutbox.claim_token == token)
+            .order_by(NotificationOutbox.id)
+        ).all()
+        return token, rows
+
+    def _update_claimed(self, outbox_id, token, **values):
+        # Only while this worker still holds the row: once a lease lapses
+        # another worker may have reclaimed it, and its state wins
+        result = db.session.execute(
+            update(outbox_table)
+            .where(outbox_table.c.id == outbox_id, outbox_table.c.claim_token == token)
+            .values(**values)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+
+    def _retry_delay(self, attempts):
+        delay = self.backoff * (2 ** (attempts - 1))
+        return timedelta(seconds=delay + random.uniform(0, self.backoff))
+
+    def run_once(self):
+        token, rows = self._claim()
+        for row in rows:
+            # Renew the lease right before sending, so it only has to outlast
+            # one send however slow the rest of the batch is
+            if not self._update_claimed(row.id, token, next_attempt_at=datetime.utcnow() + self.lease):
+                continue
+            location = {}
+            if row.latitude is not None and row.longitude is not None:
+                location = {'lat': row.latitude, 'lng': row.longitude}
+            notification = {
+                'id': row.id,
+                'alert_id': row.alert_id,
+                'channel': row.channel,
+                'recipient': row.recipient,
+                'contact_name': row.contact_name,
+                'user_name': row.full_name,
+                'user_phone': row.phone,
+                'type': row.type,
+                'message': row.message,
+                'location': location,
+                'created_at': row.created_at.isoformat()
+            }
+            attempts = row.attempts + 1
+            values = {'attempts': attempts, 'claim_token': None}
+            try:
+                self.sender.send(notification)
+            except Exception as e:
+                values['last_error'] = str(e)
+                if attempts >= self.max_attempts:
+                    values['status'] = 'failed'
+                else:
+                    values['status'] = 'pending'
+                    values['next_attempt_at'] = datetime.utcnow() + self._retry_delay(attempts)
+            else:
+                values['status'] = 'sent'
+                values['sent_at'] = datetime.utcnow()
+            # Committed per row, so a crash mid-batch resends at most the
+            # notification in flight
+            self._update_claimed(row.id, token, **values)
+        return len(rows)
+
+
+class NotificationDispatcher:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('NOTIFICATION_SENDER', 'file')
+        app.config.setdefault('NOTIFICATION_LOG_PATH', 'notifications.log')
+        app.config.setdefault('NOTIFICATION_SMTP_HOST', 'localhost')
+        app.config.setdefault('NOTIFICATION_SMTP_PORT', 1025)
+        app.config.setdefault('NOTIFICATION_FROM_ADDRESS', 'alerts@safenest.local')
+        app.config.setdefault('NOTIFICATION_WORKERS', 2)
+        app.config.setdefault('NOTIFICATION_BATCH_SIZE', 50)
+        app.config.setdefault('NOTIFICATION_MAX_ATTEMPTS', 5)
+        app.config.setdefault('NOTIFICATION_RETRY_BACKOFF', 2)
+        app.config.setdefault('NOTIFICATION_POLL_INTERVAL', 5)
+        # Renewed before each send, so it must outlast a single send
+        # (SMTPSender times out after NOTIFICATION_SMTP_TIMEOUT)
+        app.config.setdefault('NOTIFICATION_LEASE_SECONDS', 60)
+        app.config.setdefault('NOTIFICATION_SMTP_TIMEOUT', 10)
+
+        pool = _WorkerPool(app, load_sender(app.config))
+        app.extensions['notifications'] = pool
+        if app.config['NOTIFICATION_WORKERS'] > 0:
+            workers.register(app, 'notifications',
+                             lambda: pool.start(app.config['NOTIFICATION_WORKERS']), pool.stop)
+
+    def wake(self):
+        current_app.extensions['notifications'].wake()
+
+    def run_once(self):
+        return current_app.extensions['notifications'].run_once()
+
+
+notifications = NotificationDispatcher()
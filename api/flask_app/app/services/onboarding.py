@@ -0,0 +1,169 @@
+import itertools
+import json
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db
+from app.models.emergency_contact import EmergencyContact
+from app.models.user import User
+from app.services.passwords import passwords
+
+USER_FIELDS = ('email', 'username', 'full_name', 'phone', 'password')
+CONTACT_FIELDS = ('name', 'relationship', 'phone')
+
+user_table = User.__table__
+contact_table = EmergencyContact.__table__
+
+
+def contacts_of(record):
+    return (record.get('meta') or {}).get('emergency_contacts') or []
+
+
+def validate(record):
+    # Same shape as the body of POST /api/auth/register
+    if not isinstance(record, dict):
+        return "Expected a JSON object"
+    missing = [field for field in USER_FIELDS if not record.get(field)]
+    if missing:
+        return "Missing fields: " + ', '.join(missing)
+    # A number or object would otherwise reach the hashing pool or the
+    # database and fail there
+    wrong = [field for field in USER_FIELDS if not isinstance(record[field], str)]
+    if wrong:
+        return "Fields must be strings: " + ', '.join(wrong)
+    for contact in contacts_of(record):
+        if not isinstance(contact, dict) or any(not contact.get(f) for f in CONTACT_FIELDS):
+            return "Emergency contacts need " + ', '.join(CONTACT_FIELDS)
+    return None
+
+
+def conflict_error(error):
+    # Maps a unique constraint violation on user to the API's messages
+    message = str(error.orig)
+    if 'user.email' in message:
+        return "Email already registered"
+    if 'user.username' in message:
+        return "Username already taken"
+    return None
+
+
+def read_ndjson(lines):
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+
+def user_row(record, password_hash):
+    return {
+        'email': record['email'],
+        'username': record['username'],
+        'full_name': record['full_name'],
+        'phone': record['phone'],
+        'address': record.get('address', ''),
+        'password_hash': password_hash
+    }
+
+
+def contact_rows(record, user_id):
+    return [{
+        'user_id': user_id,
+        'name': contact['name'],
+        'relationship': contact['relationship'],
+        'phone': contact['phone'],
+        'email': contact.get('email')
+    } for contact in contacts_of(record)]
+
+
+def _import_chunk(chunk, failed):
+    valid = []
+    for index, record in chunk:
+        error = validate(record)
+        if error:
+            failed.append({'index': index, 'error': error})
+        else:
+            valid.append((index, record))
+    if not valid:
+        return 0
+
+    # Skip users that already exist (or repeat within the chunk) before
+    # hashing, so re-running an interrupted import costs almost nothing
+    emails = [record['email'] for _, record in valid]
+    usernames = [record['username'] for _, record in valid]
+    taken = db.session.execute(
+        select(user_table.c.email, user_table.c.username)
+        .where(or_(user_table.c.email.in_(emails), user_table.c.username.in_(usernames)))
+    ).all()
+    taken_emails = {email for email, _ in taken}
+    taken_usernames = {username for _, username in taken}
+
+    fresh = []
+    for index, record in valid:
+        if record['email'] in taken_emails:
+            failed.append({'index': index, 'error': "Email already registered"})
+        elif record['username'] in taken_usernames:
+            failed.append({'index': index, 'error': "Username already taken"})
+        else:
+            taken_emails.add(record['email'])
+            taken_usernames.add(record['username'])
+            fresh.append((index, record))
+    if not fresh:
+        return 0
+
+    hashes = passwords.hash_many(record['password'] for _, record in fresh)
+
+    # One multi-row INSERT per chunk. Rows that lost a race with a concurrent
+    # signup are skipped by the unique constraints instead of failing the chunk.
+    try:
+        inserted = dict(db.session.execute(
+            sqlite_insert(user_table).on_conflict_do_nothing()
+            .returning(user_table.c.email, user_table.c.id),
+            [user_row(record, password_hash)
+             for (_, record), password_hash in zip(fresh, hashes)]
+        ).all())
+
+        # Skipped rows: the email is ours if it was inserted, so a skipped
+        # row whose email now exists lost on email, otherwise on username
+        lost = [record['email'] for _, record in fresh if record['email'] not in inserted]
+        lost_emails = set(db.session.execute(
+            select(user_table.c.email).where(user_table.c.email.in_(lost))
+        ).scalars()) if lost else set()
+
+        contacts = []
+        for index, record in fresh:
+            user_id = inserted.get(record['email'])
+            if user_id is not None:
+                contacts.extend(contact_rows(record, user_id))
+            elif record['email'] in lost_emails:
+                failed.append({'index': index, 'error': "Email already registered"})
+            else:
+                failed.append({'index': index, 'error': "Username already taken"})
+        if contacts:
+            db.session.execute(insert(contact_table), contacts)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(inserted)
+
+
+def import_users(records, chunk_size=500, progress=None):
+    # Streams records through in chunks: each chunk is hashed in parallel and
+    # written in a single transaction, so memory stays flat for any input size
+    records = enumerate(records)
+    summary = {'processed': 0, 'created': 0, 'failed': []}
+    while True:
+        chunk = list(itertools.islice(records, chunk_size))
+        if not chunk:
+            break
+        summary['created'] += _import_chunk(chunk, summary['failed'])
+        summary['processed'] += len(chunk)
+        if progress is not None:
+            progress(summary)
+    return summary
@@ -0,0 +1,50 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(key, row_id):
+    # key is the sort column value of the last row: a timestamp for
+    # chronological feeds, a number for ranked ones
+    if isinstance(key, datetime):
+        payload = ['d', key.isoformat(), row_id]
+    else:
+        payload = ['n', key, row_id]
+    raw = json.dumps(payload, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # Raises ValueError for anything that isn't a cursor we issued
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        kind, key, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if kind == 'd':
+            key = datetime.fromisoformat(key)
+        elif kind == 'n':
+            key = float(key)
+        else:
+            raise ValueError(kind)
+        return key, int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def keyset_page(query, key_col, id_col, cursor, limit, descending=True):
+    # Seeks past the cursor on a (key, id) index instead of using OFFSET, so
+    # page 1000 costs the same as page 1. Fetches one extra row to learn
+    # whether another page exists without a COUNT.
+    if cursor:
+        after = tuple_(key_col, id_col)
+        bound = tuple_(*decode_cursor(cursor))
+        query = query.filter(after < bound if descending else after > bound)
+    if descending:
+        query = query.order_by(key_col.desc(), id_col.desc())
+    else:
+        query = query.order_by(key_col.asc(), id_col.asc())
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    return rows[:limit], has_more
@@ -0,0 +1,185 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app, jsonify
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app.services import workers
+
+
+class HashingBusy(Exception):
+    # Raised when the hashing pool already has its maximum number of jobs
+    # queued, or a job doesn't finish within PASSWORD_HASH_TIMEOUT; turned
+    # into a 503 with Retry-After by the registered handler.
+    pass
+
+
+def _lower_priority(niceness):
+    # Hash workers run below request workers so a login storm queues up here
+    # instead of taking CPU from SOS traffic
+    if niceness and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+
+def _run_chunk(fn, chunk):
+    return [fn(*args) for args in chunk]
+
+
+class _HashPool:
+    def __init__(self, config):
+        self.method = config['PASSWORD_HASH_METHOD']
+        self.workers = config['PASSWORD_HASH_WORKERS']
+        self.niceness = config['PASSWORD_HASH_NICE']
+        self.timeout = config['PASSWORD_HASH_TIMEOUT']
+        self.chunksize = config['PASSWORD_HASH_MAP_CHUNK']
+        self.retry_after = config['PASSWORD_HASH_RETRY_AFTER']
+        self._slots = threading.BoundedSemaphore(self.workers + config['PASSWORD_HASH_MAX_QUEUE'])
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._canonical_method = None
+
+    def canonical_method(self):
+        # Werkzeug fills in defaults ('pbkdf2:sha256' is stored as
+        # 'pbkdf2:sha256:600000'), so learn the stored prefix from a real hash
+        if self._canonical_method is None:
+            self._canonical_method = self.run(
+                generate_password_hash, 'probe', self.method
+            ).split('$', 1)[0]
+        return self._canonical_method
+
+    def start(self):
+        # Forks every hash worker up front, while this process has no other
+        # threads yet (workers start in registration order). A fork child
+        # inherits the loaded code, so unlike spawn/forkserver it never
+        # re-imports __main__.
+        if self.workers > 0:
+            self._pool().submit(int).result()
+
+    def stop(self, timeout=None):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _pool(self):
+        # Per process: never share a pool across a fork. Created here on
+        # first use when start() hasn't run, e.g. in CLI commands.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context(
+                    'fork' if 'fork' in methods else 'spawn'
+                )
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_lower_priority,
+                    initargs=(self.niceness,)
+                )
+                self._pid = os.getpid()
+                atexit.register(self._executor.shutdown, wait=False)
+            return self._executor
+
+    def run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return self._result(future)
+
+    def _result(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # The slot stays taken until the job really finishes
+            future.cancel()
+            raise HashingBusy()
+
+    def map(self, fn, *iterables):
+        # Bulk jobs take a single queue slot and keep at most one small chunk
+        # per worker in the executor's queue, so a login waits for one chunk
+        # at most rather than behind the whole import
+        if self.workers <= 0:
+            return list(map(fn, *iterables))
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        in_flight = deque()
+        try:
+            items = list(zip(*iterables))
+            chunksize = max(1, min(self.chunksize, len(items) // (self.workers * 4)))
+            chunks = (items[i:i + chunksize] for i in range(0, len(items), chunksize))
+            pool = self._pool()
+            results = []
+            for chunk in chunks:
+                if len(in_flight) == self.workers:
+                    results.extend(self._result(in_flight.popleft()))
+                in_flight.append(pool.submit(_run_chunk, fn, chunk))
+            while in_flight:
+                results.extend(self._result(in_flight.popleft()))
+            return results
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+        finally:
+            self._slots.release()
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Any werkzeug method string, e.g. 'scrypt:32768:8:1' or
+        # 'pbkdf2:sha256:600000'. Changing it makes logins rehash old hashes.
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+        app.config.setdefault('PASSWORD_HASH_MAX_QUEUE', 32)
+        app.config.setdefault('PASSWORD_HASH_NICE', 5)
+        # Per job; a bulk chunk of PASSWORD_HASH_MAP_CHUNK hashes counts as one
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 30)
+        app.config.setdefault('PASSWORD_HASH_MAP_CHUNK', 8)
+        app.config.setdefault('PASSWORD_HASH_RETRY_AFTER', 2)
+
+        pool = _HashPool(app.config)
+        app.extensions['passwords'] = pool
+        workers.register(app, 'passwords', pool.start, pool.stop)
+
+        @app.errorhandler(HashingBusy)
+        def hashing_busy(error):
+            response = jsonify({"error": "Server busy, please retry shortly"})
+            response.headers['Retry-After'] = str(pool.retry_after)
+            return response, 503
+
+    @property
+    def _pool(self):
+        return current_app.extensions['passwords']
+
+    def hash(self, password):
+        return self._pool.run(generate_password_hash, password, self._pool.method)
+
+    def hash_many(self, passwords):
+        passwords = list(passwords)
+        return self._pool.map(generate_password_hash, passwords, [self._pool.method] * len(passwords))
+
+    def verify(self, password_hash, password):
+        return self._pool.run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        # Werkzeug hashes look like "<method>$<salt>$<hash>"
+        return password_hash.split('$', 1)[0] != self._pool.canonical_method()
+
+
+passwords = PasswordHasher()
@@ -0,0 +1,248 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, has_app_context, make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.wrappers import Response
+
+
+class _Entry:
+    __slots__ = ('body', 'mimetype', 'etag', 'expires_at', 'generations')
+
+    def __init__(self, body, mimetype, etag, expires_at, generations):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = etag
+        self.expires_at = expires_at
+        self.generations = generations
+
+
+class MemoryBackend:
+    # Per-process LRU. Table generations are also per process, so with
+    # several workers a write is only seen by the others once the TTL lapses;
+    # use the sqlite backend when that matters.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def generations(self, tables):
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in tables)
+
+    def bump(self, tables):
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+
+
+class SQLiteBackend:
+    # Shared between every worker that points at the same file, so one
+    # worker's write invalidates everyone's cached pages immediately.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._next_prune = 0.0
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS response_cache (
+                key TEXT PRIMARY KEY,
+                body BLOB NOT NULL,
+                mimetype TEXT NOT NULL,
+                etag TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                generations TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS ix_response_cache_expires
+                ON response_cache (expires_at);
+            CREATE TABLE IF NOT EXISTS response_cache_generation (
+                tbl TEXT PRIMARY KEY,
+                generation INTEGER NOT NULL
+            );
+        """)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT body, mimetype, etag, expires_at, generations FROM response_cache WHERE key = ?',
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        body, mimetype, etag, expires_at, generations = row
+        return _Entry(body, mimetype, etag, expires_at,
+                      tuple(int(g) for g in generations.split(',') if g))
+
+    def set(self, key, entry):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?)',
+            (key, entry.body, entry.mimetype, entry.etag, entry.expires_at,
+             ','.join(str(g) for g in entry.generations))
+        )
+        # Expired entries are never served, so dropping them is only about
+        # file size: once a minute per process is plenty
+        now = time.time()
+        if now >= self._next_prune:
+            self._next_prune = now + 60
+            conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (now,))
+
+    def generations(self, tables):
+        rows = dict(self._connection().execute(
+            'SELECT tbl, generation FROM response_cache_generation WHERE tbl IN (%s)'
+            % ','.join('?' * len(tables)),
+            tables
+        ).fetchall())
+        return tuple(rows.get(table, 0) for table in tables)
+
+    def bump(self, tables):
+        self._connection().executemany(
+            'INSERT INTO response_cache_generation VALUES (?, 1) '
+            'ON CONFLICT(tbl) DO UPDATE SET generation = generation + 1',
+            [(table,) for table in tables]
+        )
+
+
+def _tables_of(models):
+    return tuple(sorted(model.__table__.name for model in models))
+
+
+# Write tracking. Every table touched by a flush or by a DML statement run
+# through the session is remembered on the session and, once the transaction
+# commits, its generation is bumped so dependent cache entries stop matching.
+# Statements run with execution_options(response_cache_invalidate=False) are
+# left out: writes that cached pages may show stale until their TTL lapses.
+
+def _written_tables(session):
+    return session.info.setdefault('response_cache_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flush(session, flush_context):
+    written = _written_tables(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            written.add(table.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_statement(orm_execute_state):
+    if not orm_execute_state.execution_options.get('response_cache_invalidate', True):
+        return
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None:
+            _written_tables(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    written = session.info.pop('response_cache_tables', None)
+    if written and has_app_context():
+        backend = current_app.extensions.get('response_cache')
+        if backend is not None:
+            backend.bump(tuple(sorted(written)))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('response_cache_tables', None)
+
+
+class ResponseCache:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+        app.config.setdefault('RESPONSE_CACHE_BACKEND', 'memory')  # or 'sqlite'
+        app.config.setdefault('RESPONSE_CACHE_SIZE', 1024)
+        app.config.setdefault('RESPONSE_CACHE_PATH', 'response_cache.sqlite')
+
+        if app.config['RESPONSE_CACHE_BACKEND'] == 'sqlite':
+            backend = SQLiteBackend(app.config['RESPONSE_CACHE_PATH'])
+        else:
+            backend = MemoryBackend(app.config['RESPONSE_CACHE_SIZE'])
+        app.extensions['response_cache'] = backend
+
+    def cached(self, ttl, depends_on=()):
+        # Caches successful GET responses per path and query string. Entries
+        # are dropped when the TTL lapses or any table in depends_on is
+        # written, and every response carries a strong ETag so polling
+        # clients get 304s without a body.
+        tables = _tables_of(depends_on)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if not current_app.config['RESPONSE_CACHE_ENABLED']:
+                    return view(*args, **kwargs)
+
+                backend = current_app.extensions['response_cache']
+                key = request.path + '?' + '&'.join(
+                    f'{k}={v}' for k, v in sorted(request.args.items(multi=True))
+                )
+                generations = backend.generations(tables)
+
+                entry = backend.get(key)
+                if entry is not None and entry.expires_at > time.time() \
+                        and entry.generations == generations:
+                    return self._respond(entry, 'HIT')
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+
+                body = response.get_data()
+                entry = _Entry(
+                    body, response.mimetype,
+                    hashlib.sha1(body).hexdigest(),
+                    time.time() + ttl, generations
+                )
+                backend.set(key, entry)
+                return self._respond(entry, 'MISS')
+            return wrapper
+        return decorator
+
+    def _respond(self, entry, status):
+        headers = {
+            'ETag': f'"{entry.etag}"',
+            'Cache-Control': 'public, no-cache',
+            'X-Cache': status
+        }
+        if request.if_none_match.contains_weak(entry.etag):
+            return Response(status=304, headers=headers)
+        return Response(entry.body, mimetype=entry.mimetype, headers=headers)
+
+
+response_cache = ResponseCache()
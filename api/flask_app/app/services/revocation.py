@@ -0,0 +1,97 @@
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app import db, jwt
+from app.models.revoked_token import RevokedToken
+
+
+class _Denylist:
+    # In-memory copy of revoked_token. The blocklist check is a dict lookup;
+    # the table is polled for new rows at most once per poll interval, so
+    # other workers' logouts arrive within that interval.
+    def __init__(self, poll_interval, prune_interval):
+        self.poll_interval = poll_interval
+        self.prune_interval = prune_interval
+        self._revoked = {}
+        self._last_id = 0
+        self._next_poll = 0.0
+        self._next_prune = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def is_revoked(self, jti):
+        if time.monotonic() >= self._next_poll:
+            self.refresh()
+        return jti in self._revoked
+
+    def refresh(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_poll:
+                return
+            self._next_poll = now + self.poll_interval
+            last_id = self._last_id
+
+        rows = db.session.execute(
+            select(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at)
+            .where(RevokedToken.id > last_id)
+            .order_by(RevokedToken.id)
+        ).all()
+
+        with self._lock:
+            for row in rows:
+                self._revoked[row.jti] = row.expires_at
+            if rows:
+                self._last_id = max(self._last_id, rows[-1].id)
+            prune = now >= self._next_prune
+            if prune:
+                self._next_prune = now + self.prune_interval
+                # Expired tokens fail signature checks anyway
+                cutoff = datetime.utcnow()
+                self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > cutoff}
+
+        if prune:
+            db.session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.utcnow()))
+            db.session.commit()
+
+
+class TokenRevocation:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('REVOCATION_POLL_INTERVAL', 0.5)
+        app.config.setdefault('REVOCATION_PRUNE_INTERVAL', 3600)
+        app.extensions['revocation'] = _Denylist(
+            app.config['REVOCATION_POLL_INTERVAL'],
+            app.config['REVOCATION_PRUNE_INTERVAL']
+        )
+
+        @jwt.token_in_blocklist_loader
+        def token_revoked(jwt_header, jwt_payload):
+            return current_app.extensions['revocation'].is_revoked(jwt_payload['jti'])
+
+    def revoke(self, jwt_payload):
+        expires_at = datetime.utcfromtimestamp(jwt_payload['exp'])
+        db.session.execute(
+            sqlite_insert(RevokedToken)
+            .values(jti=jwt_payload['jti'],
+                    user_id=int(jwt_payload['sub']),
+                    expires_at=expires_at,
+                    revoked_at=datetime.utcnow())
+            .on_conflict_do_nothing()
+        )
+        db.session.commit()
+        current_app.extensions['revocation'].add(jwt_payload['jti'], expires_at)
+
+
+revocation = TokenRevocation()
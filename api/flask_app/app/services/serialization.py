@@ -0,0 +1,106 @@
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import select
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+
+class Schema:
+    # The JSON shape of a model, declared once next to it. dump() serializes
+    # an ORM instance; for read-only lists, select `schema.columns` instead of
+    # the entity and pass the row tuples to dump_row(), which skips building
+    # ORM instances (identity map, instance state, attribute events) entirely.
+    #
+    #   contact_schema = Schema(EmergencyContact, ('id', 'name', 'phone'))
+    #   rows = db.session.execute(contact_schema.select().where(...))
+    #   contacts = contact_schema.dump_rows(rows)
+    #
+    # `rename` maps attribute names to output keys, and `formats` maps
+    # attribute names to a function applied to non-null values.
+    def __init__(self, model, attributes, rename=None, formats=None):
+        rename = rename or {}
+        formats = formats or {}
+        self.model = model
+        self.attributes = tuple(attributes)
+        self.keys = tuple(rename.get(name, name) for name in self.attributes)
+        self._formats = tuple((rename.get(name, name), fn) for name, fn in formats.items())
+
+    @property
+    def columns(self):
+        return [getattr(self.model, name) for name in self.attributes]
+
+    def select(self, *extra):
+        # Row tuples hold the schema's attributes first, then `extra`
+        return select(*self.columns, *extra)
+
+    def dump_row(self, row):
+        # Reads the leading len(attributes) values; extra columns are ignored
+        data = dict(zip(self.keys, row))
+        for key, fn in self._formats:
+            value = data[key]
+            if value is not None:
+                data[key] = fn(value)
+        return data
+
+    def dump_rows(self, rows):
+        return [self.dump_row(row) for row in rows]
+
+    def dump(self, obj):
+        return self.dump_row([getattr(obj, name) for name in self.attributes])
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # Same output as Flask's provider (sorted keys, compact unless
+    # debugging, dates through default()), encoded by orjson. Anything orjson
+    # rejects, such as integers over 64 bits, falls back to the stdlib.
+    # Parsing stays on the stdlib, which accepts the same inputs as before.
+    def _options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        compact = self.compact if self.compact is not None else not self._app.debug
+        if not compact:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _encode(self, obj, **kwargs):
+        if kwargs:
+            return None
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options())
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        encoded = self._encode(obj, **kwargs)
+        if encoded is None:
+            return super().dumps(obj, **kwargs)
+        return encoded.decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        encoded = self._encode(obj)
+        if encoded is None:
+            return super().response(obj)
+        return self._app.response_class(encoded + b'\n', mimetype=self.mimetype)
+
+
+class Serialization:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # 'auto' uses orjson when it is installed; 'stdlib' keeps Flask's own
+        app.config.setdefault('JSON_PROVIDER', 'auto')
+
+        choice = app.config['JSON_PROVIDER']
+        if choice == 'orjson' and orjson is None:
+            raise RuntimeError("JSON_PROVIDER is 'orjson' but orjson is not installed")
+        if choice in ('auto', 'orjson') and orjson is not None:
+            app.json = OrjsonProvider(app)
+
+
+serialization = Serialization()
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from app import db
+from app.models.user import User
+
+
+class _Entry:
+    __slots__ = ('profile', 'version', 'expires_at', 'checked_at')
+
+    def __init__(self, profile, version, expires_at, checked_at):
+        self.profile = profile
+        self.version = version
+        self.expires_at = expires_at
+        self.checked_at = checked_at
+
+
+class _ProfileLRU:
+    # Serialized User.to_dict() results keyed by user id. Bounded by entry
+    # count (LRU eviction) and by TTL. Writes in this process invalidate
+    # directly; writes in other workers are caught by comparing the row's
+    # version column, which is probed at most once per revalidate interval.
+    def __init__(self, max_entries, ttl, revalidate_after):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate_after = revalidate_after
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'revalidations': 0, 'stale': 0, 'evictions': 0}
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(user_id)
+                if now - entry.checked_at < self.revalidate_after:
+                    self.stats['hits'] += 1
+                    return entry.profile
+            else:
+                entry = None
+
+        if entry is not None:
+            # Cheap version probe instead of loading and serializing the row
+            version = db.session.query(User.version).filter_by(id=user_id).scalar()
+            with self._lock:
+                self.stats['revalidations'] += 1
+                if version == entry.version:
+                    self.stats['hits'] += 1
+                    entry.checked_at = now
+                    return entry.profile
+                self.stats['stale'] += 1
+
+        with self._lock:
+            self.stats['misses'] += 1
+        user = db.session.get(User, user_id)
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        return self.put(user)
+
+    def put(self, user):
+        profile = user.to_dict()
+        now = time.monotonic()
+        with self._lock:
+            self._entries[user.id] = _Entry(profile, user.version, now + self.ttl, now)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return profile
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries), max_entries=self.max_entries)
+
+
+class UserCache:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_SIZE', 10000)
+        app.config.setdefault('USER_CACHE_TTL', 300)
+        app.config.setdefault('USER_CACHE_REVALIDATE_AFTER', 1.0)
+        app.extensions['user_cache'] = _ProfileLRU(
+            app.config['USER_CACHE_SIZE'],
+            app.config['USER_CACHE_TTL'],
+            app.config['USER_CACHE_REVALIDATE_AFTER']
+        )
+
+    @property
+    def _cache(self):
+        return current_app.extensions['user_cache']
+
+    def get_profile(self, user_id):
+        return self._cache.get(int(user_id))
+
+    def put(self, user):
+        return self._cache.put(user)
+
+    def stats(self):
+        return self._cache.snapshot()
+
+
+user_cache = UserCache()
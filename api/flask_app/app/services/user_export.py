@@ -0,0 +1,167 @@
+import heapq
+import json
+import threading
+import zlib
+from datetime import datetime
+from operator import itemgetter
+
+from flask import Response, current_app
+from sqlalchemy import select
+
+from app import db
+from app.models.alert import Alert, alert_archive_table
+from app.models.emergency_contact import EmergencyContact, contact_schema
+from app.models.post import Post, post_schema
+from app.models.user import User, user_schema
+from app.services.alert_archive import archive_months, history_dict
+from app.services.serialization import OrjsonProvider, orjson
+
+# Exports are NDJSON, one record per line, grouped by user:
+#
+#   {"type":"profile","user_id":1,"data":{...}}
+#   {"type":"contact","user_id":1,"data":{...}}
+#   {"type":"alert","user_id":1,"data":{...}}      hot table and archives
+#   {"type":"post","user_id":1,"data":{...}}
+#
+# Each table is read by one statement in (user_id, ...) index order, fetched
+# `EXPORT_CHUNK_SIZE` rows at a time, and the streams are merged by user id,
+# so memory stays flat however many rows there are. All statements share one
+# read transaction: the export is a consistent snapshot, and under WAL it
+# doesn't block writers (the WAL can't be checkpointed past it meanwhile).
+
+
+class ExportBusy(Exception):
+    pass
+
+
+def _alert_sort_key(row):
+    # SQLite sorts NULL first
+    return (row.user_id, row.created_at or datetime.min, row.id)
+
+
+def export_records(connection, user_id=None, chunk_size=1000):
+    # Yields (type, user_id, data) for one user, or for everyone
+    def rows(statement, user_column):
+        if user_id is not None:
+            statement = statement.where(user_column == user_id)
+        return connection.execute(statement.execution_options(yield_per=chunk_size))
+
+    users = rows(user_schema.select().order_by(User.id), User.id)
+    contacts = rows(
+        contact_schema.select(EmergencyContact.user_id)
+        .order_by(EmergencyContact.user_id, EmergencyContact.id),
+        EmergencyContact.user_id
+    )
+    partitions = [Alert.__table__] + [alert_archive_table(month) for month in archive_months(connection)]
+    alerts = heapq.merge(*(
+        rows(select(table).order_by(table.c.user_id, table.c.created_at, table.c.id), table.c.user_id)
+        for table in partitions
+    ), key=_alert_sort_key)
+    posts = rows(post_schema.select().order_by(Post.user_id, Post.id), Post.user_id)
+
+    # Stable on ties, so each user's records come out in this order
+    return heapq.merge(
+        (('profile', row.id, user_schema.dump_row(row)) for row in users),
+        (('contact', row.user_id, contact_schema.dump_row(row)) for row in contacts),
+        (('alert', row.user_id, history_dict(row)) for row in alerts),
+        (('post', row.user_id, post_schema.dump_row(row)) for row in posts),
+        key=itemgetter(1)
+    )
+
+
+def _line_encoder(app):
+    # Always one compact line, whatever the app's JSON indenting
+    if isinstance(app.json, OrjsonProvider):
+        return lambda record: orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    return lambda record: json.dumps(record, separators=(',', ':')).encode() + b'\n'
+
+
+def ndjson_chunks(app, user_id=None, compress=False):
+    # Byte chunks of about EXPORT_BUFFER_SIZE, gzipped on the fly if asked
+    chunk_size = app.config['EXPORT_CHUNK_SIZE']
+    buffer_size = app.config['EXPORT_BUFFER_SIZE']
+    encode = _line_encoder(app)
+    compressor = None
+    if compress:
+        compressor = zlib.compressobj(app.config['EXPORT_GZIP_LEVEL'], zlib.DEFLATED, 31)
+
+    with app.app_context():
+        engine = app.extensions.get('db_reader') or db.engine
+        with engine.connect() as connection:
+            connection.exec_driver_sql('BEGIN')
+            buffer, size = [], 0
+            for kind, owner, data in export_records(connection, user_id, chunk_size):
+                line = encode({'type': kind, 'user_id': owner, 'data': data})
+                buffer.append(line)
+                size += len(line)
+                if size >= buffer_size:
+                    chunk = b''.join(buffer)
+                    buffer, size = [], 0
+                    if compressor is not None:
+                        chunk = compressor.compress(chunk)
+                    if chunk:
+                        yield chunk
+
+    chunk = b''.join(buffer)
+    if compressor is not None:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
+
+class _Exports:
+    def __init__(self, app):
+        self.slots = threading.BoundedSemaphore(app.config['EXPORT_MAX_CONCURRENT'])
+
+    def stream(self, app, user_id, compress):
+        # The body is produced after the view returns, outside the request
+        # context: it opens its own app context and connection, and holds
+        # neither an admission slot nor the request's pooled connection
+        if not self.slots.acquire(blocking=False):
+            raise ExportBusy()
+        once = threading.Lock()
+
+        def release():
+            if once.acquire(blocking=False):
+                self.slots.release()
+
+        def generate():
+            try:
+                yield from ndjson_chunks(app, user_id, compress)
+            finally:
+                release()
+
+        db.session.close()
+        response = Response(generate(), mimetype='application/x-ndjson', headers={
+            'Cache-Control': 'no-store',
+            'Content-Disposition': f'attachment; filename="safenest-export-{user_id}.ndjson"',
+            'Vary': 'Accept-Encoding'
+        })
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        # Also covers clients that disconnect before the first chunk
+        response.call_on_close(release)
+        return response
+
+
+class UserExport:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EXPORT_CHUNK_SIZE', 1000)        # rows per fetch
+        app.config.setdefault('EXPORT_BUFFER_SIZE', 64 * 1024)  # bytes per write
+        app.config.setdefault('EXPORT_GZIP_LEVEL', 6)
+        # Per process; further requests get a 503 until one finishes
+        app.config.setdefault('EXPORT_MAX_CONCURRENT', 2)
+
+        app.extensions['user_export'] = _Exports(app)
+
+    def stream(self, user_id, compress=False):
+        # Raises ExportBusy
+        app = current_app._get_current_object()
+        return app.extensions['user_export'].stream(app, user_id, compress)
+
+
+user_export = UserExport()
@@ -0,0 +1,34 @@
+# Background threads (notification senders, the location flusher, the alert
+# stream hub, the archiver) don't survive fork(). A preloading server imports
+# and builds the app once in the master, so with DEFER_BACKGROUND_WORKERS the
+# services only register their threads here, and each worker starts them
+# after the fork (see gunicorn.conf.py).
+
+
+def register(app, name, start, stop):
+    app.extensions.setdefault('background_workers', {})[name] = (start, stop)
+    if not app.config['DEFER_BACKGROUND_WORKERS']:
+        start()
+
+
+def after_fork(app):
+    # Pooled connections opened by the master must not be shared with the
+    # child; dispose(close=False) drops them without closing the parent's
+    from app import db
+    with app.app_context():
+        db.engine.dispose(close=False)
+    reader = app.extensions.get('db_reader')
+    if reader is not None:
+        reader.dispose(close=False)
+
+
+def start_all(app):
+    for start, _ in app.extensions.get('background_workers', {}).values():
+        start()
+
+
+def stop_all(app, timeout=5):
+    # Reverse order of registration; the location flusher writes its last
+    # batch on stop
+    for _, stop in reversed(list(app.extensions.get('background_workers', {}).values())):
+        stop(timeout)
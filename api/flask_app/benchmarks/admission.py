@@ -0,0 +1,131 @@
+# SOS latency during a community-page traffic spike.
+#
+#   cd api/flask_app
+#   python -m benchmarks.admission --spike-threads 48 --seconds 10
+#
+# Floods GET/POST /api/community/posts from many threads (each with its own
+# user and client IP) while one thread sends POST /api/alerts/sos at a steady
+# rate, first with admission control off and then on. With it on, the
+# community blueprint is capped and shed with 429/503, and the alerts lane
+# is never throttled, so SOS latency should stay close to the idle baseline.
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models.post import Post
+from app.models.user import User
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run(enabled, args):
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'),
+        'RESPONSE_CACHE_ENABLED': False,
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ALERT_STREAM_ENABLED': False,
+        'ADMISSION_ENABLED': enabled
+    })
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User.__table__), [
+            {'email': f'user{i}@example.com', 'username': f'user{i}', 'full_name': f'User {i}',
+             'phone': '0', 'password_hash': 'x'}
+            for i in range(args.spike_threads + 1)
+        ])
+        db.session.execute(insert(Post.__table__), [
+            {'user_id': 1, 'title': f'Post {i}', 'content': 'Seed content ' * 20,
+             'category': 'general'}
+            for i in range(2000)
+        ])
+        db.session.commit()
+        tokens = [create_access_token(identity=str(user_id))
+                  for (user_id,) in db.session.query(User.id).order_by(User.id)]
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    spike = Counter()
+
+    def flood(i):
+        rng = random.Random(i)
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {tokens[i + 1]}'}
+        environ = {'REMOTE_ADDR': f'10.0.{i // 250}.{i % 250 + 1}'}
+        while not stop.is_set():
+            if rng.random() < 0.1:
+                response = client.post('/api/community/posts', headers=headers,
+                                       environ_base=environ,
+                                       json={'title': 'Spike', 'content': 'Spike'})
+            else:
+                response = client.get('/api/community/posts?limit=20', headers=headers,
+                                      environ_base=environ)
+            with lock:
+                spike[response.status_code] += 1
+
+    def send_sos(samples, seconds):
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {tokens[0]}'}
+        deadline = time.perf_counter() + seconds
+        statuses = Counter()
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = client.post('/api/alerts/sos', headers=headers,
+                                   json={'location': {'lat': 1.0, 'lng': 2.0}})
+            samples.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+            time.sleep(args.sos_interval)
+        return statuses
+
+    idle = []
+    send_sos(idle, 2)
+
+    threads = [threading.Thread(target=flood, args=(i,)) for i in range(args.spike_threads)]
+    for thread in threads:
+        thread.start()
+    loaded = []
+    statuses = send_sos(loaded, args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    label = 'admission on' if enabled else 'admission off'
+    print(f"{label}:")
+    print(f"  SOS idle   p50={percentile(idle, 50) * 1000:.1f}ms p99={percentile(idle, 99) * 1000:.1f}ms")
+    print(f"  SOS spike  p50={percentile(loaded, 50) * 1000:.1f}ms "
+          f"p95={percentile(loaded, 95) * 1000:.1f}ms p99={percentile(loaded, 99) * 1000:.1f}ms "
+          f"max={max(loaded) * 1000:.1f}ms statuses={dict(statuses)}")
+    print(f"  community  {dict(sorted(spike.items()))}")
+    return percentile(loaded, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--spike-threads', type=int, default=48)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--sos-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    off = run(False, args)
+    on = run(True, args)
+    print(f"SOS p99 under spike: {off * 1000:.1f}ms -> {on * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# Concurrency stress test for POST /api/classes/<id>/register.
+#
+#   cd api/flask_app
+#   python -m benchmarks.class_registration --users 500 --capacity 40 --threads 32
+#
+# Simulates a popular class opening: every user hits the register endpoint at
+# the same instant (released together by a barrier). Afterwards it checks
+# that exactly `capacity` registrations are confirmed, the class counter
+# matches, everybody else is waitlisted, and nobody holds two rows. Exits
+# non-zero if any invariant is broken.
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func, insert
+
+from app import create_app, db
+from app.models.classes import Class, Registration
+from app.models.user import User
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--capacity', type=int, default=25)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--rounds', type=int, default=2,
+                        help='each user submits this many times (duplicates must be rejected)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'),
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ADMISSION_ENABLED': False
+    })
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User.__table__), [
+            {'email': f'user{i}@example.com', 'username': f'user{i}', 'full_name': f'User {i}',
+             'phone': '0', 'password_hash': 'x'}
+            for i in range(args.users)
+        ])
+        cls = db.session.get(Class, 1)
+        cls.capacity = args.capacity
+        db.session.commit()
+        class_id = cls.id
+        tokens = [create_access_token(identity=str(user_id))
+                  for (user_id,) in db.session.query(User.id)]
+
+    requests = tokens * args.rounds
+    barrier = threading.Barrier(min(args.threads, len(requests)))
+    local = threading.local()
+
+    def register(token):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            barrier.wait()
+        response = local.client.post(f'/api/classes/{class_id}/register',
+                                     headers={'Authorization': f'Bearer {token}'})
+        body = response.get_json() or {}
+        return response.status_code, body.get('status')
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        outcomes = Counter(pool.map(register, requests))
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        registered = db.session.get(Class, class_id).registered
+        statuses = dict(db.session.query(Registration.status, func.count())
+                        .group_by(Registration.status).all())
+        duplicates = (db.session.query(Registration.user_id)
+                      .group_by(Registration.class_id, Registration.user_id)
+                      .having(func.count() > 1).count())
+
+    print(f"{len(requests)} requests in {elapsed:.2f}s "
+          f"({len(requests) / elapsed:.0f} req/s) with {args.threads} threads")
+    for (status_code, status), count in sorted(outcomes.items(), key=str):
+        print(f"  {status_code} {status or '-'}: {count}")
+    print(f"class.registered={registered} confirmed={statuses.get('confirmed', 0)} "
+          f"waitlisted={statuses.get('waitlisted', 0)} duplicates={duplicates}")
+
+    expected_confirmed = min(args.capacity, args.users)
+    failures = []
+    if registered != expected_confirmed:
+        failures.append(f"class counter is {registered}, expected {expected_confirmed}")
+    if statuses.get('confirmed', 0) != expected_confirmed:
+        failures.append("confirmed registrations don't match capacity")
+    if statuses.get('waitlisted', 0) != args.users - expected_confirmed:
+        failures.append("waitlist size is wrong")
+    if duplicates:
+        failures.append(f"{duplicates} users registered twice")
+    if outcomes.get((409, None), 0) != len(requests) - args.users:
+        failures.append("duplicate submissions were not all rejected with 409")
+    unexpected = [k for k in outcomes if k[0] not in (201, 409)]
+    if unexpected:
+        failures.append(f"unexpected responses: {unexpected}")
+
+    for failure in failures:
+        print("FAIL:", failure)
+    if failures:
+        sys.exit(1)
+    print("OK: no overbooking")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# Mixed read/write throughput for the SQLite engine profiles.
+#
+#   cd api/flask_app
+#   python -m benchmarks.db_profile --threads 16 --seconds 10 --write-ratio 0.2
+#
+# Runs the same workload against a fresh file database twice: once with
+# SQLITE_PROFILE='default' (rollback journal, no busy timeout, one pool) and
+# once with 'production' (WAL, pragmas, read-only pool for GET routes).
+# Readers page through the community feed with the response cache disabled;
+# writers create posts. Reports requests/s, latency percentiles and errors.
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models.post import Post
+from app.models.user import User
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run(profile, args):
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'),
+        'SQLITE_PROFILE': profile,
+        'RESPONSE_CACHE_ENABLED': False,
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ADMISSION_ENABLED': False
+    })
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User.__table__), [
+            {'email': f'user{i}@example.com', 'username': f'user{i}', 'full_name': f'User {i}',
+             'phone': '0', 'password_hash': 'x'}
+            for i in range(args.users)
+        ])
+        db.session.execute(insert(Post.__table__), [
+            {'user_id': random.randint(1, args.users), 'title': f'Post {i}',
+             'content': 'Seed content ' * 20, 'category': 'general'}
+            for i in range(args.posts)
+        ])
+        db.session.commit()
+        tokens = [create_access_token(identity=str(user_id))
+                  for (user_id,) in db.session.query(User.id)]
+
+    deadline = time.perf_counter() + args.seconds
+    lock = threading.Lock()
+    latencies = {'read': [], 'write': []}
+    outcomes = Counter()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            headers = {'Authorization': f'Bearer {rng.choice(tokens)}'}
+            kind = 'write' if rng.random() < args.write_ratio else 'read'
+            started = time.perf_counter()
+            try:
+                if kind == 'write':
+                    response = client.post('/api/community/posts', headers=headers, json={
+                        'title': 'Benchmark post', 'content': 'Written under load',
+                        'category': 'general'
+                    })
+                else:
+                    response = client.get('/api/community/posts?limit=20', headers=headers)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies[kind].append(elapsed)
+                outcomes[(kind, status)] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        db.engine.dispose()
+        reader = app.extensions.get('db_reader')
+        if reader is not None:
+            reader.dispose()
+
+    total = sum(outcomes.values())
+    print(f"{profile}: {total} requests in {elapsed:.1f}s ({total / elapsed:.0f} req/s)")
+    for kind in ('read', 'write'):
+        samples = latencies[kind]
+        print(f"  {kind:5} n={len(samples):6} "
+              f"p50={percentile(samples, 50) * 1000:.1f}ms "
+              f"p95={percentile(samples, 95) * 1000:.1f}ms "
+              f"p99={percentile(samples, 99) * 1000:.1f}ms")
+    for (kind, status), count in sorted(outcomes.items(), key=str):
+        if status not in (200, 201):
+            print(f"  {kind} {status}: {count}")
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+    args = parser.parse_args()
+
+    results = {profile: run(profile, args) for profile in args.profiles}
+    if len(results) > 1:
+        baseline, *others = args.profiles
+        for profile in others:
+            print(f"{profile} vs {baseline}: {results[profile] / results[baseline]:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
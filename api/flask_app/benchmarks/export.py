@@ -0,0 +1,71 @@
+# Memory and throughput of the NDJSON export (GET /api/users/export and
+# `flask users export`).
+#
+#   cd api/flask_app
+#   python -m benchmarks.export --users 2000 4000 8000
+#
+# For each size, seeds a fresh database and runs a full export, gzipped and
+# not. Peak traced memory (tracemalloc) should stay flat as the row count
+# grows; a jsonify-style export that builds the whole list first grows with
+# it, shown in the last column for comparison.
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app import create_app
+from app.services.user_export import ndjson_chunks
+from benchmarks.seed import seed
+
+
+def run(app, compress):
+    tracemalloc.start()
+    started = time.perf_counter()
+    written = 0
+    for chunk in ndjson_chunks(app, compress=compress):
+        written += len(chunk)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, written, peak
+
+
+def buffered(app):
+    # The naive version: every record in one list, then one json.dumps
+    tracemalloc.start()
+    records = [json.loads(line) for chunk in ndjson_chunks(app) for line in chunk.splitlines()]
+    json.dumps(records)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return len(records), peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[2000, 4000, 8000])
+    args = parser.parse_args()
+
+    print(f"{'users':>6} {'records':>9} {'gzip':>5} {'seconds':>8} {'records/s':>10} "
+          f"{'MiB out':>8} {'peak KiB':>9} {'buffered KiB':>13}")
+    for users in args.users:
+        workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+        app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'),
+            'NOTIFICATION_WORKERS': 0,
+            'LOCATION_FLUSHER_ENABLED': False,
+            'ADMISSION_ENABLED': False
+        })
+        seed(app, users=users, contacts_per_user=3, posts=users * 5, comments_per_post=0,
+             alerts=users * 10, active_alerts=50, token_users=1)
+        lines, naive = buffered(app)
+        for compress in (False, True):
+            elapsed, written, peak = run(app, compress)
+            print(f"{users:6} {lines:9} {'yes' if compress else 'no':>5} {elapsed:8.2f} "
+                  f"{lines / elapsed:10.0f} {written / 2 ** 20:8.1f} {peak / 1024:9.0f} {naive / 1024:13.0f}")
+
+
+if __name__ == '__main__':
+    main()
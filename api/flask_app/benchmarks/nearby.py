@@ -0,0 +1,117 @@
+# Radius-query benchmark for GET /api/alerts/nearby.
+#
+#   cd api/flask_app
+#   python -m benchmarks.nearby --alerts 1000000 --queries 500
+#
+# Seeds a throwaway SQLite database with alerts (half spread over the globe,
+# half packed into a few dense cities; one in ten still active, and only those
+# are in the R*Tree), prints the query plan to show the R*Tree is used instead
+# of a scan of `alert`, then times radius queries through the test client and
+# reports latency percentiles.
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert, text
+
+from app import create_app, db
+from app.models.alert import Alert
+from app.models.user import User
+
+CITIES = [(37.7749, -122.4194), (40.7128, -74.0060), (51.5074, -0.1278), (28.6139, 77.2090)]
+
+
+def seed(count, chunk=50000):
+    user = User(email='bench@example.com', username='bench', full_name='Bench',
+                phone='0', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+
+    now = datetime.utcnow()
+    rng = random.Random(42)
+    for start in range(0, count, chunk):
+        rows = []
+        for _ in range(min(chunk, count - start)):
+            if rng.random() < 0.5:
+                lat, lng = rng.uniform(-85, 85), rng.uniform(-180, 180)
+            else:
+                city_lat, city_lng = rng.choice(CITIES)
+                lat, lng = city_lat + rng.gauss(0, 0.2), city_lng + rng.gauss(0, 0.2)
+            rows.append({
+                'user_id': user.id, 'type': 'emergency',
+                'status': 'active' if rng.random() < 0.1 else 'resolved',
+                'latitude': lat, 'longitude': lng,
+                'created_at': now, 'updated_at': now
+            })
+        db.session.execute(insert(Alert.__table__), rows)
+        db.session.commit()
+    return user
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--alerts', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--radius', type=float, default=2000, help='meters')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'),
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ADMISSION_ENABLED': False
+    })
+
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        user = seed(args.alerts)
+        print(f"seeded {args.alerts} alerts in {time.perf_counter() - started:.1f}s")
+
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT alert.id FROM alert "
+            "JOIN alert_rtree ON alert_rtree.id = alert.id "
+            "WHERE alert_rtree.max_lat >= 37.7 AND alert_rtree.min_lat <= 37.8 "
+            "AND alert_rtree.max_lng >= -122.5 AND alert_rtree.min_lng <= -122.4"
+        )).all()
+        for row in plan:
+            print("plan:", row[-1])
+
+        token = create_access_token(identity=str(user.id))
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    rng = random.Random(7)
+    timings = []
+    hits = 0
+    for _ in range(args.queries):
+        city_lat, city_lng = rng.choice(CITIES)
+        lat, lng = city_lat + rng.gauss(0, 0.1), city_lng + rng.gauss(0, 0.1)
+        started = time.perf_counter()
+        response = client.get(
+            f'/api/alerts/nearby?lat={lat}&lng={lng}&radius={args.radius}',
+            headers=headers
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+        hits += len(response.get_json())
+
+    print(f"{args.queries} queries, radius {args.radius:.0f}m, "
+          f"avg {hits / args.queries:.1f} results")
+    print(f"p50 {percentile(timings, 50):.2f}ms  p95 {percentile(timings, 95):.2f}ms  "
+          f"p99 {percentile(timings, 99):.2f}ms  mean {statistics.mean(timings):.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
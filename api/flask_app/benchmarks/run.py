@@ -0,0 +1,317 @@
+# Latency and throughput benchmark for every blueprint.
+#
+#   cd api/flask_app
+#   python -m benchmarks.run --mode client --requests 5000
+#   python -m benchmarks.run --mode server --threads 16 --seconds 30 --save-baseline benchmarks/baseline.json
+#   python -m benchmarks.run --mode server --threads 16 --seconds 30 --baseline benchmarks/baseline.json
+#
+# Seeds a fresh database (see benchmarks.seed), then drives the mixed
+# workload in benchmarks.workload against create_app(), either in-process
+# through the test client (--mode client: no sockets, measures the app
+# itself) or through a threaded local WSGI server with concurrent HTTP
+# clients (--mode server: adds parsing, sockets and thread contention).
+# Prints requests/s and p50/p95/p99 per route.
+#
+# --baseline compares p95 per route and overall throughput against a JSON
+# file written earlier with --save-baseline, and exits 1 when any route got
+# slower than --tolerance allows, so a regression fails loudly in CI. A
+# missing baseline file is an error before anything runs.
+#
+# benchmarks/baseline.json is committed, recorded with the second command
+# above on a single-CPU machine. Numbers are only comparable on similar
+# hardware: re-save it (and commit it) when CI moves or a change is meant to
+# shift the numbers.
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app
+from benchmarks.seed import seed
+from benchmarks.workload import Workload
+
+MIN_SAMPLES = 50
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class TestClientDriver:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body, headers):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body, headers=headers)
+        # Drain streamed bodies so timings include serialisation
+        response.get_data()
+        return response.status_code
+
+    def close(self):
+        pass
+
+
+class _QuietHandler(WSGIRequestHandler):
+    # Keep-alive like a production server, and no access log per request
+    protocol_version = 'HTTP/1.1'
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class ServerDriver:
+    def __init__(self, app, port=0):
+        self.server = make_server('127.0.0.1', port, app, threaded=True,
+                                  request_handler=_QuietHandler)
+        self.port = self.server.server_port
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def request(self, method, path, body, headers):
+        headers = dict(headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection = self._connection()
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.getheader('Connection', '').lower() == 'close' or response.version < 11:
+                connection.close()
+                self._local.connection = None
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            return 0
+
+    def close(self):
+        self.server.shutdown()
+
+
+def drive(driver, workload, threads, seconds, requests):
+    # Runs until `seconds` elapse or `requests` have been sent in total,
+    # whichever comes first (0 disables a limit)
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    lock = threading.Lock()
+    remaining = [requests or float('inf')]
+    deadline = time.perf_counter() + seconds if seconds else float('inf')
+
+    def client(index):
+        stream = workload.fork(index + 1)
+        local_latencies = defaultdict(list)
+        local_statuses = defaultdict(lambda: defaultdict(int))
+        while time.perf_counter() < deadline:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            route, method, path, body, headers = stream.next()
+            started = time.perf_counter()
+            status = driver.request(method, path, body, headers)
+            local_latencies[route].append(time.perf_counter() - started)
+            local_statuses[route][status] += 1
+        with lock:
+            for route, samples in local_latencies.items():
+                latencies[route].extend(samples)
+            for route, counts in local_statuses.items():
+                for status, count in counts.items():
+                    statuses[route][status] += count
+
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def summarise(latencies, statuses, elapsed):
+    routes = {}
+    for route in sorted(latencies):
+        samples = latencies[route]
+        routes[route] = {
+            'count': len(samples),
+            'errors': sum(count for status, count in statuses[route].items()
+                          if status == 0 or status >= 500),
+            'statuses': {str(status): count for status, count in sorted(statuses[route].items())},
+            'p50_ms': round(percentile(samples, 50) * 1000, 2),
+            'p95_ms': round(percentile(samples, 95) * 1000, 2),
+            'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        }
+    total = sum(len(samples) for samples in latencies.values())
+    everything = [sample for samples in latencies.values() for sample in samples]
+    return {
+        'requests': total,
+        'seconds': round(elapsed, 2),
+        'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(everything, 50) * 1000, 2),
+        'p95_ms': round(percentile(everything, 95) * 1000, 2),
+        'p99_ms': round(percentile(everything, 99) * 1000, 2),
+        'errors': sum(route['errors'] for route in routes.values()),
+        'routes': routes
+    }
+
+
+def report(result):
+    print(f"{result['requests']} requests in {result['seconds']}s "
+          f"({result['throughput_rps']} req/s), p50={result['p50_ms']}ms "
+          f"p95={result['p95_ms']}ms p99={result['p99_ms']}ms, errors={result['errors']}")
+    width = max((len(route) for route in result['routes']), default=10)
+    print(f"  {'route':{width}}  {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8}  statuses")
+    for route, stats in result['routes'].items():
+        print(f"  {route:{width}}  {stats['count']:6} {stats['p50_ms']:8.2f} "
+              f"{stats['p95_ms']:8.2f} {stats['p99_ms']:8.2f}  "
+              + ' '.join(f"{status}:{count}" for status, count in stats['statuses'].items()))
+
+
+def compare(result, baseline, tolerance, min_delta_ms):
+    # A route regresses when its p95 grows by more than `tolerance` (a
+    # fraction) and by more than min_delta_ms, which keeps sub-millisecond
+    # jitter on fast routes from failing the run. Routes with too few samples
+    # for a stable p95 are only checked for errors.
+    failures = []
+    for route in sorted(baseline['routes'].keys() - result['routes'].keys()):
+        print(f"  {route}: in the baseline but not run")
+    for route, stats in result['routes'].items():
+        before = baseline['routes'].get(route)
+        if before is None:
+            print(f"  {route}: not in the baseline, not compared")
+            continue
+        if stats['errors'] > before['errors']:
+            failures.append(f"{route}: {stats['errors']} errors (baseline {before['errors']})")
+        if min(before['count'], stats['count']) < MIN_SAMPLES:
+            continue
+        limit = before['p95_ms'] * (1 + tolerance)
+        delta = stats['p95_ms'] - before['p95_ms']
+        marker = ''
+        if stats['p95_ms'] > limit and delta > min_delta_ms:
+            failures.append(f"{route}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms")
+            marker = '  REGRESSION'
+        print(f"  {route}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms{marker}")
+
+    floor = baseline['throughput_rps'] * (1 - tolerance)
+    print(f"  throughput: {baseline['throughput_rps']} -> {result['throughput_rps']} req/s")
+    if result['throughput_rps'] < floor:
+        failures.append(f"throughput {baseline['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return failures
+
+
+def parse_config(pairs):
+    config = {}
+    for pair in pairs:
+        key, _, value = pair.partition('=')
+        try:
+            config[key] = json.loads(value)
+        except ValueError:
+            config[key] = value
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=('client', 'server'), default='client')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many (0: no limit)')
+    parser.add_argument('--warmup', type=int, default=200)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--contacts-per-user', type=int, default=3)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--alerts', type=int, default=10000)
+    parser.add_argument('--only', nargs='*', help='only routes containing one of these strings')
+    parser.add_argument('--config', nargs='*', default=[], metavar='KEY=VALUE',
+                        help='extra app config, values parsed as JSON when possible')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--save-baseline', help='write the results as the new baseline')
+    parser.add_argument('--baseline', help='compare against this baseline and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    if args.baseline and not os.path.isfile(args.baseline):
+        parser.error(f"baseline {args.baseline} not found; record one with --save-baseline")
+
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    config = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'),
+        'NOTIFICATION_LOG_PATH': os.path.join(workdir, 'notifications.log'),
+        # Measure the routes, not the rate limiter: every client shares one IP
+        'ADMISSION_ENABLED': False,
+        'ALERT_ARCHIVER_ENABLED': False
+    }
+    config.update(parse_config(args.config))
+    app = create_app(config)
+
+    started = time.perf_counter()
+    data = seed(app, users=args.users, contacts_per_user=args.contacts_per_user,
+                posts=args.posts, alerts=args.alerts)
+    print(f"Seeded {data['users']} users, {data['posts']} posts, {data['alerts']} alerts "
+          f"({data['archived']} archived) in {time.perf_counter() - started:.1f}s")
+
+    driver = ServerDriver(app) if args.mode == 'server' else TestClientDriver(app)
+    workload = Workload(data, only=args.only)
+    try:
+        if args.warmup:
+            drive(driver, workload, args.threads, 0, args.warmup)
+        latencies, statuses, elapsed = drive(driver, workload, args.threads,
+                                             args.seconds, args.requests)
+    finally:
+        driver.close()
+
+    result = summarise(latencies, statuses, elapsed)
+    result['settings'] = {
+        'mode': args.mode, 'threads': args.threads, 'users': args.users,
+        'posts': args.posts, 'alerts': args.alerts
+    }
+    print(f"mode={args.mode} threads={args.threads}")
+    report(result)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+            print(f"Wrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('settings') != result['settings']:
+            print(f"warning: baseline was recorded with different settings: {baseline.get('settings')}")
+        print(f"Comparing with {args.baseline} (tolerance {args.tolerance:.0%}):")
+        failures = compare(result, baseline, args.tolerance, args.min_delta_ms)
+        for failure in failures:
+            print("FAIL:", failure)
+        if failures:
+            sys.exit(1)
+        print("OK: no regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Full-text search benchmark for GET /api/community/search.
+#
+#   cd api/flask_app
+#   python -m benchmarks.search --posts 200000 --queries 300
+#
+# Seeds synthetic posts (the FTS5 triggers index them as they land) and times
+# ranked term and prefix queries through the test client.
+import argparse
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models.post import Post
+from app.models.user import User
+
+# Zipf-distributed synthetic vocabulary: a few words appear in almost every
+# post (the worst case for ranking), most are rare
+WORDS = [f'w{i}{"abc"[i % 3]}' for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1 / (i + 1) for i in range(len(WORDS))))
+
+
+def seed(count, chunk=20000):
+    user = User(email='bench@example.com', username='bench', full_name='Bench',
+                phone='0', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    for start in range(0, count, chunk):
+        rows = [{
+            'user_id': user.id,
+            'title': ' '.join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=5)),
+            'content': ' '.join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=60)),
+            'category': 'tips', 'likes': 0, 'comments_count': 0, 'created_at': now
+        } for _ in range(min(chunk, count - start))]
+        db.session.execute(insert(Post.__table__), rows)
+        db.session.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, 'bench.sqlite'),
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ADMISSION_ENABLED': False
+    })
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        seed(args.posts)
+        print(f"seeded {args.posts} posts in {time.perf_counter() - started:.1f}s")
+
+    client = app.test_client()
+    rng = random.Random(7)
+    timings = []
+    for i in range(args.queries):
+        if i % 2:
+            q = rng.choice(WORDS[:2000])[:3] + '*'
+        else:
+            q = ' '.join(rng.choices(WORDS, cum_weights=CUM_WEIGHTS, k=2))
+        started = time.perf_counter()
+        client.get(f'/api/community/search?q={q}')
+        timings.append((time.perf_counter() - started) * 1000)
+
+    print(f"{args.queries} queries")
+    print(f"p50 {percentile(timings, 50):.2f}ms  p95 {percentile(timings, 95):.2f}ms  "
+          f"p99 {percentile(timings, 99):.2f}ms  mean {statistics.mean(timings):.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
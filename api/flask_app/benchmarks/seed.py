@@ -0,0 +1,164 @@
+# Synthetic dataset for the benchmark suite.
+#
+#   cd api/flask_app
+#   python -m benchmarks.seed --db /tmp/bench.sqlite --users 5000 --posts 20000 --alerts 50000
+#
+# Writes users (all sharing one password), emergency contacts, posts with
+# comments and likes spread over the last 90 days, and alerts scattered
+# around a city centre over the last 60 days, mostly closed with a few still
+# active. Everything goes in with bulk Core inserts, so the FTS and R*Tree
+# triggers run exactly as they do for API writes. seed() returns what the
+# workload needs to address the data: tokens, post ids, active alerts.
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert, select
+
+from app import create_app, db
+from app.models.alert import Alert
+from app.models.emergency_contact import EmergencyContact
+from app.models.post import Comment, Post
+from app.models.user import User
+from app.services.alert_archive import alert_archive
+from app.services.feed import hot_score
+from app.services.passwords import passwords
+
+PASSWORD = 'benchmark-password'
+CENTRE = (37.7749, -122.4194)
+WORDS = ('safety walk night route light park escort class self defence alarm '
+         'neighbourhood bus station campus group tips report help shelter '
+         'friend phone share location late street parking lot').split()
+CATEGORIES = ('general', 'safety-tips', 'events', 'support')
+CHUNK = 5000
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), CHUNK):
+        yield rows[start:start + CHUNK]
+
+
+def _insert(table, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(insert(table), chunk)
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def seed(app, users=1000, contacts_per_user=3, posts=5000, comments_per_post=3,
+         alerts=10000, active_alerts=50, token_users=500, seed_value=0):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+
+    with app.app_context():
+        db.create_all()
+        password_hash = passwords.hash(PASSWORD)
+
+        _insert(User.__table__, [
+            {'email': f'bench{i}@example.com', 'username': f'bench{i}',
+             'full_name': f'Bench User {i}', 'phone': f'555{i:07d}',
+             'password_hash': password_hash, 'created_at': now - timedelta(days=rng.randint(0, 365))}
+            for i in range(users)
+        ])
+        emails = dict(db.session.execute(
+            select(User.id, User.email).where(User.email.like('bench%@example.com')).order_by(User.id)
+        ).all())
+        user_ids = list(emails)
+
+        _insert(EmergencyContact.__table__, [
+            {'user_id': user_id, 'name': f'Contact {n}', 'relationship': 'friend',
+             'phone': f'556{user_id:06d}{n}', 'email': f'contact{user_id}-{n}@example.com'}
+            for user_id in user_ids for n in range(contacts_per_user)
+        ])
+
+        post_rows = []
+        for _ in range(posts):
+            created_at = now - timedelta(seconds=rng.randint(0, 90 * 24 * 3600))
+            likes = int(rng.paretovariate(1.5)) - 1
+            comments = rng.randint(0, comments_per_post * 2)
+            post_rows.append({
+                'user_id': rng.choice(user_ids), 'title': _text(rng, 6).capitalize(),
+                'content': _text(rng, 60), 'category': rng.choice(CATEGORIES),
+                'likes': likes, 'comments_count': comments, 'created_at': created_at,
+                'hot_score': hot_score(likes, comments, created_at)
+            })
+        _insert(Post.__table__, post_rows)
+        post_ids = db.session.execute(select(Post.id).order_by(Post.id)).scalars().all()
+
+        _insert(Comment.__table__, [
+            {'post_id': post_id, 'user_id': rng.choice(user_ids), 'content': _text(rng, 15),
+             'created_at': row['created_at'] + timedelta(minutes=n + 1)}
+            for post_id, row in zip(post_ids[-posts:], post_rows)
+            for n in range(row['comments_count'])
+        ])
+
+        alert_rows = []
+        for n in range(alerts):
+            active = n >= alerts - active_alerts
+            alert_rows.append({
+                'user_id': rng.choice(user_ids), 'type': rng.choice(('emergency', 'medical', 'unsafe')),
+                'status': 'active' if active else rng.choice(('resolved', 'cancelled')),
+                'message': _text(rng, 8),
+                'latitude': CENTRE[0] + rng.uniform(-0.2, 0.2),
+                'longitude': CENTRE[1] + rng.uniform(-0.2, 0.2),
+                'created_at': now - timedelta(minutes=rng.randint(0, 5) if active
+                                              else rng.randint(10, 60 * 24 * 60))
+            })
+        alert_rows.sort(key=lambda row: row['created_at'])
+        _insert(Alert.__table__, alert_rows)
+        db.session.commit()
+
+        # Older closed alerts move to the monthly archive, as in production
+        archived = alert_archive.compact()
+
+        active = db.session.execute(
+            select(Alert.id, Alert.user_id).where(Alert.status == 'active')
+        ).all()
+        # Workload users, plus the owners of active alerts who send pings
+        sample = sorted(set(user_ids[:token_users]) | {user_id for _, user_id in active})
+        return {
+            'users': len(user_ids),
+            'posts': len(post_ids),
+            'alerts': len(alert_rows),
+            'archived': archived,
+            'token_users': user_ids[:token_users],
+            'tokens': {user_id: create_access_token(identity=str(user_id)) for user_id in sample},
+            'emails': {user_id: emails[user_id] for user_id in sample},
+            'password': PASSWORD,
+            'post_ids': post_ids,
+            'active_alerts': [(alert_id, user_id) for alert_id, user_id in active],
+            'centre': CENTRE,
+            'words': WORDS
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--db', required=True, help='sqlite file to create (must not exist yet)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--contacts-per-user', type=int, default=3)
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--comments-per-post', type=int, default=3)
+    parser.add_argument('--alerts', type=int, default=10000)
+    args = parser.parse_args()
+
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(args.db),
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ALERT_STREAM_ENABLED': False,
+        'ALERT_ARCHIVER_ENABLED': False
+    })
+    info = seed(app, users=args.users, contacts_per_user=args.contacts_per_user,
+                posts=args.posts, comments_per_post=args.comments_per_post, alerts=args.alerts)
+    print(f"Seeded {info['users']} users, {info['posts']} posts, {info['alerts']} alerts "
+          f"({info['archived']} archived) into {args.db}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+# Serialization cost of list responses: hydrated ORM objects + to_dict() +
+# stdlib json against column projections + Schema.dump_rows() + orjson.
+#
+#   cd api/flask_app
+#   python -m benchmarks.serialization --rows 200 --iterations 200
+#
+# path       builds one list of `--rows` posts (with authors) or contacts
+#            both ways outside any request and reports CPU time
+#            (process_time) and memory allocated per list (tracemalloc)
+# endpoints  times GET /api/community/posts and /api/users/emergency-contacts
+#            through the test client with JSON_PROVIDER=stdlib and =orjson
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from app import create_app, db
+from app.models.emergency_contact import EmergencyContact, contact_schema
+from app.models.post import Post
+from app.models.user import User
+from app.routes.community import author_dict, feed_posts, feed_query
+from benchmarks.seed import seed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def orm_posts(limit):
+    rows = (db.session.query(Post, User.full_name).join(User, User.id == Post.user_id)
+            .order_by(Post.created_at.desc(), Post.id.desc()).limit(limit))
+    return json.dumps([post.to_dict(author_dict(post.user_id, name)) for post, name in rows],
+                      sort_keys=True, separators=(',', ':'))
+
+
+def projected_posts(limit):
+    rows = feed_query().order_by(Post.created_at.desc(), Post.id.desc()).limit(limit).all()
+    return encode(feed_posts(rows))
+
+
+def orm_contacts(user_id):
+    contacts = EmergencyContact.query.filter_by(user_id=user_id).order_by(EmergencyContact.id)
+    return json.dumps([contact.to_dict() for contact in contacts],
+                      sort_keys=True, separators=(',', ':'))
+
+
+def projected_contacts(user_id):
+    rows = db.session.execute(contact_schema.select()
+                              .where(EmergencyContact.user_id == user_id)
+                              .order_by(EmergencyContact.id))
+    return encode(contact_schema.dump_rows(rows))
+
+
+def encode(data):
+    if orjson is None:
+        return json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+
+
+def measure(fn, arg, iterations):
+    # Fresh session per call, as in a request: nothing stays in the identity map
+    cpu = []
+    for _ in range(iterations):
+        started = time.process_time()
+        fn(arg)
+        cpu.append(time.process_time() - started)
+        db.session.remove()
+
+    tracemalloc.start()
+    allocated = []
+    for _ in range(min(iterations, 20)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(arg)
+        allocated.append(tracemalloc.get_traced_memory()[1] - before)
+        db.session.remove()
+    tracemalloc.stop()
+    return statistics.median(cpu) * 1000, statistics.median(allocated) / 1024
+
+
+def endpoint(database_uri, provider, path, headers, iterations):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ADMISSION_ENABLED': False,
+        'RESPONSE_CACHE_ENABLED': False,
+        'JSON_PROVIDER': provider
+    })
+    client = app.test_client()
+    client.get(path, headers=headers)
+    timings = []
+    for _ in range(iterations):
+        started = time.process_time()
+        response = client.get(path, headers=headers)
+        timings.append(time.process_time() - started)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200, help='posts / contacts per list')
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    database_uri = 'sqlite:///' + os.path.join(workdir, 'bench.sqlite')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'NOTIFICATION_WORKERS': 0,
+        'LOCATION_FLUSHER_ENABLED': False,
+        'ADMISSION_ENABLED': False
+    })
+    data = seed(app, users=200, contacts_per_user=args.rows, posts=max(args.rows, 1000),
+                comments_per_post=0, alerts=0, active_alerts=0, token_users=1)
+    user_id = data['token_users'][0]
+    token = data['tokens'][user_id]
+
+    with app.app_context():
+        if json.loads(orm_posts(args.rows)) != json.loads(projected_posts(args.rows)) \
+                or json.loads(orm_contacts(user_id)) != json.loads(projected_contacts(user_id)):
+            raise RuntimeError("projections don't match to_dict()")
+
+        print(f"path ({args.rows} rows, json encoder: {'orjson' if orjson else 'stdlib'})")
+        print(f"  {'':24} {'cpu ms':>8} {'alloc KiB':>10}")
+        for name, fn, arg in (('posts orm+to_dict', orm_posts, args.rows),
+                              ('posts projection', projected_posts, args.rows),
+                              ('contacts orm+to_dict', orm_contacts, user_id),
+                              ('contacts projection', projected_contacts, user_id)):
+            cpu, allocated = measure(fn, arg, args.iterations)
+            print(f"  {name:24} {cpu:8.2f} {allocated:10.1f}")
+
+    headers = {'Authorization': f'Bearer {token}'}
+    providers = ['stdlib'] + (['orjson'] if orjson else [])
+    print("endpoints (cpu ms per request)")
+    for path in (f'/api/community/posts?limit={min(args.rows, 50)}', '/api/users/emergency-contacts'):
+        timings = {provider: endpoint(database_uri, provider, path, headers, args.iterations)
+                   for provider in providers}
+        print(f"  {path:40} " + '  '.join(f"{name} {value:6.2f}" for name, value in timings.items()))
+
+
+if __name__ == '__main__':
+    main()
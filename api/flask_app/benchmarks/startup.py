@@ -0,0 +1,183 @@
+# Startup time: cold start, preforked worker respawn, and gunicorn boot.
+#
+#   cd api/flask_app
+#   python -m benchmarks.startup --runs 5 --save-baseline benchmarks/startup_baseline.json
+#   python -m benchmarks.startup --runs 5 --baseline benchmarks/startup_baseline.json
+#
+# cold      a fresh interpreter imports the app and runs create_app() (what a
+#           non-preloaded worker pays on every respawn); split into import
+#           and create_app time
+# respawn   with the app preloaded, fork a child, run the post-fork hooks,
+#           start background threads and serve one request (what a
+#           preloaded gunicorn worker pays)
+# gunicorn  `gunicorn -c gunicorn.conf.py` from exec to the first 200 from
+#           /api/health (skipped with --no-gunicorn)
+#
+# Median times in ms. --baseline exits 1 when a median grows by more than
+# --tolerance and --min-delta-ms.
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from app import create_app, db
+from app.services import migrations, workers
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COLD = """
+import json, time
+started = time.perf_counter()
+import wsgi
+imported = time.perf_counter()
+wsgi.production_app()
+built = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': built - imported}))
+"""
+
+
+def cold_start(env, runs):
+    totals, imports, builds = [], [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', COLD], cwd=HERE, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        totals.append(time.perf_counter() - started)
+        timings = json.loads(output.strip().splitlines()[-1])
+        imports.append(timings['import'])
+        builds.append(timings['create_app'])
+    return {'cold_total': totals, 'cold_import': imports, 'cold_create_app': builds}
+
+
+def respawn(database_uri, runs):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri}, defer_workers=True)
+    with app.app_context():
+        migrations.check(db.engine)
+    samples = []
+    for _ in range(runs):
+        read_end, write_end = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_end)
+                workers.after_fork(app)
+                workers.start_all(app)
+                response = app.test_client().get('/api/health')
+                os.write(write_end, str(response.status_code).encode())
+                workers.stop_all(app, timeout=1)
+                status = 0
+            finally:
+                os._exit(status)
+        os.close(write_end)
+        status_code = os.read(read_end, 16)
+        samples.append(time.perf_counter() - started)
+        os.close(read_end)
+        os.waitpid(pid, 0)
+        if status_code != b'200':
+            raise RuntimeError(f"respawned worker answered {status_code!r}")
+    return {'respawn': samples}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def gunicorn_boot(env, runs):
+    samples = []
+    for _ in range(runs):
+        port = _free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+            cwd=HERE, env=dict(env, SAFENEST_BIND=f'127.0.0.1:{port}'),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            deadline = started + 60
+            while True:
+                try:
+                    with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1) as r:
+                        if r.status == 200:
+                            break
+                except OSError:
+                    pass
+                if time.perf_counter() > deadline or process.poll() is not None:
+                    raise RuntimeError("gunicorn did not come up")
+                time.sleep(0.01)
+            samples.append(time.perf_counter() - started)
+        finally:
+            process.terminate()
+            process.wait(30)
+    return {'gunicorn': samples}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--no-gunicorn', action='store_true')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--save-baseline', help='write the results as the new baseline')
+    parser.add_argument('--baseline', help='compare against this baseline and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='safenest-bench-')
+    database_uri = 'sqlite:///' + os.path.join(workdir, 'startup.sqlite')
+    env = dict(os.environ, SAFENEST_SQLALCHEMY_DATABASE_URI=database_uri,
+               SAFENEST_NOTIFICATION_LOG_PATH=os.path.join(workdir, 'notifications.log'),
+               SAFENEST_WORKERS=str(args.workers))
+
+    # Boot never creates the schema, so migrate once up front
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_uri}, defer_workers=True)
+    with app.app_context():
+        migrations.upgrade(db.engine)
+
+    samples = {}
+    samples.update(cold_start(env, args.runs))
+    samples.update(respawn(database_uri, args.runs))
+    if not args.no_gunicorn:
+        samples.update(gunicorn_boot(env, args.runs))
+
+    result = {name: round(statistics.median(values) * 1000, 1) for name, values in samples.items()}
+    result['runs'] = args.runs
+    for name, value in result.items():
+        if name != 'runs':
+            print(f"  {name:16} {value:8.1f} ms")
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(result, f, indent=2, sort_keys=True)
+            print(f"Wrote {path}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        failures = []
+        for name, value in result.items():
+            before = baseline.get(name)
+            if name == 'runs' or before is None:
+                continue
+            if value > before * (1 + args.tolerance) and value - before > args.min_delta_ms:
+                failures.append(f"{name}: {before}ms -> {value}ms")
+        for failure in failures:
+            print("FAIL:", failure)
+        if failures:
+            sys.exit(1)
+        print("OK: no regressions")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+# The mixed workload driven by benchmarks.run.
+#
+# Each operation is (weight, route, build). `route` is the label results are
+# reported under, with ids templated out; `build(rng, data)` returns
+# (method, path, json_body, user_id) for one concrete request, where data is
+# what benchmarks.seed.seed() returned. The weights approximate a day of
+# mobile traffic: mostly feed and profile reads, steady location pings from
+# active alerts, and a thin stream of writes.
+import random
+from datetime import datetime, timedelta
+
+
+def _user(rng, data):
+    return rng.choice(data['token_users'])
+
+
+def _post(rng, data):
+    # Recent posts are read far more often than old ones
+    post_ids = data['post_ids']
+    return post_ids[-1 - min(int(rng.expovariate(1 / 200)), len(post_ids) - 1)]
+
+
+def feed(rng, data):
+    path = '/api/community/posts?limit=20'
+    if rng.random() < 0.3:
+        path += '&category=safety-tips'
+    return 'GET', path, None, _user(rng, data)
+
+
+def hot_feed(rng, data):
+    return 'GET', '/api/community/posts/hot?limit=20', None, _user(rng, data)
+
+
+def post_detail(rng, data):
+    return 'GET', f'/api/community/posts/{_post(rng, data)}', None, _user(rng, data)
+
+
+def search(rng, data):
+    words = ' '.join(rng.sample(data['words'], rng.choice((1, 2))))
+    return 'GET', f'/api/community/search?q={words.replace(" ", "+")}', None, _user(rng, data)
+
+
+def create_post(rng, data):
+    return 'POST', '/api/community/posts', {
+        'title': 'Benchmark post', 'content': ' '.join(rng.sample(data['words'], 12)),
+        'category': 'general'
+    }, _user(rng, data)
+
+
+def comment(rng, data):
+    return 'POST', f'/api/community/posts/{_post(rng, data)}/comments', {
+        'content': 'Benchmark comment'
+    }, _user(rng, data)
+
+
+def like(rng, data):
+    return rng.choice(('POST', 'DELETE')), f'/api/community/posts/{_post(rng, data)}/like', \
+        None, _user(rng, data)
+
+
+def me(rng, data):
+    return 'GET', '/api/auth/me', None, _user(rng, data)
+
+
+def login(rng, data):
+    user_id = _user(rng, data)
+    return 'POST', '/api/auth/login', {
+        'email': data['emails'][user_id], 'password': data['password']
+    }, None
+
+
+def profile(rng, data):
+    return 'GET', '/api/users/profile', None, _user(rng, data)
+
+
+def contacts(rng, data):
+    return 'GET', '/api/users/emergency-contacts', None, _user(rng, data)
+
+
+def sync_contacts(rng, data):
+    user_id = _user(rng, data)
+    return 'PUT', '/api/users/emergency-contacts', [
+        {'name': f'Contact {n}', 'relationship': 'friend', 'phone': f'557{user_id:06d}{n}'}
+        for n in range(rng.randint(1, 4))
+    ], user_id
+
+
+def sos(rng, data):
+    lat, lng = data['centre']
+    return 'POST', '/api/alerts/sos', {
+        'type': 'emergency', 'message': 'Benchmark SOS',
+        'location': {'lat': lat + rng.uniform(-0.1, 0.1), 'lng': lng + rng.uniform(-0.1, 0.1)}
+    }, _user(rng, data)
+
+
+def location_ping(rng, data):
+    alert_id, user_id = rng.choice(data['active_alerts'])
+    lat, lng = data['centre']
+    return 'POST', f'/api/alerts/{alert_id}/locations', {
+        'lat': lat + rng.uniform(-0.01, 0.01), 'lng': lng + rng.uniform(-0.01, 0.01),
+        'accuracy': 10
+    }, user_id
+
+
+def history(rng, data):
+    return 'GET', '/api/alerts/history?limit=20', None, _user(rng, data)
+
+
+def nearby(rng, data):
+    lat, lng = data['centre']
+    return 'GET', (f'/api/alerts/nearby?lat={lat + rng.uniform(-0.1, 0.1):.5f}'
+                   f'&lng={lng + rng.uniform(-0.1, 0.1):.5f}&radius=2000'), \
+        None, _user(rng, data)
+
+
+def classes(rng, data):
+    start = datetime.utcnow().date() + timedelta(days=rng.randint(0, 30))
+    return 'GET', f'/api/classes/?from={start.isoformat()}&to={(start + timedelta(days=7)).isoformat()}', \
+        None, _user(rng, data)
+
+
+def instructors(rng, data):
+    return 'GET', '/api/classes/instructors', None, _user(rng, data)
+
+
+OPERATIONS = [
+    (15, 'GET /api/community/posts', feed),
+    (5, 'GET /api/community/posts/hot', hot_feed),
+    (10, 'GET /api/community/posts/<id>', post_detail),
+    (5, 'GET /api/community/search', search),
+    (2, 'POST /api/community/posts', create_post),
+    (3, 'POST /api/community/posts/<id>/comments', comment),
+    (3, 'POST|DELETE /api/community/posts/<id>/like', like),
+    (8, 'GET /api/auth/me', me),
+    (1, 'POST /api/auth/login', login),
+    (8, 'GET /api/users/profile', profile),
+    (5, 'GET /api/users/emergency-contacts', contacts),
+    (2, 'PUT /api/users/emergency-contacts', sync_contacts),
+    (1, 'POST /api/alerts/sos', sos),
+    (8, 'POST /api/alerts/<id>/locations', location_ping),
+    (5, 'GET /api/alerts/history', history),
+    (5, 'GET /api/alerts/nearby', nearby),
+    (5, 'GET /api/classes/', classes),
+    (2, 'GET /api/classes/instructors', instructors),
+]
+
+
+class Workload:
+    def __init__(self, data, seed_value=0, only=None):
+        operations = [op for op in OPERATIONS if not only or any(part in op[1] for part in only)]
+        if not data['active_alerts']:
+            operations = [op for op in operations if op[2] is not location_ping]
+        self.data = data
+        self.rng = random.Random(seed_value)
+        self.routes = [route for _, route, _ in operations]
+        self.builders = [build for _, _, build in operations]
+        self.weights = [weight for weight, _, _ in operations]
+
+    def fork(self, seed_value):
+        # One independent stream per client thread
+        workload = Workload.__new__(Workload)
+        workload.__dict__.update(self.__dict__)
+        workload.rng = random.Random(seed_value)
+        return workload
+
+    def next(self):
+        index = self.rng.choices(range(len(self.builders)), weights=self.weights)[0]
+        method, path, body, user_id = self.builders[index](self.rng, self.data)
+        headers = {}
+        if user_id is not None:
+            headers['Authorization'] = f"Bearer {self.data['tokens'][user_id]}"
+        return self.routes[index], method, path, body, headers
@@ -0,0 +1,70 @@
+# gunicorn -c gunicorn.conf.py
+#
+# Every setting can be overridden on the command line or through
+# GUNICORN_CMD_ARGS, e.g. GUNICORN_CMD_ARGS="--workers 2 --threads 16".
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:production_app()'
+bind = os.environ.get('SAFENEST_BIND', '0.0.0.0:5000')
+
+# Import and build the app once, then fork: workers share the loaded code
+# and a respawned worker is serving within milliseconds
+preload_app = True
+
+# SQLite takes one writer at a time, so extra processes mostly add lock
+# contention and per-process caches; threads cover request concurrency.
+# Each worker also runs PASSWORD_HASH_WORKERS hashing processes.
+workers = int(os.environ.get('SAFENEST_WORKERS', min(multiprocessing.cpu_count(), 4)))
+worker_class = 'gthread'
+threads = int(os.environ.get('SAFENEST_THREADS', 64))
+
+# Alert streams don't belong here: under gthread each open stream holds a
+# thread for its whole life. Run the stream server alongside gunicorn,
+#   flask --app wsgi:production_app alerts serve-streams --port 5001
+# and have the reverse proxy send GET /api/alerts/<id>/stream to it; there an
+# idle stream is a coroutine and a socket (raise `ulimit -n` to match
+# ALERT_STREAM_SERVER_MAX_SUBSCRIBERS).
+#
+# Every thread is spoken for: ADMISSION_CONCURRENCY caps the throttled
+# blueprints, streamed exports and any alert streams that still reach
+# gunicorn hold a thread each for their whole life, and the rest stay free so
+# SOS and location pings never queue. Streams beyond the cap get a 503 and
+# retry. Change the thread count with SAFENEST_THREADS rather than --threads
+# so the cap follows.
+ADMISSION_THREADS = 20   # sum of ADMISSION_CONCURRENCY
+EXPORT_THREADS = 2       # EXPORT_MAX_CONCURRENT
+ALERTS_LANE_THREADS = 10
+os.environ.setdefault('SAFENEST_ALERT_STREAM_MAX_SUBSCRIBERS', str(max(
+    threads - ADMISSION_THREADS - EXPORT_THREADS - ALERTS_LANE_THREADS, 0
+)))
+
+timeout = 30
+graceful_timeout = 20
+keepalive = 5
+# Recycle workers now and then to bound slow leaks; jittered so they don't
+# all restart at once
+max_requests = 20000
+max_requests_jitter = 2000
+# Heartbeat files on tmpfs, not a possibly slow disk
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('SAFENEST_ACCESS_LOG')
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    from app.services import workers as background
+    background.after_fork(worker.app.wsgi())
+
+
+def post_worker_init(worker):
+    from app.services import workers as background
+    background.start_all(worker.wsgi)
+
+
+def worker_exit(server, worker):
+    from app.services import workers as background
+    app = getattr(worker, 'wsgi', None)
+    if app is not None:
+        background.stop_all(app)
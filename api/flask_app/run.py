@@ -1,11 +1,10 @@
-from app import create_app, db
-from flask import Flask
+from app import create_app
 
-app = create_app()
+# Development server. Create or upgrade the schema first with
+#   flask --app run db upgrade
+# For production use gunicorn with gunicorn.conf.py (see wsgi.py).
 
-# Replace the removed before_first_request
-with app.app_context():
-    db.create_all()
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
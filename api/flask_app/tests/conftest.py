@@ -0,0 +1,60 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+
+from app import create_app, db
+from app.models.user import User
+from app.services import migrations
+
+
+def make_app(path, **config):
+    # Another app on the same path stands in for a second worker process
+    app = create_app(dict({
+        'TESTING': True,
+        'JWT_SECRET_KEY': 'test-secret-key-of-at-least-32-bytes',
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(path / 'safenest.sqlite'),
+        'NOTIFICATION_LOG_PATH': str(path / 'notifications.log'),
+        'DEFER_BACKGROUND_WORKERS': True,
+        'PASSWORD_HASH_WORKERS': 0,
+        'ADMISSION_ENABLED': False
+    }, **config))
+    with app.app_context():
+        migrations.upgrade(db.engine)
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    return make_app(tmp_path)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def register(client, name, contacts=()):
+    # Through the API; returns the new user's bearer header
+    response = client.post('/api/auth/register', json={
+        'email': f'{name}@example.com', 'username': name, 'password': 'secret',
+        'full_name': name.title(), 'phone': '555-0100',
+        'meta': {'emergency_contacts': list(contacts)}
+    })
+    assert response.status_code == 201, response.get_json()
+    response = client.post('/api/auth/login', json={'email': f'{name}@example.com', 'password': 'secret'})
+    return {'Authorization': 'Bearer ' + response.get_json()['access_token']}
+
+
+def add_users(app, count, prefix='user'):
+    # Inserted directly, skipping password hashing; returns a bearer header
+    # per user in id order
+    with app.app_context():
+        first = db.session.query(db.func.coalesce(db.func.max(User.id), 0)).scalar() + 1
+        db.session.execute(insert(User.__table__), [
+            {'email': f'{prefix}{i}@example.com', 'username': f'{prefix}{i}',
+             'full_name': f'User {i}', 'phone': '0', 'password_hash': 'x'}
+            for i in range(count)
+        ])
+        db.session.commit()
+        return [{'Authorization': 'Bearer ' + create_access_token(identity=str(user_id))}
+                for user_id in range(first, first + count)]
@@ -0,0 +1,93 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func
+
+from app import db
+from app.models.classes import Class, Registration
+from conftest import add_users
+
+THREADS = 8
+
+
+def set_capacity(app, class_id, capacity, registered=0):
+    with app.app_context():
+        db.session.query(Class).filter_by(id=class_id).update(
+            {'capacity': capacity, 'registered': registered})
+        db.session.commit()
+
+
+def race(app, path, headers, method='post'):
+    # Every thread waits at the barrier with its own client, then they all
+    # send at once
+    barrier = threading.Barrier(THREADS)
+    local = threading.local()
+
+    def send(header):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            barrier.wait()
+        response = getattr(local.client, method)(path, headers=header)
+        return response.status_code, (response.get_json() or {}).get('status')
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        return list(pool.map(send, headers))
+
+
+def registrations(app, class_id):
+    with app.app_context():
+        return (db.session.query(Registration.user_id, Registration.status)
+                .filter_by(class_id=class_id)
+                .order_by(Registration.created_at, Registration.id)
+                .all())
+
+
+def test_racing_for_the_last_seats(app):
+    # 17 of 20 seats are taken: 40 users race for the last 3, each twice
+    set_capacity(app, 1, capacity=20, registered=17)
+    users = add_users(app, 40)
+
+    outcomes = race(app, '/api/classes/1/register', users * 2)
+
+    with app.app_context():
+        registered = db.session.get(Class, 1).registered
+        duplicates = (db.session.query(Registration.user_id)
+                      .filter_by(class_id=1)
+                      .group_by(Registration.user_id)
+                      .having(func.count() > 1).count())
+    statuses = [status for _, status in registrations(app, 1)]
+
+    assert registered == 20
+    assert statuses.count('confirmed') == 3
+    assert statuses.count('waitlisted') == 37
+    assert duplicates == 0
+    assert sorted(code for code, _ in outcomes) == [201] * 40 + [409] * 40
+
+
+def test_cancel_promotes_the_waitlist_in_order(app):
+    set_capacity(app, 1, capacity=4)
+    users = add_users(app, 24)
+    race(app, '/api/classes/1/register', users)
+
+    rows = registrations(app, 1)
+    confirmed = [user_id for user_id, status in rows if status == 'confirmed']
+    waitlist = [user_id for user_id, status in rows if status == 'waitlisted']
+    assert len(confirmed) == 4 and len(waitlist) == 20
+
+    # Cancel the confirmed users one at a time: each seat goes to whoever
+    # has waited longest
+    for position, user_id in enumerate(confirmed):
+        client = app.test_client()
+        assert client.delete('/api/classes/1/register', headers=users[user_id - 1]).status_code == 200
+        promoted = [user_id for user_id, status in registrations(app, 1) if status == 'confirmed']
+        assert promoted[-(position + 1):] == waitlist[:position + 1]
+
+    # Concurrent cancels of the new holders still promote in order and never
+    # leave more than capacity confirmed
+    race(app, '/api/classes/1/register', [users[user_id - 1] for user_id in waitlist[:4]] * 2,
+         method='delete')
+    rows = registrations(app, 1)
+    assert [user_id for user_id, status in rows if status == 'confirmed'] == waitlist[4:8]
+    assert [user_id for user_id, status in rows if status == 'waitlisted'] == waitlist[8:]
+    with app.app_context():
+        assert db.session.get(Class, 1).registered == 4
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models.post import Post
+from conftest import register
+
+
+def create_posts(client, headers, count, category='general'):
+    return [client.post('/api/community/posts', headers=headers, json={
+        'title': f'Post {i}', 'content': 'Stay safe', 'category': category
+    }).get_json()['id'] for i in range(count)]
+
+
+def walk(client, path):
+    pages, cursor = [], None
+    for _ in range(20):
+        query = f'{path}&cursor={cursor}' if cursor else path
+        body = client.get(query).get_json()
+        pages.append([post['id'] for post in body['posts']])
+        cursor = body['next_cursor']
+        assert body['has_more'] == (cursor is not None)
+        if cursor is None:
+            return pages
+
+
+def test_feed_pages_by_cursor(app, client):
+    headers = register(client, 'alice')
+    ids = create_posts(client, headers, 23)
+    # Same created_at for several posts: the id breaks the tie
+    with app.app_context():
+        earlier = datetime.utcnow() - timedelta(hours=1)
+        db.session.query(Post).filter(Post.id <= ids[10]).update({'created_at': earlier})
+        db.session.commit()
+
+    pages = walk(client, '/api/community/posts?limit=10')
+
+    assert [len(page) for page in pages] == [10, 10, 3]
+    assert sum(pages, []) == ids[11:][::-1] + ids[:11][::-1]
+
+
+def test_new_posts_do_not_shift_later_pages(client):
+    headers = register(client, 'alice')
+    ids = create_posts(client, headers, 15)
+
+    first = client.get('/api/community/posts?limit=10').get_json()
+    create_posts(client, headers, 5)
+    second = client.get('/api/community/posts?limit=10&cursor=' + first['next_cursor']).get_json()
+
+    assert [post['id'] for post in second['posts']] == ids[:5][::-1]
+    assert second['next_cursor'] is None
+
+
+def test_cursor_respects_category_and_rejects_garbage(client):
+    headers = register(client, 'alice')
+    tips = create_posts(client, headers, 4, category='tips')
+    create_posts(client, headers, 4, category='news')
+
+    assert sum(walk(client, '/api/community/posts?limit=3&category=tips'), []) == tips[::-1]
+    assert client.get('/api/community/posts?cursor=not-a-cursor').status_code == 400
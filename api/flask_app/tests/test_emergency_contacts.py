@@ -0,0 +1,78 @@
+from conftest import register
+
+MUM = {'name': 'Mum', 'relationship': 'mother', 'phone': '555-0101'}
+SAM = {'name': 'Sam', 'relationship': 'partner', 'phone': '555-0102'}
+
+
+def test_sync_replaces_the_list(client):
+    headers = register(client, 'alice', [MUM, SAM])
+    contacts = client.get('/api/users/emergency-contacts', headers=headers).get_json()
+
+    # Sam is renamed by id, Mum is left out, Kim is new
+    response = client.put('/api/users/emergency-contacts', headers=headers, json=[
+        dict(SAM, id=contacts[1]['id'], name='Samantha'),
+        {'name': 'Kim', 'relationship': 'friend', 'phone': '555-0103'}
+    ])
+
+    assert response.status_code == 200
+    assert [(c['name'], c['phone']) for c in response.get_json()] == [
+        ('Samantha', '555-0102'), ('Kim', '555-0103')
+    ]
+    assert response.get_json()[0]['id'] == contacts[1]['id']
+    assert client.get('/api/users/emergency-contacts', headers=headers).get_json() == response.get_json()
+
+
+def test_etag_revalidation_and_stale_writes(client):
+    headers = register(client, 'alice', [MUM])
+    listed = client.get('/api/users/emergency-contacts', headers=headers)
+    etag = listed.headers['ETag']
+
+    assert client.get('/api/users/emergency-contacts',
+                      headers=dict(headers, **{'If-None-Match': etag})).status_code == 304
+
+    synced = client.put('/api/users/emergency-contacts', json=[MUM, SAM],
+                        headers=dict(headers, **{'If-Match': etag}))
+    assert synced.status_code == 200
+    assert synced.headers['ETag'] != etag
+
+    # A second device still holding the old ETag must refetch first
+    stale = client.put('/api/users/emergency-contacts', json=[MUM],
+                       headers=dict(headers, **{'If-Match': etag}))
+    assert stale.status_code == 412
+    assert len(client.get('/api/users/emergency-contacts', headers=headers).get_json()) == 2
+
+
+def test_invalid_lists_change_nothing(client):
+    headers = register(client, 'alice', [MUM])
+    before = client.get('/api/users/emergency-contacts', headers=headers).get_json()
+
+    assert client.put('/api/users/emergency-contacts', headers=headers,
+                      json=[{'name': 'No phone', 'relationship': 'x'}]).status_code == 400
+    assert client.put('/api/users/emergency-contacts', headers=headers,
+                      json=[dict(SAM, id=12345)]).status_code == 400
+    assert client.get('/api/users/emergency-contacts', headers=headers).get_json() == before
+
+
+def test_unchanged_sync_is_not_modified(client):
+    headers = register(client, 'alice', [MUM, SAM])
+    listed = client.get('/api/users/emergency-contacts', headers=headers)
+    etag = listed.headers['ETag']
+    same = [{k: v for k, v in contact.items() if k != 'email'} for contact in listed.get_json()]
+
+    for precondition in ('If-Match', 'If-None-Match'):
+        response = client.put('/api/users/emergency-contacts', json=same,
+                              headers=dict(headers, **{precondition: etag}))
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert response.get_data() == b''
+
+    # Without an ETag the client doesn't have the ids yet, so it gets the list
+    response = client.put('/api/users/emergency-contacts', json=[MUM, SAM], headers=headers)
+    assert response.status_code == 200
+    assert response.get_json() == listed.get_json()
+
+    # A real change with If-None-Match still applies and returns the list
+    response = client.put('/api/users/emergency-contacts', json=[MUM],
+                          headers=dict(headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert len(response.get_json()) == 1
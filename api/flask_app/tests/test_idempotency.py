@@ -0,0 +1,62 @@
+from app import db
+from app.models.alert import Alert, NotificationOutbox
+from app.models.post import Post
+from conftest import make_app, register
+
+
+def count(app, model):
+    with app.app_context():
+        return db.session.query(model).count()
+
+
+def test_retry_replays_the_first_response(app, client):
+    headers = register(client, 'alice', [{'name': 'Mum', 'relationship': 'mother', 'phone': '555-0101'}])
+    retry = dict(headers, **{'Idempotency-Key': 'sos-1'})
+
+    first = client.post('/api/alerts/sos', headers=retry, json={'message': 'help'})
+    second = client.post('/api/alerts/sos', headers=retry, json={'message': 'help'})
+
+    assert first.status_code == second.status_code == 201
+    assert second.get_data() == first.get_data()
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    # One alert and one notification, however many retries
+    assert count(app, Alert) == 1
+    assert count(app, NotificationOutbox) == 1
+
+
+def test_replay_survives_a_restart(tmp_path):
+    worker_a = make_app(tmp_path).test_client()
+    headers = dict(register(worker_a, 'alice'), **{'Idempotency-Key': 'post-1'})
+    body = {'title': 'Hello', 'content': 'World'}
+    first = worker_a.post('/api/community/posts', headers=headers, json=body)
+
+    # A different process has nothing in its in-memory cache
+    restarted = make_app(tmp_path)
+    second = restarted.test_client().post('/api/community/posts', headers=headers, json=body)
+
+    assert second.status_code == 201
+    assert second.get_json() == first.get_json()
+    assert count(restarted, Post) == 1
+
+
+def test_key_reuse_with_another_body_is_rejected(app, client):
+    headers = dict(register(client, 'alice'), **{'Idempotency-Key': 'post-1'})
+
+    assert client.post('/api/community/posts', headers=headers,
+                       json={'title': 'Hello', 'content': 'World'}).status_code == 201
+    assert client.post('/api/community/posts', headers=headers,
+                       json={'title': 'Hello', 'content': 'Everyone'}).status_code == 422
+    assert count(app, Post) == 1
+
+
+def test_keys_are_scoped_to_the_user_and_failures_are_not_stored(app, client):
+    alice = dict(register(client, 'alice'), **{'Idempotency-Key': 'same'})
+    bob = dict(register(client, 'bob'), **{'Idempotency-Key': 'same'})
+
+    # A validation error is replayed as-is; a fixed body needs a new key
+    assert client.post('/api/community/posts', headers=alice, json={'title': 'x'}).status_code == 400
+    assert client.post('/api/community/posts', headers=alice, json={'title': 'x'}).status_code == 400
+    assert client.post('/api/community/posts', headers=bob,
+                       json={'title': 'x', 'content': 'y'}).status_code == 201
+    assert count(app, Post) == 1
@@ -0,0 +1,73 @@
+import json
+
+from app import db
+from app.models.alert import NotificationOutbox
+from conftest import make_app, register
+
+CONTACTS = [
+    {'name': 'Mum', 'relationship': 'mother', 'phone': '555-0101', 'email': 'mum@example.com'},
+    {'name': 'Sam', 'relationship': 'partner', 'phone': '555-0102'},
+    {'name': 'Kim', 'relationship': 'friend', 'phone': '555-0103'}
+]
+
+
+class FlakySender:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, notification):
+        if notification['recipient'] == '555-0102':
+            raise ConnectionError('gateway down')
+        self.sent.append(notification)
+
+
+def outbox(app):
+    with app.app_context():
+        return {row.recipient: (row.channel, row.status, row.attempts)
+                for row in db.session.query(NotificationOutbox)}
+
+
+def test_sos_fans_out_to_every_contact(app, client, tmp_path):
+    headers = register(client, 'alice', CONTACTS)
+
+    response = client.post('/api/alerts/sos', headers=headers,
+                           json={'message': 'help', 'location': {'lat': 51.5, 'lng': -0.12}})
+    assert response.status_code == 201
+    assert response.get_json()['contacts_notified'] == 3
+    # Queued with the alert, delivered later by the dispatcher
+    assert outbox(app) == {
+        'mum@example.com': ('email', 'pending', 0),
+        '555-0102': ('sms', 'pending', 0),
+        '555-0103': ('sms', 'pending', 0)
+    }
+
+    with app.app_context():
+        assert app.extensions['notifications'].run_once() == 3
+        assert app.extensions['notifications'].run_once() == 0
+
+    with open(tmp_path / 'notifications.log') as log:
+        delivered = [json.loads(line) for line in log]
+    assert sorted(n['recipient'] for n in delivered) == ['555-0102', '555-0103', 'mum@example.com']
+    assert {n['alert_id'] for n in delivered} == {response.get_json()['alert_id']}
+    assert delivered[0]['location'] == {'lat': 51.5, 'lng': -0.12}
+    assert {status for _, status, _ in outbox(app).values()} == {'sent'}
+
+
+def test_failed_sends_are_retried_until_max_attempts(tmp_path):
+    sender = FlakySender()
+    app = make_app(tmp_path, NOTIFICATION_SENDER=sender, NOTIFICATION_MAX_ATTEMPTS=2,
+                   NOTIFICATION_RETRY_BACKOFF=0)
+    client = app.test_client()
+    headers = register(client, 'alice', CONTACTS)
+    client.post('/api/alerts/sos', headers=headers, json={})
+
+    with app.app_context():
+        app.extensions['notifications'].run_once()
+    assert outbox(app)['555-0102'] == ('sms', 'pending', 1)
+    assert len(sender.sent) == 2
+
+    # Only the failed row is due again; the others are not resent
+    with app.app_context():
+        assert app.extensions['notifications'].run_once() == 1
+    assert outbox(app)['555-0102'] == ('sms', 'failed', 2)
+    assert len(sender.sent) == 2
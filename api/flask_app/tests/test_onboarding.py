@@ -0,0 +1,119 @@
+import json
+
+import pytest
+
+from app import db
+from app.models.emergency_contact import EmergencyContact
+from app.models.user import User
+from conftest import make_app, register
+
+KEY = {'X-Onboarding-Key': 'onboard'}
+
+
+@pytest.fixture
+def app(tmp_path):
+    return make_app(tmp_path, ONBOARDING_API_KEY='onboard', IMPORT_CHUNK_SIZE=3)
+
+
+def record(name, **fields):
+    return dict({'email': f'{name}@example.com', 'username': name, 'password': 'secret',
+                 'full_name': name.title(), 'phone': '555-0100'}, **fields)
+
+
+def test_batch_reports_conflicts_by_position(app, client):
+    register(client, 'alice')
+
+    response = client.post('/api/auth/register/batch', headers=KEY, json={'users': [
+        record('bob', meta={'emergency_contacts': [
+            {'name': 'Mum', 'relationship': 'mother', 'phone': '555-0101'}
+        ]}),
+        record('alice2', email='alice@example.com'),     # email taken by an existing user
+        record('alice', email='alice.new@example.com'),  # username taken
+        record('carol'),
+        record('bob2', email='bob@example.com'),         # repeats an earlier record
+        {'email': 'dave@example.com'},
+        'not an object'
+    ]})
+
+    assert response.status_code == 200
+    summary = response.get_json()
+    assert summary['processed'] == 7
+    assert summary['created'] == 2
+    assert sorted((f['index'], f['error']) for f in summary['failed']) == [
+        (1, 'Email already registered'),
+        (2, 'Username already taken'),
+        (4, 'Email already registered'),
+        (5, 'Missing fields: username, full_name, phone, password'),
+        (6, 'Expected a JSON object')
+    ]
+    with app.app_context():
+        assert sorted(u for (u,) in db.session.query(User.username)) == ['alice', 'bob', 'carol']
+        assert db.session.query(EmergencyContact).count() == 1
+
+
+def test_rerunning_a_batch_creates_nothing_twice(client):
+    users = [record(f'user{i}') for i in range(5)]
+    body = '\n'.join(json.dumps(user) for user in users)
+
+    first = client.post('/api/auth/register/batch', headers=KEY, data=body,
+                        content_type='application/x-ndjson').get_json()
+    second = client.post('/api/auth/register/batch', headers=KEY, data=body,
+                         content_type='application/x-ndjson').get_json()
+
+    assert (first['created'], first['failed']) == (5, [])
+    assert second['created'] == 0
+    assert {f['error'] for f in second['failed']} == {'Email already registered'}
+
+
+def test_batch_needs_the_key_and_a_bounded_body(app, client):
+    assert client.post('/api/auth/register/batch', json={'users': []}).status_code == 403
+    app.config['REGISTER_BATCH_MAX'] = 2
+    assert client.post('/api/auth/register/batch', headers=KEY,
+                       json={'users': [record(f'u{i}') for i in range(3)]}).status_code == 413
+
+
+def test_register_conflicts(client):
+    register(client, 'alice')
+
+    taken_email = client.post('/api/auth/register', json=record('alice2', email='alice@example.com'))
+    taken_username = client.post('/api/auth/register', json=record('alice', email='other@example.com'))
+
+    assert (taken_email.status_code, taken_email.get_json()['error']) == (409, 'Email already registered')
+    assert (taken_username.status_code, taken_username.get_json()['error']) == (409, 'Username already taken')
+
+
+def test_non_string_fields_are_rejected(client):
+    response = client.post('/api/auth/register', json=record('alice', password=123))
+    assert (response.status_code, response.get_json()['error']) == (400, 'Fields must be strings: password')
+    assert client.post('/api/auth/login', json={'email': 'alice@example.com', 'password': 123}).status_code == 400
+
+    summary = client.post('/api/auth/register/batch', headers=KEY, json={'users': [
+        record('bob', password=['secret']), record('carol', phone=5550100), record('dave')
+    ]}).get_json()
+    assert summary['created'] == 1
+    assert [(f['index'], f['error']) for f in summary['failed']] == [
+        (0, 'Fields must be strings: password'), (1, 'Fields must be strings: phone')
+    ]
+
+
+def test_lost_races_name_the_taken_field(app, client, monkeypatch):
+    # Both records pass the pre-check, then a concurrent signup takes bob's
+    # email and carol's username before the INSERT
+    from app.services import onboarding
+    hash_many = onboarding.passwords.hash_many
+
+    def signup_during_hashing(passwords):
+        hashes = hash_many(passwords)
+        register(app.test_client(), 'carol')
+        client.post('/api/auth/register', json=record('bobby', email='bob@example.com'))
+        return hashes
+
+    monkeypatch.setattr(onboarding.passwords, 'hash_many', signup_during_hashing)
+    summary = client.post('/api/auth/register/batch', headers=KEY, json={'users': [
+        record('bob'), record('carol', email='carol.b@example.com'), record('dave')
+    ]}).get_json()
+
+    assert summary['created'] == 1
+    assert [(f['index'], f['error']) for f in summary['failed']] == [
+        (0, 'Email already registered'), (1, 'Username already taken')
+    ]
@@ -0,0 +1,57 @@
+from conftest import make_app, register
+
+
+def test_cached_until_a_dependency_is_written(client):
+    headers = register(client, 'alice')
+
+    first = client.get('/api/community/posts')
+    assert first.headers['X-Cache'] == 'MISS'
+    again = client.get('/api/community/posts')
+    assert again.headers['X-Cache'] == 'HIT'
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert client.get('/api/community/posts',
+                      headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+    client.post('/api/community/posts', headers=headers, json={'title': 'New', 'content': 'Post'})
+
+    fresh = client.get('/api/community/posts', headers={'If-None-Match': first.headers['ETag']})
+    assert fresh.status_code == 200
+    assert fresh.headers['X-Cache'] == 'MISS'
+    assert [post['title'] for post in fresh.get_json()['posts']] == ['New']
+
+
+def test_query_strings_are_cached_separately(client):
+    headers = register(client, 'alice')
+    client.post('/api/community/posts', headers=headers,
+                json={'title': 'Tip', 'content': 'Post', 'category': 'tips'})
+
+    assert len(client.get('/api/community/posts?category=tips').get_json()['posts']) == 1
+    assert client.get('/api/community/posts?category=news').get_json()['posts'] == []
+    assert client.get('/api/community/posts?category=tips').headers['X-Cache'] == 'HIT'
+
+
+def test_rolled_back_writes_do_not_invalidate(app, client):
+    register(client, 'alice')
+    client.get('/api/classes/instructors')
+
+    # A registration for a class that doesn't exist rolls back
+    headers = register(client, 'bob')
+    assert client.post('/api/classes/999/register', headers=headers).status_code == 404
+
+    assert client.get('/api/classes/instructors').headers['X-Cache'] == 'HIT'
+
+
+def test_sqlite_backend_invalidates_across_workers(tmp_path):
+    config = {'RESPONSE_CACHE_BACKEND': 'sqlite', 'RESPONSE_CACHE_PATH': str(tmp_path / 'cache.sqlite')}
+    worker_a = make_app(tmp_path, **config).test_client()
+    worker_b = make_app(tmp_path, **config).test_client()
+    headers = register(worker_a, 'alice')
+
+    assert worker_b.get('/api/community/posts').headers['X-Cache'] == 'MISS'
+    assert worker_a.get('/api/community/posts').headers['X-Cache'] == 'HIT'
+
+    worker_a.post('/api/community/posts', headers=headers, json={'title': 'New', 'content': 'Post'})
+
+    response = worker_b.get('/api/community/posts')
+    assert response.headers['X-Cache'] == 'MISS'
+    assert len(response.get_json()['posts']) == 1
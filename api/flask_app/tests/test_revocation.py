@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models.revoked_token import RevokedToken
+from app.services import migrations
+from app.services.revocation import revocation
+from conftest import make_app, register
+
+
+def make_worker(database_uri, prune_interval=3600):
+    return create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': database_uri,
+        'DEFER_BACKGROUND_WORKERS': True,
+        'REVOCATION_POLL_INTERVAL': 0,
+        'REVOCATION_PRUNE_INTERVAL': prune_interval
+    })
+
+
+def revoke(app, jti, expires_at):
+    with app.test_request_context():
+        revocation.revoke({'jti': jti, 'sub': '1', 'exp': expires_at.timestamp()})
+
+
+def seen_revoked(app, jti):
+    with app.app_context():
+        return app.extensions['revocation'].is_revoked(jti)
+
+
+def test_revocation_after_prune_to_empty(tmp_path):
+    database_uri = 'sqlite:///' + str(tmp_path / 'revocation.sqlite')
+    # worker_a prunes on every poll
+    worker_a = make_worker(database_uri, prune_interval=0)
+    worker_b = make_worker(database_uri)
+    with worker_a.app_context():
+        migrations.upgrade(db.engine)
+
+    soon = datetime.utcnow() + timedelta(hours=1)
+    revoke(worker_a, 't1', soon)
+    revoke(worker_a, 't2', soon)
+    assert seen_revoked(worker_b, 't2')
+
+    # Both expire and are pruned, leaving the table empty
+    with worker_a.app_context():
+        db.session.query(RevokedToken).update({'expires_at': datetime.utcnow() - timedelta(minutes=1)})
+        db.session.commit()
+    assert not seen_revoked(worker_a, 't1')
+    with worker_a.app_context():
+        assert db.session.query(RevokedToken).count() == 0
+
+    revoke(worker_a, 't3', datetime.utcnow() + timedelta(hours=1))
+    assert seen_revoked(worker_b, 't3')
+
+
+def test_logout_revokes_the_token_in_every_worker(tmp_path):
+    worker_a = make_app(tmp_path)
+    worker_b = make_app(tmp_path, REVOCATION_POLL_INTERVAL=0)
+    headers = register(worker_a.test_client(), 'alice')
+    assert worker_b.test_client().get('/api/auth/me', headers=headers).status_code == 200
+
+    assert worker_a.test_client().post('/api/auth/logout', headers=headers).status_code == 200
+
+    assert worker_a.test_client().get('/api/auth/me', headers=headers).status_code == 401
+    assert worker_b.test_client().get('/api/auth/me', headers=headers).status_code == 401
@@ -0,0 +1,20 @@
+from app import create_app, db
+from app.services import migrations
+
+# Production entry point, loaded by gunicorn (see gunicorn.conf.py):
+#
+#   flask --app wsgi:production_app db upgrade
+#   gunicorn -c gunicorn.conf.py
+#   flask --app wsgi:production_app alerts serve-streams --port 5001
+#
+# The app is built once in the master before workers fork, so workers share
+# its imported code and only start their own background threads.
+
+
+def production_app():
+    app = create_app(defer_workers=True)
+    # Fail in the master, before any worker forks, rather than on the first
+    # request to touch a missing table
+    with app.app_context():
+        migrations.check(db.engine)
+    return app
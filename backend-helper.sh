@@ -48,6 +48,10 @@ start_backend() {
   echo -e "${YELLOW}Installing required packages...${NC}"
   pip install -r requirements.txt
   
+  # Create or upgrade the database schema
+  echo -e "${YELLOW}Applying database migrations...${NC}"
+  flask --app run db upgrade
+  
   # Run the Flask app in the background
   echo -e "${YELLOW}Starting Flask server...${NC}"
   nohup python run.py > flask.log 2>&1 &
@@ -115,6 +119,17 @@ stop_backend() {
   fi
 }
 
+# Run the benchmark suite; extra arguments go to benchmarks.run
+run_benchmark() {
+  cd "$HOME/Downloads/care-alert/api/flask_app" || {
+    echo -e "${RED}Error: Could not find Flask app directory${NC}"
+    exit 1
+  }
+  
+  echo -e "${YELLOW}Running benchmarks...${NC}"
+  python -m benchmarks.run "$@"
+}
+
 # Display help
 show_help() {
   echo -e "${BLUE}Usage:${NC}"
@@ -123,6 +138,7 @@ show_help() {
   echo -e "  $0 ${GREEN}stop${NC}       - Stop the Flask backend"
   echo -e "  $0 ${GREEN}test${NC}       - Test community endpoints"
   echo -e "  $0 ${GREEN}create-post${NC} [AUTH_TOKEN] - Create a test post"
+  echo -e "  $0 ${GREEN}bench${NC} [ARGS] - Run the benchmark suite (see python -m benchmarks.run --help)"
   echo -e "  $0 ${GREEN}help${NC}       - Show this help message"
 }
 
@@ -147,6 +163,10 @@ case "$1" in
   create-post)
     create_test_post "$2"
     ;;
+  bench)
+    shift
+    run_benchmark "$@"
+    ;;
   help|--help|-h)
     show_help
     ;;